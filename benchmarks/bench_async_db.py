@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки обработчиков при конкурентных обновлениях:
+синхронная сессия внутри корутины против AsyncSession/aiosqlite.
+
+Одновременно запускаются «тяжелые» запросы (история за год для пользователя
+с большим числом транзакций) и «легкие» (поиск пользователя по telegram_id).
+Для легких запросов измеряется задержка: в синхронном варианте они ждут,
+пока тяжелый запрос освободит цикл событий.
+
+Запуск: python benchmarks/bench_async_db.py [--rows 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from src.models import Base, Transaction, TransactionType, User
+
+# Интервал между поступлениями легких обновлений, секунды
+ARRIVAL_INTERVAL = 0.01
+
+
+def seed(url: str, rows: int, users: int):
+    """Создает схему и заполняет её тестовыми данными"""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    with Session(engine) as db:
+        db.execute(insert(User), [{"telegram_id": 1000 + i} for i in range(users)])
+        batch = []
+        for i in range(rows):
+            batch.append(
+                {
+                    "user_id": 1,
+                    "amount": float(i % 1000),
+                    "description": f"покупка {i}",
+                    "type": TransactionType.EXPENSE,
+                    "category_id": None,
+                    "created_at": now - timedelta(minutes=i),
+                }
+            )
+            if len(batch) == 10000:
+                db.execute(insert(Transaction), batch)
+                batch = []
+        if batch:
+            db.execute(insert(Transaction), batch)
+        db.commit()
+    engine.dispose()
+
+
+def history_stmt():
+    return select(Transaction).where(
+        Transaction.user_id == 1,
+        Transaction.created_at >= datetime.now() - timedelta(days=365),
+    )
+
+
+def user_stmt(telegram_id: int):
+    return select(User).where(User.telegram_id == telegram_id)
+
+
+async def run_sync(url: str, heavy: int, light: int):
+    """Старый путь: блокирующая сессия прямо в корутине"""
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    async def heavy_handler():
+        with Session(engine) as db:
+            db.scalars(history_stmt()).all()
+
+    async def light_handler(i, arrived):
+        await asyncio.sleep(arrived - time.perf_counter())
+        with Session(engine) as db:
+            db.scalar(user_stmt(1000 + i))
+        return time.perf_counter() - arrived
+
+    latencies = await run_mix(heavy_handler, light_handler, heavy, light)
+    engine.dispose()
+    return latencies
+
+
+async def run_async(url: str, heavy: int, light: int):
+    """Новый путь: AsyncSession поверх aiosqlite"""
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def heavy_handler():
+        async with session_factory() as db:
+            (await db.scalars(history_stmt())).all()
+
+    async def light_handler(i, arrived):
+        await asyncio.sleep(arrived - time.perf_counter())
+        async with session_factory() as db:
+            await db.scalar(user_stmt(1000 + i))
+        return time.perf_counter() - arrived
+
+    latencies = await run_mix(heavy_handler, light_handler, heavy, light)
+    await engine.dispose()
+    return latencies
+
+
+async def run_mix(heavy_handler, light_handler, heavy: int, light: int):
+    """
+    Запускает тяжелые обработчики сразу, а легкие — с равным интервалом.
+    Задержка легкого обработчика считается от момента его «поступления»,
+    поэтому учитывает время, пока цикл событий был занят чужим запросом
+    """
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(heavy_handler()) for _ in range(heavy)]
+    for i in range(light):
+        arrived = started + i * ARRIVAL_INTERVAL
+        tasks.append(asyncio.create_task(light_handler(i, arrived)))
+    results = await asyncio.gather(*tasks)
+    return [r for r in results if r is not None]
+
+
+def report(name: str, latencies: list, elapsed: float):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<6} | median {statistics.median(latencies) * 1000:8.1f} ms"
+        f" | p95 {p95 * 1000:8.1f} ms | max {latencies[-1] * 1000:8.1f} ms"
+        f" | total {elapsed:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--heavy", type=int, default=4)
+    parser.add_argument("--light", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        seed(url, args.rows, args.light)
+        print(
+            f"Транзакций: {args.rows}, тяжелых запросов: {args.heavy}, "
+            f"легких запросов: {args.light}"
+        )
+        for name, runner in (("sync", run_sync), ("async", run_async)):
+            started = time.perf_counter()
+            latencies = asyncio.run(runner(url, args.heavy, args.light))
+            report(name, latencies, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк /export: прежняя выгрузка против потоковой (src/export.py).
+
+"Прежняя": все операции одним .all(), обычная книга openpyxl, свои Font и
+Border на каждую ячейку и второй проход по всем ячейкам для ширины колонок,
+книга сохраняется в BytesIO. "Поток": src.export.export_transactions как в
+боте — порции yield_per, книга write_only с именованными стилями, запись во
+временный файл.
+
+Каждый замер идет в отдельном процессе, пиковая память — максимальный RSS
+процесса (ru_maxrss); для сравнения выводится и RSS после импортов.
+Отображение файла БД в память (SQLITE_MMAP_SIZE) в замерах выключено:
+страницы файла иначе тоже попадают в RSS. БД заполняется тоже в отдельном
+процессе: Linux сохраняет ru_maxrss через execve, и пик родителя попал бы в
+замер. Прежняя выгрузка на больших объемах требует гигабайты памяти,
+поэтому выше --legacy-limit строк она пропускается.
+
+Запуск: python benchmarks/bench_export.py [--rows 10000 100000 1000000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+DESCRIPTIONS = ["Пятерочка", "Такси до работы", "Аптека", "Кафе", "Зарплата"]
+INSERT_BATCH = 50000
+
+
+def _rss_mb() -> float:
+    # ru_maxrss в КБ на Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(url: str, rows: int):
+    from sqlalchemy import create_engine, insert
+
+    from src.messages import CATEGORY_DEFAULT
+    from src.models import Base, Category, Transaction, TransactionType, User
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    start = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": 1}])
+        conn.execute(
+            insert(Category), [{"name": CATEGORY_DEFAULT}, {"name": "Продукты"}]
+        )
+        for offset in range(0, rows, INSERT_BATCH):
+            conn.execute(
+                insert(Transaction),
+                [
+                    {
+                        "user_id": 1,
+                        "amount": i % 5000 + 0.5,
+                        "description": f"{DESCRIPTIONS[i % len(DESCRIPTIONS)]} {i}",
+                        "type": (
+                            TransactionType.INCOME
+                            if i % 10 == 0
+                            else TransactionType.EXPENSE
+                        ),
+                        "category_id": i % 2 + 1,
+                        "created_at": start + timedelta(minutes=3 * i),
+                    }
+                    for i in range(offset, min(offset + INSERT_BATCH, rows))
+                ],
+            )
+    engine.dispose()
+
+
+async def legacy_export(db, user_id: int) -> int:
+    """Выгрузка в том виде, в каком она была в FinanceBot.export"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+    from sqlalchemy import select
+
+    from src.categories import category_registry
+    from src.messages import (
+        CATEGORY_DEFAULT,
+        EXPORT_HEADERS,
+        EXPORT_TRANSACTION_TYPE_EXPENSE,
+        EXPORT_TRANSACTION_TYPE_INCOME,
+    )
+    from src.models import TRANSACTION_ROW, Transaction, TransactionType
+
+    transactions = (
+        await db.execute(
+            select(*TRANSACTION_ROW)
+            .where(Transaction.user_id == user_id)
+            .order_by(Transaction.created_at.desc())
+        )
+    ).all()
+    await category_registry.ensure_loaded()
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Транзакции"
+    header_font = Font(bold=True)
+    header_fill = PatternFill(
+        start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"
+    )
+    border = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        top=Side(style="thin"),
+        bottom=Side(style="thin"),
+    )
+    for col, header in enumerate(EXPORT_HEADERS, 1):
+        cell = ws.cell(row=1, column=col)
+        cell.value = header
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = border
+        cell.alignment = Alignment(horizontal="center")
+
+    for row, t in enumerate(transactions, 2):
+        ws.cell(row=row, column=1, value=t.created_at.strftime("%d.%m.%Y %H:%M"))
+        transaction_type = (
+            EXPORT_TRANSACTION_TYPE_EXPENSE
+            if t.type == TransactionType.EXPENSE
+            else EXPORT_TRANSACTION_TYPE_INCOME
+        )
+        ws.cell(row=row, column=2, value=transaction_type)
+        amount_cell = ws.cell(row=row, column=3, value=t.amount)
+        if t.type == TransactionType.EXPENSE:
+            amount_cell.font = Font(color="FF0000")
+        else:
+            amount_cell.font = Font(color="008000")
+        ws.cell(row=row, column=4, value=t.description)
+        ws.cell(
+            row=row,
+            column=5,
+            value=category_registry.get_name(t.category_id) or CATEGORY_DEFAULT,
+        )
+        for col in range(1, 6):
+            ws.cell(row=row, column=col).border = border
+
+    for col in ws.columns:
+        max_length = 0
+        column = col[0].column_letter
+        for cell in col:
+            if len(str(cell.value)) > max_length:
+                max_length = len(str(cell.value))
+        ws.column_dimensions[column].width = max_length + 2
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    return len(transactions)
+
+
+async def measure(variant: str, output: Path) -> dict:
+    from src import export
+    from src.categories import category_registry
+    from src.database import AsyncSessionLocal
+
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    if variant != "legacy":
+        await category_registry.ensure_loaded()
+    async with AsyncSessionLocal() as db:
+        if variant == "legacy":
+            rows = await legacy_export(db, 1)
+        else:
+            categories = dict(category_registry.all())
+            rows = await export.export_transactions(db, 1, output, categories)
+    return {
+        "rows": rows,
+        "seconds": time.perf_counter() - started,
+        "baseline": baseline,
+        "peak": _rss_mb(),
+    }
+
+
+def run_worker(tmp: str, *args: str) -> str:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp}/bench.db",
+        ARCHIVE_DIR=os.path.join(tmp, "archive"),
+        SQLITE_MMAP_SIZE="0",
+    )
+    return subprocess.run(
+        [sys.executable, __file__, "--output", tmp, *args],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--legacy-limit", type=int, default=100000)
+    parser.add_argument("--worker", choices=("legacy", "stream"))
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(os.environ["DATABASE_URL"], args.seed)
+        return
+    if args.worker:
+        path = Path(args.output) / f"{args.worker}.xlsx"
+        print(json.dumps(asyncio.run(measure(args.worker, path))))
+        return
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_worker(tmp, "--seed", str(rows))
+            print(f"{rows} строк")
+            for variant, name in (("legacy", "прежняя"), ("stream", "поток")):
+                if variant == "legacy" and rows > args.legacy_limit:
+                    print(f"  {name:<8} | пропущена (--legacy-limit)")
+                    continue
+                output = run_worker(tmp, "--worker", variant)
+                result = json.loads(output.splitlines()[-1])
+                print(
+                    f"  {name:<8} | {result['seconds']:7.2f} s"
+                    f" | {result['rows'] / result['seconds']:7.0f} строк/с"
+                    f" | пик RSS {result['peak']:7.1f} МБ"
+                    f" (после импортов {result['baseline']:.1f} МБ)"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк отзывчивости бота во время /export: книга заполняется прямо в
+цикле событий (как раньше) против потоков пула src/export.py.
+
+Несколько пользователей одновременно выгружают по --rows операций, а
+соседняя задача каждые 10 мс "отвечает" другому пользователю и замеряет,
+насколько цикл событий опоздал с её пробуждением. Выгрузка в цикле
+событий эмулируется исполнителем, который выполняет задачу сразу на месте.
+Одновременно идет не больше EXPORT_WORKERS выгрузок, остальные ждут очереди.
+
+Запуск: python benchmarks/bench_export_pool.py [--rows 20000] [--users 1 2 4]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import Executor, Future
+from datetime import datetime, timedelta
+
+TICK = 0.01
+
+
+class InlineExecutor(Executor):
+    """Выполняет задачу в вызывающем потоке — то есть в цикле событий"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def seed(url: str, users: int, rows: int):
+    from sqlalchemy import create_engine, insert
+
+    from src.messages import CATEGORY_DEFAULT
+    from src.models import Base, Category, Transaction, TransactionType, User
+
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    start = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": i} for i in range(users)])
+        conn.execute(insert(Category), [{"name": CATEGORY_DEFAULT}])
+        for user_id in range(1, users + 1):
+            conn.execute(
+                insert(Transaction),
+                [
+                    {
+                        "user_id": user_id,
+                        "amount": i % 5000 + 0.5,
+                        "description": f"операция {i}",
+                        "type": TransactionType.EXPENSE,
+                        "category_id": 1,
+                        "created_at": start + timedelta(minutes=3 * i),
+                    }
+                    for i in range(rows)
+                ],
+            )
+    engine.dispose()
+
+
+async def run(users: int, inline: bool):
+    from src import export
+    from src.categories import category_registry
+    from src.database import ExportSessionLocal
+
+    if inline:
+        export.executor = InlineExecutor()
+    pool = export.ExportPool()
+
+    async def write_for(user_id):
+        async def write(path):
+            await category_registry.ensure_loaded()
+            categories = dict(category_registry.all())
+            async with ExportSessionLocal() as db:
+                return await export.export_transactions(db, user_id, path, categories)
+
+        async with pool.export(user_id, write) as (count, path):
+            return count
+
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            lags.append(loop.time() - expected)
+
+    ticks = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(write_for(user_id) for user_id in range(1, users + 1)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticks
+    lags.sort()
+    return elapsed, lags[int(len(lags) * 0.99)], lags[-1], statistics.median(lags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+        os.environ["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        seed(os.environ["DATABASE_URL"], max(args.users), args.rows)
+        print(f"{args.rows} операций на пользователя")
+
+        from src import export
+
+        pool_executor = export.executor
+        for users in args.users:
+            print(f"{users} одновременных выгрузок")
+            for name, inline in (("в цикле", True), ("в пуле", False)):
+                export.executor = pool_executor
+                elapsed, p99, worst, median = asyncio.run(run(users, inline))
+                print(
+                    f"  {name:<8} | {elapsed:6.2f} s | задержка ответа:"
+                    f" медиана {median * 1000:6.1f} мс, p99 {p99 * 1000:7.1f} мс,"
+                    f" макс {worst * 1000:7.1f} мс"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Определение категории по описанию: прежний перебор ключевых слов
+(lower() и поиск подстроки для каждого слова каждой категории), автомат
+Ахо–Корасик по буквам и автомат по основам слов (src/stemmer.py), которым
+пользуется бот.
+
+Корпус описаний генерируется из ключевых слов бота и обычных слов; часть
+описаний не содержит ни одного ключевого слова — это худший случай для
+перебора. Перед замером проверяется, что перебор и автомат по буквам дают
+одинаковые категории. Отдельно считается полнота на описаниях с другими
+формами ключевых слов: поиск подстроки их пропускает, основы — нет.
+
+Запуск: python benchmarks/bench_keyword_matcher.py [--descriptions 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.categorization import (
+    CATEGORY_KEYWORDS,
+    KEYWORD_PRIORITIES,
+    CategorizationEngine,
+)
+from src.keyword_matcher import KeywordMatcher
+from src.messages import CATEGORY_DEFAULT
+
+WORDS = (
+    "за на до с для в и по новый старый маме папе другу работа дом утром "
+    "вечером вкусный большой маленький оплата покупка сервис заказ доставка"
+).split()
+
+# Формы слов, которые таблица перечисляла отдельно до перехода на основы
+LEGACY_EXTRA = {"Транспорт": ["до мытищ"], "Связь": ["симку"]}
+
+# Описания с другими формами ключевых слов и ожидаемые категории
+INFLECTED = [
+    ("купил книгу", "Образование"),
+    ("курс английского", "Образование"),
+    ("лекарство от кашля", "Здоровье"),
+    ("за коммуналку", "Жилье"),
+    ("новая симка", "Связь"),
+    ("пополнил симки", "Связь"),
+    ("на электричку", "Транспорт"),
+    ("в маршрутке", "Транспорт"),
+    ("из Мытищ", "Транспорт"),
+    ("набор подарков", "Подарки"),
+    ("чехол для телефона", "Техника"),
+    ("платье на выпускной", "Одежда"),
+    ("с друзьями в ресторане", "Развлечения"),
+    ("торт к празднику", "Подарки"),
+    ("анализ крови", "Здоровье"),
+    ("семинары по финансам", "Образование"),
+]
+
+
+def legacy_category(category_keywords, description):
+    """determine_category до автомата"""
+    if "8 марта" in description.lower():
+        return "Подарки"
+    for category, keywords in category_keywords.items():
+        if any(keyword.lower() in description.lower() for keyword in keywords):
+            return category
+    return CATEGORY_DEFAULT
+
+
+def corpus(keywords, size, seed=1):
+    random_ = random.Random(seed)
+    descriptions = []
+    for _ in range(size):
+        words = random_.choices(WORDS, k=random_.randint(1, 6))
+        if random_.random() < 0.7:
+            words.insert(random_.randint(0, len(words)), random_.choice(keywords))
+        descriptions.append(" ".join(words).capitalize())
+    return descriptions
+
+
+def measure(name, function, descriptions):
+    started = time.perf_counter()
+    for description in descriptions:
+        function(description)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<16} {elapsed:7.3f} с   "
+        f"{elapsed / len(descriptions) * 1e6:6.2f} мкс на описание"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--descriptions", type=int, default=200_000)
+    args = parser.parse_args()
+
+    legacy_table = {
+        category: keywords + LEGACY_EXTRA.get(category, [])
+        for category, keywords in CATEGORY_KEYWORDS.items()
+    }
+    chars = KeywordMatcher.from_table(legacy_table, KEYWORD_PRIORITIES)
+    stems = CategorizationEngine(CATEGORY_KEYWORDS, KEYWORD_PRIORITIES).matcher
+    keywords = [k for words in legacy_table.values() for k in words]
+    descriptions = corpus(keywords, args.descriptions)
+
+    def legacy(description):
+        return legacy_category(legacy_table, description)
+
+    def by_chars(description):
+        return chars.best(description) or CATEGORY_DEFAULT
+
+    def by_stems(description):
+        return stems.best(description) or CATEGORY_DEFAULT
+
+    mismatches = [d for d in descriptions if legacy(d) != by_chars(d)]
+    assert not mismatches, mismatches[:5]
+    agreement = sum(legacy(d) == by_stems(d) for d in descriptions)
+
+    print(
+        f"{len(descriptions)} описаний, {len(keywords)} ключевых слов "
+        f"(по основам — {sum(map(len, CATEGORY_KEYWORDS.values()))}), "
+        f"{len(stems.categories)} категорий"
+    )
+    before = measure("перебор", legacy, descriptions)
+    after = measure("по буквам", by_chars, descriptions)
+    stemmed = measure("по основам", by_stems, descriptions)
+    print(
+        f"Ускорение: по буквам {before / after:.1f}x, по основам {before / stemmed:.1f}x"
+    )
+    print(f"Совпадение категорий перебора и основ: {agreement / len(descriptions):.1%}")
+
+    for name, function in (("перебор", legacy), ("по основам", by_stems)):
+        found = sum(function(d) == expected for d, expected in INFLECTED)
+        print(f"Полнота на формах слов, {name}: {found}/{len(INFLECTED)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Удаление колонок из большой таблицы users при работающем боте: прежняя
+перестройка одной транзакцией (batch-режим Alembic) против онлайн-миграции
+порциями (src/online_migration.py).
+
+Таблица генерируется в файле SQLite (по умолчанию 2 млн строк). Пока идет
+миграция, отдельный поток каждые 5 мс добавляет пользователя, как это
+делал бы бот, и замеряет задержку каждой записи. Главное — максимальная
+задержка: при перестройке одной транзакцией запись ждет всю миграцию
+(или падает с "database is locked" по busy_timeout).
+
+Запуск: python benchmarks/bench_online_migration.py [--rows 2000000] [--batch-size 10000]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import create_engine
+
+from src.database import configure_sqlite
+from src.models import User
+from src.online_migration import OnlineTableRebuild
+
+LEGACY_COLUMNS = ("username", "first_name", "last_name")
+WRITE_INTERVAL = 0.005
+BUSY_TIMEOUT_MS = 5000
+
+
+def generate(path: str, rows: int):
+    """Таблица users старого формата с rows строками"""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, "
+        "telegram_id BIGINT NOT NULL UNIQUE, created_at DATETIME, "
+        "username VARCHAR, first_name VARCHAR, last_name VARCHAR)"
+    )
+    connection.executemany(
+        "INSERT INTO users (telegram_id, created_at, username, first_name, last_name) "
+        "VALUES (?, '2024-01-01 00:00:00', ?, 'Имя', 'Фамилия')",
+        ((10**9 + i, f"user{i}") for i in range(rows)),
+    )
+    connection.commit()
+    connection.close()
+
+
+class Writer(threading.Thread):
+    """Добавляет пользователя каждые WRITE_INTERVAL секунд и копит задержки"""
+
+    def __init__(self, path: str):
+        super().__init__(daemon=True)
+        self.path = path
+        self.latencies = []
+        self.errors = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000)
+        telegram_id = 1
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            try:
+                connection.execute(
+                    "INSERT INTO users (telegram_id) VALUES (?)", (telegram_id,)
+                )
+                connection.commit()
+            except sqlite3.OperationalError:
+                self.errors += 1
+                connection.rollback()
+            self.latencies.append(time.perf_counter() - started)
+            telegram_id += 1
+            time.sleep(WRITE_INTERVAL)
+        connection.close()
+
+
+def single_transaction(engine, batch_size):
+    with engine.begin() as connection:
+        operations = Operations(MigrationContext.configure(connection))
+        with operations.batch_alter_table("users") as batch:
+            for column in LEGACY_COLUMNS:
+                batch.drop_column(column)
+
+
+def online(engine, batch_size):
+    OnlineTableRebuild(engine, "bench", User.__table__, batch_size).run()
+
+
+def measure(name, migrate, path, batch_size):
+    engine = create_engine(f"sqlite:///{path}")
+    configure_sqlite(engine, {"journal_mode": "WAL", "busy_timeout": BUSY_TIMEOUT_MS})
+    writer = Writer(path)
+    writer.start()
+    time.sleep(0.2)
+
+    started = time.perf_counter()
+    migrate(engine, batch_size)
+    elapsed = time.perf_counter() - started
+
+    time.sleep(0.2)
+    writer.stopped.set()
+    writer.join()
+    engine.dispose()
+
+    latencies = sorted(writer.latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    print(
+        f"{name:<22} миграция {elapsed:7.2f} с   записей {len(latencies):6d}   "
+        f"медиана {statistics.median(latencies) * 1000:7.2f} мс   "
+        f"p99 {p99 * 1000:8.2f} мс   макс {latencies[-1] * 1000:8.2f} мс   "
+        f"ошибок {writer.errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "source.db")
+        started = time.perf_counter()
+        generate(source, args.rows)
+        print(
+            f"Сгенерировано {args.rows} строк за {time.perf_counter() - started:.1f} с"
+        )
+
+        for name, migrate in (
+            ("одна транзакция", single_transaction),
+            ("онлайн порциями", online),
+        ):
+            path = os.path.join(directory, f"{migrate.__name__}.db")
+            shutil.copy(source, path)
+            measure(name, migrate, path, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк смешанной нагрузки на SQLite: журнал отката по умолчанию против
+WAL и PRAGMA из src/database.py (SQLITE_PRAGMAS).
+
+Читатели постоянно считают итоги за год по пользователю с большим числом
+транзакций (долгое чтение по всей истории), писатели в это же время добавляют операции с
+commit на каждую. За фиксированное время считаются выполненные чтения,
+записи и ошибки "database is locked". Все работает в одном процессе,
+поэтому чтения и записи делят между собой цикл событий и GIL: главное
+число — общая пропускная способность.
+
+Запуск: python benchmarks/bench_sqlite_pragmas.py [--rows 100000] [--seconds 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database import SQLITE_PRAGMAS, configure_sqlite
+from src.models import Base, Transaction, TransactionType, User
+
+
+def seed(url: str, rows: int):
+    """Создает схему и транзакции первого пользователя"""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": 1}, {"telegram_id": 2}])
+        for start in range(0, rows, 10000):
+            conn.execute(
+                insert(Transaction),
+                [
+                    {
+                        "user_id": 1,
+                        "amount": float(i % 1000),
+                        "description": f"покупка {i}",
+                        "type": TransactionType.EXPENSE,
+                        "created_at": now - timedelta(minutes=i),
+                    }
+                    for i in range(start, min(start + 10000, rows))
+                ],
+            )
+    engine.dispose()
+
+
+async def run(url: str, pragmas: dict, readers: int, writers: int, seconds: float):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    configure_sqlite(engine, pragmas)
+    stats = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(
+                        select(func.count(), func.sum(Transaction.amount)).where(
+                            Transaction.user_id == 1,
+                            Transaction.created_at
+                            >= datetime.now() - timedelta(days=365),
+                        )
+                    )
+                stats["reads"] += 1
+            except OperationalError:
+                stats["errors"] += 1
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            try:
+                async with engine.begin() as conn:
+                    await conn.execute(
+                        insert(Transaction).values(
+                            user_id=2,
+                            amount=100.0,
+                            description="кофе",
+                            type=TransactionType.EXPENSE,
+                            created_at=datetime.now(),
+                        )
+                    )
+                stats["writes"] += 1
+            except OperationalError:
+                stats["errors"] += 1
+
+    await asyncio.gather(
+        *(reader() for _ in range(readers)), *(writer() for _ in range(writers))
+    )
+    await engine.dispose()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"Транзакций: {args.rows}, читателей: {args.readers}, "
+        f"писателей: {args.writers}, {args.seconds:g} с на вариант"
+    )
+    variants = (
+        ("default", {}),
+        ("tuned", SQLITE_PRAGMAS),
+    )
+    for name, pragmas in variants:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{tmp}/bench.db"
+            seed(url, args.rows)
+            stats = asyncio.run(
+                run(url, pragmas, args.readers, args.writers, args.seconds)
+            )
+        print(
+            f"{name:<8} | чтений/с {stats['reads'] / args.seconds:8.1f}"
+            f" | записей/с {stats['writes'] / args.seconds:8.1f}"
+            f" | всего/с {(stats['reads'] + stats['writes']) / args.seconds:8.1f}"
+            f" | ошибок {stats['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк импорта выписки: файл целиком в памяти против потокового чтения.
+
+"Целиком": openpyxl в обычном режиме (или все строки CSV списком) и одна
+вставка всех строк. "Поток": src.statement_import как в боте — read_only,
+порции по IMPORT_BATCH_SIZE строк, commit на порцию. Пиковая память —
+по tracemalloc (он замедляет оба варианта одинаково).
+
+Запуск: python benchmarks/bench_statement_import.py [--rows 100000]
+"""
+
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook, load_workbook
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.messages import CATEGORY_DEFAULT
+from src.models import Base, Category, User
+from src.statement_import import (
+    import_statement,
+    parse_statement,
+    read_statement,
+)
+
+HEADER = ["Дата операции", "Сумма операции", "Назначение платежа"]
+DESCRIPTIONS = ["Пятерочка", "Такси", "Аптека", "Кафе", "Зарплата", "Перевод"]
+
+
+def generate(path: Path, rows: int):
+    start = datetime(2025, 1, 1)
+
+    def row(i):
+        amount = 50000 if i % 50 == 0 else -(i % 5000 + 1)
+        created_at = start + timedelta(minutes=7 * i)
+        return [created_at, amount, f"{DESCRIPTIONS[i % len(DESCRIPTIONS)]} {i}"]
+
+    if path.suffix == ".csv":
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file, delimiter=";")
+            writer.writerow(HEADER)
+            for i in range(rows):
+                created_at, amount, description = row(i)
+                writer.writerow(
+                    [f"{created_at:%d.%m.%Y %H:%M}", f"{amount},00", description]
+                )
+    else:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(HEADER)
+        for i in range(rows):
+            sheet.append(row(i))
+        workbook.save(path)
+
+
+def read_whole(path: Path):
+    """Все строки файла сразу: обычный режим openpyxl или список строк CSV"""
+    if path.suffix == ".csv":
+        return list(read_statement(path))
+    workbook = load_workbook(path)
+    return [[cell.value for cell in row] for row in workbook.active.iter_rows()]
+
+
+def setup(url: str):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": 1}])
+        conn.execute(insert(Category), [{"name": CATEGORY_DEFAULT}])
+    engine.dispose()
+
+
+async def run(url: str, path: Path, streaming: bool):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    tracemalloc.start()
+    started = time.perf_counter()
+    if streaming:
+        rows = parse_statement(read_statement(path))
+        batch_size = None
+    else:
+        rows = list(parse_statement(read_whole(path)))
+        batch_size = len(rows)
+    kwargs = {"batch_size": batch_size} if batch_size else {}
+    result = await import_statement(
+        1, rows, lambda description: CATEGORY_DEFAULT, session_factory, **kwargs
+    )
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await engine.dispose()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for suffix in (".csv", ".xlsx"):
+            path = Path(tmp) / f"statement{suffix}"
+            generate(path, args.rows)
+            size = path.stat().st_size / 2**20
+            print(f"{suffix[1:].upper()}: {args.rows} строк, {size:.1f} МБ")
+            for name, streaming in (("целиком", False), ("поток", True)):
+                url = f"sqlite:///{tmp}/{name}{suffix}.db"
+                setup(url)
+                result, elapsed, peak = asyncio.run(run(url, path, streaming))
+                print(
+                    f"  {name:<8} | {elapsed:6.2f} s | {result.imported / elapsed:7.0f}"
+                    f" строк/с | пик памяти {peak / 2**20:7.1f} МБ"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк накладных расходов на запрос: select(), собранный заново на
+каждый вызов (как раньше в обработчиках), против lambda_stmt и готовых
+конструкций из src/repository.py.
+
+Запросы выполняются на маленькой таблице, поэтому разница во времени —
+это в основном построение выражения, вычисление ключа кэша компиляции и
+разбор результата. Отдельно показано время без БД: построение выражения
+и ключ кэша.
+
+Запуск: python benchmarks/bench_statements.py [--calls 5000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, lambda_stmt, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src import repository
+from src.models import TRANSACTION_ROW, Base, Transaction, TransactionType, User
+
+
+def setup(url: str):
+    """Схема, 100 пользователей и по 20 операций у первого"""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": 1000 + i} for i in range(100)])
+        conn.execute(
+            insert(Transaction),
+            [
+                {
+                    "user_id": 1,
+                    "amount": float(i),
+                    "description": f"покупка {i}",
+                    "type": TransactionType.EXPENSE,
+                    "created_at": now - timedelta(hours=i),
+                }
+                for i in range(20)
+            ],
+        )
+    engine.dispose()
+
+
+def inline_user(telegram_id):
+    return select(User.id).where(User.telegram_id == telegram_id)
+
+
+def lambda_user(telegram_id):
+    return lambda_stmt(lambda: select(User.id).where(User.telegram_id == telegram_id))
+
+
+def inline_history(user_id, start, end):
+    return (
+        select(*TRANSACTION_ROW)
+        .where(
+            Transaction.user_id == user_id,
+            Transaction.created_at >= start,
+            Transaction.created_at < end,
+        )
+        .order_by(Transaction.created_at.desc())
+    )
+
+
+def lambda_history(user_id, start, end):
+    return lambda_stmt(
+        lambda: select(*TRANSACTION_ROW)
+        .where(
+            Transaction.user_id == user_id,
+            Transaction.created_at >= start,
+            Transaction.created_at < end,
+        )
+        .order_by(Transaction.created_at.desc())
+    )
+
+
+async def timed(calls: int, call) -> float:
+    """Микросекунд на вызов"""
+    await call(0)  # прогрев кэша компиляции
+    started = time.perf_counter()
+    for i in range(calls):
+        await call(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def timed_build(calls: int, build) -> float:
+    """Микросекунд на построение выражения и ключа кэша, без БД"""
+    started = time.perf_counter()
+    for i in range(calls):
+        build(i)._generate_cache_key()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        setup(f"sqlite:///{path}")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        end = datetime.now() + timedelta(days=1)
+        start = end - timedelta(days=2)
+
+        async with session_factory() as db:
+            variants = {
+                "users.id по telegram_id": {
+                    "inline": lambda i: db.scalar(inline_user(1000 + i % 100)),
+                    "lambda_stmt": lambda i: db.scalar(lambda_user(1000 + i % 100)),
+                    "repository": lambda i: repository.user_id_by_telegram_id(
+                        db, 1000 + i % 100
+                    ),
+                },
+                "операции за период": {
+                    "inline": lambda i: _all(db, inline_history(1, start, end)),
+                    "lambda_stmt": lambda i: _all(db, lambda_history(1, start, end)),
+                    "repository": lambda i: repository.transactions_between(
+                        db, 1, start, end
+                    ),
+                },
+            }
+            for name, calls in variants.items():
+                print(f"\n{name}, мкс на вызов ({args.calls} вызовов):")
+                for variant, call in calls.items():
+                    print(f"  {variant:12} {await timed(args.calls, call):8.1f}")
+
+        await engine.dispose()
+
+    print("\nПостроение выражения и ключа кэша без БД, мкс:")
+    builds = {
+        "inline": lambda i: inline_history(1, start, end),
+        "lambda_stmt": lambda i: lambda_history(1, start, end),
+        "repository": lambda i: repository._TRANSACTIONS_BETWEEN,
+    }
+    for variant, build in builds.items():
+        print(f"  {variant:12} {timed_build(args.calls, build):8.1f}")
+
+
+async def _all(db, stmt):
+    return (await db.execute(stmt)).all()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк вставок транзакций: commit на каждое сообщение против групповой
+записи (WriteBatcher), когда сообщения приходят одновременно.
+
+В обоих вариантах агрегаты обновляются в той же транзакции БД, что и
+вставка, как в боте.
+
+Запуск: python benchmarks/bench_write_pipeline.py [--messages 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src import aggregates
+from src.models import Base, Transaction, TransactionType, User
+from src.write_pipeline import WriteBatcher
+
+
+def setup(url: str, users: int):
+    """Создает схему и пользователей"""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"telegram_id": 1000 + i} for i in range(users)])
+    engine.dispose()
+
+
+def message_values(i: int, users: int) -> dict:
+    return {
+        "user_id": 1 + i % users,
+        "amount": float(i % 1000),
+        "description": f"покупка {i}",
+        "type": TransactionType.EXPENSE,
+        "category_id": None,
+        "created_at": datetime.now(),
+    }
+
+
+async def run_per_message(session_factory, messages: int, users: int):
+    """Старый путь: отдельный commit на каждое сообщение; возвращает число ошибок"""
+
+    async def handler(i):
+        async with session_factory() as db:
+            transaction = Transaction(**message_values(i, users))
+            db.add(transaction)
+            await aggregates.record_transaction(db, transaction)
+            await db.commit()
+
+    results = await asyncio.gather(
+        *(handler(i) for i in range(messages)), return_exceptions=True
+    )
+    # Конкурирующие писатели упираются в блокировку файла SQLite
+    return None, sum(isinstance(r, Exception) for r in results)
+
+
+async def run_batched(session_factory, messages: int, users: int):
+    """Новый путь: общий commit для пачки сообщений"""
+    batcher = WriteBatcher(session_factory)
+    await asyncio.gather(
+        *(batcher.add_transaction(**message_values(i, users)) for i in range(messages))
+    )
+    await batcher.close()
+    return batcher.batches, 0
+
+
+async def run(url: str, runner, messages: int, users: int):
+    engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    started = time.perf_counter()
+    batches, errors = await runner(session_factory, messages, users)
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed, batches, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Сообщений: {args.messages}, пользователей: {args.users}")
+    for name, runner in (("commit", run_per_message), ("batch", run_batched)):
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{tmp}/bench.db"
+            setup(url, args.users)
+            elapsed, batches, errors = asyncio.run(
+                run(url, runner, args.messages, args.users)
+            )
+        written = args.messages - errors
+        line = (
+            f"{name:<6} | {written / elapsed:8.0f} вставок/с | {elapsed:6.2f} s"
+            f" | ошибок {errors}"
+        )
+        if batches:
+            line += f" | пачек {batches}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,36 @@
-import sqlite3
 import requests
 import time
 import os
 import argparse # Добавляем импорт argparse
+from sqlalchemy import make_url, select
+from sqlalchemy.exc import SQLAlchemyError
+from src.database import DATABASE_URL, SessionLocal
+from src.models import User
 
 # --- НАСТРОЙКИ ---
 # ВАЖНО: Вставьте сюда ваш токен бота Telegram
 # BOT_TOKEN = "ВАШ_ТЕЛЕГРАМ_БОТ_ТОКЕН" # Токен теперь будет читаться из переменной окружения
 # Текст сообщения для отправки - теперь будет передаваться как аргумент
 # MESSAGE_TEXT = "Дорогие пользователи, те 3 молодых человека, что пользуются ботом, вынужден вас огорчить новостью: бот закрывается. Мне влетает в копеечку держать месяцами этого бота, а также разрабатывать решения для него у меня совершенно нет времени. Сервер я выключу 13 числа где-то в 10. Если кому-то что-то нужно сохранить для отслеживания, у вас еще есть время."
-# Путь к файлу базы данных SQLite (относительно места запуска скрипта)
-DATABASE_PATH = os.path.join("data", "finance_bot.db")
-# Название таблицы и столбца
-TABLE_NAME = "users"
-CHAT_ID_COLUMN = "telegram_id"
+# База данных берется из настроек бота (DATABASE_URL в окружении или .env)
 # Задержка между отправкой сообщений (в секундах) для избежания лимитов Telegram
 SEND_DELAY = 0.1
 # --- КОНЕЦ НАСТРОЕК ---
 
-def get_chat_ids(db_path, table, column):
-    """Извлекает все chat_id из базы данных SQLite."""
-    chat_ids = set() # Используем set для автоматической дедупликации
+def get_chat_ids():
+    """Извлекает все chat_id пользователей из базы данных бота."""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT {column} FROM {table}")
-        rows = cursor.fetchall()
-        for row in rows:
-            if row[0]: # Убедимся, что ID не пустой
-                 chat_ids.add(row[0])
-        conn.close()
+        with SessionLocal() as db:
+            # telegram_id уникален, отдельная дедупликация не нужна
+            chat_ids = [
+                chat_id
+                for chat_id in db.scalars(select(User.telegram_id))
+                if chat_id # Убедимся, что ID не пустой
+            ]
         print(f"Найдено {len(chat_ids)} уникальных chat_id.")
-        return list(chat_ids)
-    except sqlite3.Error as e:
-        print(f"Ошибка при чтении базы данных SQLite: {e}")
+        return chat_ids
+    except SQLAlchemyError as e:
+        print(f"Ошибка при чтении базы данных: {e}")
         return []
     except Exception as e:
         print(f"Произошла непредвиденная ошибка при получении chat_id: {e}")
@@ -67,18 +64,14 @@ def send_message(chat_id, text, token):
         print(f"Непредвиденная ошибка при отправке в чат {chat_id}: {e}")
         return False
 
-def broadcast(token, db_path, table, column, message):
+def broadcast(token, message):
     """Основная функция для выполнения рассылки."""
     if not token: # Проверяем, что токен был передан
         print("Ошибка: Токен бота не предоставлен. Убедитесь, что переменная окружения TELEGRAM_BOT_TOKEN установлена и передана в скрипт.")
         return
 
-    if not os.path.exists(db_path):
-         print(f"Ошибка: Файл базы данных не найден по пути: {db_path}")
-         print(f"Текущая рабочая директория: {os.getcwd()}")
-         return
-
-    chat_ids = get_chat_ids(db_path, table, column)
+    print(f"База данных: {make_url(DATABASE_URL).render_as_string(hide_password=True)}")
+    chat_ids = get_chat_ids()
 
     if not chat_ids:
         print("Chat ID не найдены или произошла ошибка при чтении БД. Рассылка отменена.")
@@ -141,4 +134,4 @@ if __name__ == "__main__":
         print("Пример для Windows PowerShell: $env:TELEGRAM_BOT_TOKEN=\"ваш_токен\"")
         exit()
 
-    broadcast(telegram_bot_token, DATABASE_PATH, TABLE_NAME, CHAT_ID_COLUMN, args.message) # Используем args.message 
+    broadcast(telegram_bot_token, args.message) # Используем args.message 
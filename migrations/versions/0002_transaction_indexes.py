@@ -0,0 +1,44 @@
+"""Составные индексы для запросов истории, статистики и категорий
+
+Все чтения транзакций фильтруют по user_id и периоду created_at,
+статистика дополнительно по type, а /category по category_id.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_transactions_user_created",
+        "transactions",
+        ["user_id", "created_at"],
+    )
+    op.create_index(
+        "ix_transactions_user_type_created",
+        "transactions",
+        ["user_id", "type", "created_at"],
+    )
+    op.create_index(
+        "ix_transactions_user_category_created",
+        "transactions",
+        ["user_id", "category_id", "created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_user_category_created", table_name="transactions")
+    op.drop_index("ix_transactions_user_type_created", table_name="transactions")
+    op.drop_index("ix_transactions_user_created", table_name="transactions")
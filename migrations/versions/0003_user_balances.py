@@ -0,0 +1,48 @@
+"""Таблица user_balances с итогами пользователя
+
+Заполняется по существующим транзакциям, дальше поддерживается
+в той же транзакции БД, что и запись операций (src/aggregates.py).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_balances",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("income", sa.Float(), nullable=False),
+        sa.Column("expense", sa.Float(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.execute(
+        """
+        INSERT INTO user_balances (user_id, income, expense, count)
+        SELECT user_id,
+               SUM(CASE WHEN type = 'INCOME' THEN amount ELSE 0 END),
+               SUM(CASE WHEN type = 'EXPENSE' THEN amount ELSE 0 END),
+               COUNT(*)
+        FROM transactions
+        GROUP BY user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_balances")
@@ -0,0 +1,62 @@
+"""Дневные сводки daily_rollups для /stats, /history и /category
+
+Ключ (user_id, day, category_id, type), category_id = 0 для операций
+без категории. Заполняется по существующим транзакциям.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 14:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "daily_rollups",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("category_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column(
+            "type",
+            # Тип transactiontype в PostgreSQL уже создан миграцией 0001
+            postgresql.ENUM(
+                "INCOME", "EXPENSE", name="transactiontype", create_type=False
+            ),
+            nullable=False,
+        ),
+        sa.Column("total", sa.Float(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "day", "category_id", "type"),
+    )
+
+    # В SQLite CAST(... AS DATE) дает число, поэтому день берем через date()
+    if op.get_bind().dialect.name == "sqlite":
+        day = "date(created_at)"
+    else:
+        day = "CAST(created_at AS DATE)"
+    op.execute(
+        f"""
+        INSERT INTO daily_rollups (user_id, day, category_id, type, total, count)
+        SELECT user_id, {day}, COALESCE(category_id, 0), type,
+               SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY user_id, {day}, COALESCE(category_id, 0), type
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_rollups")
@@ -0,0 +1,48 @@
+"""Глобальные счетчики global_counters для /total
+
+Счетчики: users, transactions, income, expense. Заполняются по текущим
+данным, дальше поддерживаются при каждой записи (src/aggregates.py).
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "global_counters",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("value", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.execute(
+        """
+        INSERT INTO global_counters (name, value)
+        SELECT 'users', COUNT(*) FROM users
+        UNION ALL
+        SELECT 'transactions', COUNT(*) FROM transactions
+        UNION ALL
+        SELECT 'income', COALESCE(SUM(amount), 0)
+        FROM transactions WHERE type = 'INCOME'
+        UNION ALL
+        SELECT 'expense', COALESCE(SUM(amount), 0)
+        FROM transactions WHERE type = 'EXPENSE'
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("global_counters")
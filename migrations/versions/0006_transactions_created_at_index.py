@@ -0,0 +1,28 @@
+"""Индекс по created_at для очистки старых транзакций
+
+/clean_db удаляет порциями по условию created_at < дата без привязки
+к пользователю, составные индексы (user_id, ...) для этого не подходят.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 18:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_transactions_created_at", "transactions", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_created_at", table_name="transactions")
@@ -0,0 +1,39 @@
+"""Таблица user_category_tokens для категорий, выученных по исправлениям
+
+Ключ (user_id, token, category_id): сколько раз пользователь переносил
+операцию со словом token в категорию category_id. Таблица начинается
+пустой — модель учится только на новых исправлениях.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 20:00:00
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_category_tokens",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("token", sa.String(), nullable=False),
+        sa.Column("category_id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "token", "category_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_category_tokens")
@@ -0,0 +1,90 @@
+"""Отпечатки транзакций для поиска дублей при импорте выписок
+
+Колонка fingerprint и индекс (user_id, fingerprint). Для существующих
+операций отпечатки считаются порциями; новые заполняет модель при
+вставке (src.models.transaction_fingerprint).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 22:00:00
+
+"""
+
+from hashlib import blake2b
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+
+transactions = sa.table(
+    "transactions",
+    sa.column("id", sa.Integer),
+    sa.column("created_at", sa.DateTime),
+    sa.column("type", sa.String),
+    sa.column("amount", sa.Float),
+    sa.column("description", sa.String),
+    sa.column("fingerprint", sa.BigInteger),
+)
+
+
+def fingerprint(created_at, type_name, amount, description) -> int:
+    # Копия src.models.transaction_fingerprint на момент миграции
+    text = " ".join((description or "").lower().split())
+    key = f"{created_at:%Y-%m-%d}|{type_name}|{round(amount * 100)}|{text}"
+    digest = blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def upgrade() -> None:
+    op.add_column(
+        "transactions", sa.Column("fingerprint", sa.BigInteger(), nullable=True)
+    )
+
+    bind = op.get_bind()
+    update = (
+        transactions.update()
+        .where(transactions.c.id == sa.bindparam("row_id"))
+        .values(fingerprint=sa.bindparam("value"))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(
+                transactions.c.id,
+                transactions.c.created_at,
+                transactions.c.type,
+                transactions.c.amount,
+                transactions.c.description,
+            )
+            .where(transactions.c.id > last_id)
+            .where(transactions.c.created_at.is_not(None))
+            .order_by(transactions.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            update,
+            [{"row_id": row.id, "value": fingerprint(*row[1:])} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    op.create_index(
+        "ix_transactions_user_fingerprint",
+        "transactions",
+        ["user_id", "fingerprint"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transactions_user_fingerprint", table_name="transactions")
+    op.drop_column("transactions", "fingerprint")
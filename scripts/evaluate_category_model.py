@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Офлайн-оценка категорий, выученных по исправлениям (src/category_model.py).
+
+Операции из БД проигрываются в порядке создания. Для каждой операции с
+категорией и описанием категория предсказывается так, как это сделал бы
+бот в тот момент: общими правилами и моделью пользователя поверх них. Если
+предсказание не совпало с сохраненной категорией, пользователь исправил бы
+её кнопками — модель учится на этом исправлении.
+
+Выводятся точность только правил и правил с моделью, доля ответов модели и
+время предсказания модели на одну операцию.
+
+Запуск: python scripts/evaluate_category_model.py [--database-url URL] [--limit N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select
+
+from src.categories import parse_keywords
+from src.categorization import CATEGORY_KEYWORDS, KEYWORD_PRIORITIES, compile_rules
+from src.category_model import UserModel, tokenize
+from src.database import DATABASE_URL
+from src.messages import CATEGORY_DEFAULT
+from src.models import Category, Transaction
+
+
+def keyword_rules(connection, builtin):
+    """Встроенная таблица и слова из Category.keywords, как в CategorizationEngine"""
+    table = {category: list(words) for category, words in builtin.items()}
+    rows = connection.execute(
+        select(Category.name, Category.keywords).order_by(Category.id)
+    )
+    for name, keywords in rows:
+        table.setdefault(name, []).extend(parse_keywords(keywords))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    with engine.connect() as connection:
+        names = dict(connection.execute(select(Category.id, Category.name)).all())
+        matcher = compile_rules(
+            keyword_rules(connection, CATEGORY_KEYWORDS), KEYWORD_PRIORITIES
+        )
+        stmt = (
+            select(
+                Transaction.user_id, Transaction.description, Transaction.category_id
+            )
+            .where(
+                Transaction.category_id.is_not(None),
+                Transaction.description.is_not(None),
+            )
+            .order_by(Transaction.created_at, Transaction.id)
+            .limit(args.limit)
+            .execution_options(yield_per=10_000)
+        )
+
+        models = {}
+        total = rules_correct = model_correct = model_answers = corrections = 0
+        inference = 0.0
+        for user_id, description, category_id in connection.execute(stmt):
+            actual = names.get(category_id)
+            if actual is None:
+                continue
+            total += 1
+            model = models.setdefault(user_id, UserModel())
+
+            rules = matcher.best(description) or CATEGORY_DEFAULT
+            started = time.perf_counter()
+            tokens = tokenize(description)
+            learned = model.predict(tokens)
+            inference += time.perf_counter() - started
+
+            predicted = names.get(learned) or rules
+            model_answers += learned in names
+            rules_correct += rules == actual
+            model_correct += predicted == actual
+            if predicted != actual:
+                corrections += 1
+                model.learn(tokens, category_id)
+    engine.dispose()
+
+    if not total:
+        print("В БД нет операций с категорией и описанием")
+        return
+    print(f"Операций: {total}, пользователей: {len(models)}")
+    print(f"Точность правил:           {rules_correct / total:7.2%}")
+    print(f"Точность правил и модели:  {model_correct / total:7.2%}")
+    print(f"Ответов модели:            {model_answers / total:7.2%}")
+    print(f"Исправлений (обучений):    {corrections}")
+    print(
+        f"Предсказание модели: {inference / total * 1e6:.2f} мкс на операцию, "
+        f"{total / inference:,.0f} операций/с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,669 @@
+"""
+Агрегаты по транзакциям: балансы пользователей (user_balances),
+дневные сводки (daily_rollups) и общие счетчики (global_counters).
+
+Функции работают в переданной сессии и не делают commit, поэтому
+агрегаты меняются в той же транзакции БД, что и сами операции.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Date,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import repository
+from src.models import (
+    DailyRollup,
+    GlobalCounter,
+    Transaction,
+    TransactionType,
+    User,
+    UserBalance,
+)
+
+# Допустимое расхождение сумм при сверке (накопленная ошибка float)
+DRIFT_TOLERANCE = 0.005
+
+# category_id в сводках для операций без категории
+NO_CATEGORY = 0
+
+# Имена общих счетчиков
+COUNTER_USERS = "users"
+COUNTER_TRANSACTIONS = "transactions"
+COUNTER_INCOME = "income"
+COUNTER_EXPENSE = "expense"
+COUNTER_NAMES = (COUNTER_USERS, COUNTER_TRANSACTIONS, COUNTER_INCOME, COUNTER_EXPENSE)
+
+# (user_id, день, category_id, тип, сумма, количество) — изменение агрегатов
+# для группы операций с одинаковым ключом дневной сводки
+RollupDelta = Tuple[int, date, int, TransactionType, float, int]
+
+
+def upsert(db: AsyncSession, model):
+    """INSERT ... ON CONFLICT для диалекта текущей БД"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def day_of(db: AsyncSession, column):
+    """SQL-выражение «день» для колонки DateTime"""
+    # В SQLite CAST(... AS DATE) дает число, а date() — строку как у типа Date
+    if db.get_bind().dialect.name == "sqlite":
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rollup_key(transaction: Transaction):
+    """Ключ дневной сводки для транзакции"""
+    return (
+        transaction.user_id,
+        transaction.created_at.date(),
+        transaction.category_id or NO_CATEGORY,
+        transaction.type,
+    )
+
+
+# (user_id, тип, сумма, количество) — изменение баланса пользователя
+BalanceDelta = Tuple[int, TransactionType, float, int]
+
+
+async def apply_balance_deltas(db: AsyncSession, deltas: Iterable[BalanceDelta]):
+    """Прибавляет суммы и количества операций к балансам одним executemany"""
+    params = [
+        {
+            "user_id": user_id,
+            "income": amount if transaction_type == TransactionType.INCOME else 0.0,
+            "expense": amount if transaction_type == TransactionType.EXPENSE else 0.0,
+            "count": count,
+        }
+        for user_id, transaction_type, amount, count in deltas
+    ]
+    if not params:
+        return
+
+    stmt = upsert(db, UserBalance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserBalance.user_id],
+        set_={
+            "income": UserBalance.income + stmt.excluded.income,
+            "expense": UserBalance.expense + stmt.excluded.expense,
+            "count": UserBalance.count + stmt.excluded.count,
+        },
+    )
+    await db.execute(stmt, params)
+
+
+async def apply_balance_delta(
+    db: AsyncSession,
+    user_id: int,
+    transaction_type: TransactionType,
+    amount: float,
+    count: int,
+):
+    """Прибавляет сумму и количество операций к балансу пользователя"""
+    await apply_balance_deltas(db, [(user_id, transaction_type, amount, count)])
+
+
+async def apply_rollup_deltas(db: AsyncSession, deltas: Iterable[RollupDelta]):
+    """Прибавляет суммы и количества операций к дневным сводкам одним executemany"""
+    params = [
+        {
+            "user_id": user_id,
+            "day": day,
+            "category_id": category_id,
+            "type": transaction_type,
+            "total": amount,
+            "count": count,
+        }
+        for user_id, day, category_id, transaction_type, amount, count in deltas
+    ]
+    if not params:
+        return
+
+    stmt = upsert(db, DailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            DailyRollup.user_id,
+            DailyRollup.day,
+            DailyRollup.category_id,
+            DailyRollup.type,
+        ],
+        set_={
+            "total": DailyRollup.total + stmt.excluded.total,
+            "count": DailyRollup.count + stmt.excluded.count,
+        },
+    )
+    await db.execute(stmt, params)
+
+    # Опустевшие сводки удаляем, чтобы в них не оставались нулевые дни
+    decreased = [row for row in params if row["count"] < 0]
+    if decreased:
+        # Bulk DELETE с параметрами ORM не поддерживает, выполняем в Core
+        connection = await db.connection()
+        await connection.execute(
+            delete(DailyRollup).where(
+                DailyRollup.user_id == bindparam("b_user_id"),
+                DailyRollup.day == bindparam("b_day"),
+                DailyRollup.category_id == bindparam("b_category_id"),
+                DailyRollup.type == bindparam("b_type"),
+                DailyRollup.count <= 0,
+            ),
+            [{f"b_{key}": row[key] for key in _ROLLUP_KEY} for row in decreased],
+        )
+
+
+_ROLLUP_KEY = ("user_id", "day", "category_id", "type")
+
+
+async def apply_rollup_delta(
+    db: AsyncSession,
+    user_id: int,
+    day: date,
+    category_id: int,
+    transaction_type: TransactionType,
+    amount: float,
+    count: int,
+):
+    """Прибавляет сумму и количество операций к дневной сводке"""
+    await apply_rollup_deltas(
+        db, [(user_id, day, category_id, transaction_type, amount, count)]
+    )
+
+
+async def apply_counter_deltas(db: AsyncSession, deltas: Dict[str, float]):
+    """Прибавляет значения к общим счетчикам одним executemany"""
+    if not deltas:
+        return
+    stmt = upsert(db, GlobalCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[GlobalCounter.name],
+        set_={"value": GlobalCounter.value + stmt.excluded.value},
+    )
+    await db.execute(
+        stmt, [{"name": name, "value": value} for name, value in deltas.items()]
+    )
+
+
+async def apply_counter_delta(db: AsyncSession, name: str, delta: float):
+    """Прибавляет значение к общему счетчику"""
+    await apply_counter_deltas(db, {name: delta})
+
+
+def _totals(transaction_type: TransactionType, amount: float, count: int):
+    amount_counter = (
+        COUNTER_INCOME
+        if transaction_type == TransactionType.INCOME
+        else COUNTER_EXPENSE
+    )
+    return {COUNTER_TRANSACTIONS: count, amount_counter: amount}
+
+
+async def apply_totals_delta(
+    db: AsyncSession, transaction_type: TransactionType, amount: float, count: int
+):
+    """Меняет общие счетчики операций и сумм"""
+    await apply_counter_deltas(db, _totals(transaction_type, amount, count))
+
+
+async def record_user(db: AsyncSession):
+    """Учитывает нового пользователя в общих счетчиках"""
+    await apply_counter_delta(db, COUNTER_USERS, 1)
+
+
+async def record_transaction(db: AsyncSession, transaction: Transaction):
+    """Учитывает новую транзакцию в агрегатах"""
+    await record_transactions(db, [transaction])
+
+
+async def record_category_change(
+    db: AsyncSession, transaction: Transaction, old_category_id: Optional[int]
+):
+    """Переносит транзакцию между дневными сводками категорий"""
+    user_id, day, category_id, transaction_type = rollup_key(transaction)
+    old_category_id = old_category_id or NO_CATEGORY
+    if old_category_id == category_id:
+        return
+    await apply_rollup_deltas(
+        db,
+        [
+            (user_id, day, old_category_id, transaction_type, -transaction.amount, -1),
+            (user_id, day, category_id, transaction_type, transaction.amount, 1),
+        ],
+    )
+
+
+async def _apply_grouped_deltas(
+    db: AsyncSession, deltas: Iterable[RollupDelta], sign: int
+):
+    """
+    Применяет изменения сводок со знаком sign и выводит из них изменения
+    балансов и общих счетчиков: по одному executemany на таблицу
+    """
+    deltas = list(deltas)
+    balances = defaultdict(lambda: [0.0, 0])
+    for user_id, _, _, transaction_type, amount, count in deltas:
+        balance = balances[(user_id, transaction_type)]
+        balance[0] += amount
+        balance[1] += count
+
+    counters = defaultdict(float)
+    for (_, transaction_type), (amount, count) in balances.items():
+        for name, value in _totals(transaction_type, amount, count).items():
+            counters[name] += value
+
+    await apply_rollup_deltas(
+        db,
+        [(*key, sign * amount, sign * count) for *key, amount, count in deltas],
+    )
+    await apply_balance_deltas(
+        db,
+        [
+            (user_id, transaction_type, sign * amount, sign * count)
+            for (user_id, transaction_type), (amount, count) in balances.items()
+        ],
+    )
+    await apply_counter_deltas(
+        db, {name: sign * value for name, value in counters.items()}
+    )
+
+
+def group_by_rollup(transactions: Iterable[Transaction]) -> List[RollupDelta]:
+    """Суммы и количества транзакций, сгруппированные по ключу дневной сводки"""
+    groups = defaultdict(lambda: [0.0, 0])
+    for transaction in transactions:
+        group = groups[rollup_key(transaction)]
+        group[0] += transaction.amount
+        group[1] += 1
+    return [key + tuple(value) for key, value in groups.items()]
+
+
+async def record_transactions(db: AsyncSession, transactions: Iterable[Transaction]):
+    """Учитывает пачку новых транзакций в агрегатах"""
+    await _apply_grouped_deltas(db, group_by_rollup(transactions), 1)
+
+
+async def record_deletions(db: AsyncSession, deltas: Iterable[RollupDelta]):
+    """Вычитает из агрегатов удаленные операции, сгруппированные по ключу сводки"""
+    await _apply_grouped_deltas(db, deltas, -1)
+
+
+async def get_balance(db: AsyncSession, user_id: int) -> Tuple[float, float]:
+    """Доходы и расходы пользователя за все время (одна строка user_balances)"""
+    row = await repository.balance(db, user_id)
+    if not row:
+        return 0.0, 0.0
+    return row.income, row.expense
+
+
+async def get_counters(db: AsyncSession) -> Dict[str, float]:
+    """Все общие счетчики одним запросом к маленькой таблице"""
+    counters = dict.fromkeys(COUNTER_NAMES, 0.0)
+    counters.update(await repository.counters(db))
+    return counters
+
+
+async def _period_rows(
+    db: AsyncSession,
+    user_id: int,
+    start: datetime,
+    *group_by,
+    archived=(),
+    end: Optional[date] = None,
+):
+    """
+    Суммы за период [start, сейчас) или [start, конец дня end] с
+    группировкой по колонкам сводки.
+
+    Полные дни после start берутся из daily_rollups, а неполный первый
+    день периода — из transactions (индекс user_id, created_at), чтобы
+    итоги совпадали с фильтром created_at >= start. Если первый день уже
+    перенесен в архив, его операции передаются в archived.
+    """
+    first_day = start.date()
+    next_day = datetime.combine(first_day + timedelta(days=1), time.min)
+
+    rollup_columns = [getattr(DailyRollup, name) for name in group_by]
+    rollup_query = select(
+        *rollup_columns, func.sum(DailyRollup.total), func.sum(DailyRollup.count)
+    ).where(DailyRollup.user_id == user_id, DailyRollup.day > first_day)
+    if end is not None:
+        rollup_query = rollup_query.where(DailyRollup.day <= end)
+    rollups = await db.execute(rollup_query.group_by(*rollup_columns))
+
+    raw_columns = {
+        "day": day_of(db, Transaction.created_at),
+        "category_id": func.coalesce(Transaction.category_id, NO_CATEGORY),
+        "type": Transaction.type,
+    }
+    columns = [raw_columns[name] for name in group_by]
+    archived = [row for row in archived if start <= row.created_at < next_day]
+    boundary_query = select(
+        *columns, func.sum(Transaction.amount), func.count(Transaction.id)
+    ).where(
+        Transaction.user_id == user_id,
+        Transaction.created_at >= start,
+        Transaction.created_at < next_day,
+    )
+    if archived:
+        # Строка может быть и в архиве, и в БД (сбой посреди переноса)
+        boundary_query = boundary_query.where(
+            tuple_(Transaction.id, Transaction.created_at).notin_(
+                [(row.id, row.created_at) for row in archived]
+            )
+        )
+    boundary = await db.execute(boundary_query.group_by(*columns))
+
+    rows = []
+    for row in rollups:
+        rows.append(tuple(row))
+    for row in boundary:
+        row = tuple(row)
+        if "day" in group_by:
+            # date() в SQLite возвращает строку
+            index = group_by.index("day")
+            row = row[:index] + (first_day,) + row[index + 1 :]
+        rows.append(row)
+    for user_id, day, category_id, transaction_type, total, count in group_by_rollup(
+        archived
+    ):
+        values = {"day": day, "category_id": category_id, "type": transaction_type}
+        rows.append(tuple(values[name] for name in group_by) + (total, count))
+    return rows
+
+
+async def period_totals(
+    db: AsyncSession, user_id: int, start: datetime, archived=()
+) -> Tuple[float, float, Dict[int, float]]:
+    """
+    Доходы, расходы и расходы по категориям за период. archived — операции
+    из архива, нужны только если первый день периода уже в архиве
+    """
+    income = expenses = 0.0
+    by_category = defaultdict(float)
+    for category_id, transaction_type, total, _ in await _period_rows(
+        db, user_id, start, "category_id", "type", archived=archived
+    ):
+        if transaction_type == TransactionType.INCOME:
+            income += total
+        else:
+            expenses += total
+            by_category[category_id] += total
+    return income, expenses, dict(by_category)
+
+
+async def daily_totals(
+    db: AsyncSession,
+    user_id: int,
+    start: datetime,
+    archived=(),
+    end: Optional[date] = None,
+) -> Dict[date, Dict[str, float]]:
+    """
+    Доходы и расходы по дням периода (только дни с операциями), при
+    заданном end — не позже этого дня. archived — как в period_totals
+    """
+    days = defaultdict(lambda: {"income": 0.0, "expenses": 0.0})
+    for day, transaction_type, total, _ in await _period_rows(
+        db, user_id, start, "day", "type", archived=archived, end=end
+    ):
+        key = "income" if transaction_type == TransactionType.INCOME else "expenses"
+        days[day][key] += total
+    return dict(days)
+
+
+async def active_days(
+    db: AsyncSession,
+    user_id: int,
+    start: datetime,
+    limit: int,
+    before: Optional[date] = None,
+    after: Optional[date] = None,
+    archived=(),
+) -> List[date]:
+    """
+    Дни периода с операциями для страницы истории, по убыванию: до limit
+    дней раньше before или ближайшие limit дней позже after.
+
+    Дни берутся из первичного ключа daily_rollups (user_id, day, ...),
+    поэтому запрос не зависит от числа операций в периоде. Для неполного
+    первого дня проверяется, есть ли операции после start (в БД или в
+    archived).
+    """
+    first_day = start.date()
+    days = await repository.active_days(db, user_id, first_day, limit, before, after)
+    if after is not None:
+        return days[::-1]
+
+    if len(days) < limit and (before is None or first_day < before):
+        next_day = datetime.combine(first_day + timedelta(days=1), time.min)
+        in_archive = any(start <= row.created_at < next_day for row in archived)
+        if in_archive or await repository.has_transactions_between(
+            db, user_id, start, next_day
+        ):
+            days.append(first_day)
+    return days
+
+
+async def category_totals(
+    db: AsyncSession, user_id: int, category_id: int
+) -> Dict[TransactionType, Tuple[float, int]]:
+    """Сумма и число операций пользователя в категории за все время по типам"""
+    rows = await db.execute(
+        select(
+            DailyRollup.type, func.sum(DailyRollup.total), func.sum(DailyRollup.count)
+        )
+        .where(
+            DailyRollup.user_id == user_id,
+            DailyRollup.category_id == category_id,
+        )
+        .group_by(DailyRollup.type)
+    )
+    return {row[0]: (row[1] or 0.0, row[2] or 0) for row in rows}
+
+
+def _differs(left, right) -> bool:
+    left = left or (0.0,) * (len(right) - 1) + (0,)
+    right = right or (0.0,) * (len(left) - 1) + (0,)
+    return left[-1] != right[-1] or any(
+        abs(a - b) > DRIFT_TOLERANCE for a, b in zip(left[:-1], right[:-1])
+    )
+
+
+async def _replace(db: AsyncSession, model, computed: dict, key_names, value_names):
+    """Заменяет содержимое таблицы агрегата пересчитанными значениями"""
+    await db.execute(delete(model))
+    if computed:
+        await db.execute(
+            insert(model),
+            [
+                {**dict(zip(key_names, key)), **dict(zip(value_names, values))}
+                for key, values in computed.items()
+            ],
+        )
+
+
+async def rebuild_balances(
+    db: AsyncSession, archived: Iterable[RollupDelta] = ()
+) -> List[int]:
+    """
+    Пересчитывает user_balances по таблице транзакций и archived — вкладу
+    операций, перенесенных в архив.
+    Возвращает id пользователей, у которых сохраненный баланс расходился
+    """
+    computed_rows = await db.execute(
+        select(
+            Transaction.user_id,
+            func.sum(
+                case(
+                    (Transaction.type == TransactionType.INCOME, Transaction.amount),
+                    else_=0.0,
+                )
+            ),
+            func.sum(
+                case(
+                    (Transaction.type == TransactionType.EXPENSE, Transaction.amount),
+                    else_=0.0,
+                )
+            ),
+            func.count(Transaction.id),
+        ).group_by(Transaction.user_id)
+    )
+    computed = {(row[0],): tuple(row[1:]) for row in computed_rows}
+    for user_id, _, _, transaction_type, total, count in archived:
+        income, expense, stored_count = computed.get((user_id,), (0.0, 0.0, 0))
+        if transaction_type == TransactionType.INCOME:
+            income += total
+        else:
+            expense += total
+        computed[(user_id,)] = (income, expense, stored_count + count)
+
+    stored_rows = await db.execute(
+        select(
+            UserBalance.user_id,
+            UserBalance.income,
+            UserBalance.expense,
+            UserBalance.count,
+        )
+    )
+    stored = {(row[0],): tuple(row[1:]) for row in stored_rows}
+
+    drifted = [
+        key[0]
+        for key in computed.keys() | stored.keys()
+        if _differs(computed.get(key), stored.get(key))
+    ]
+
+    await _replace(
+        db, UserBalance, computed, ("user_id",), ("income", "expense", "count")
+    )
+    return sorted(drifted)
+
+
+async def rebuild_rollups(
+    db: AsyncSession, archived: Iterable[RollupDelta] = ()
+) -> List[Tuple[int, date]]:
+    """
+    Пересчитывает daily_rollups по таблице транзакций и archived.
+    Возвращает пары (user_id, день), в которых сводка расходилась
+    """
+    day = day_of(db, Transaction.created_at)
+    category_id = func.coalesce(Transaction.category_id, NO_CATEGORY)
+    computed_rows = await db.execute(
+        select(
+            Transaction.user_id,
+            day,
+            category_id,
+            Transaction.type,
+            func.sum(Transaction.amount),
+            func.count(Transaction.id),
+        ).group_by(Transaction.user_id, day, category_id, Transaction.type)
+    )
+    computed = {}
+    for row in computed_rows:
+        row_day = row[1]
+        if isinstance(row_day, str):
+            row_day = date.fromisoformat(row_day)
+        computed[(row[0], row_day, row[2], row[3])] = (row[4], row[5])
+    for *key, total, count in archived:
+        stored_total, stored_count = computed.get(tuple(key), (0.0, 0))
+        computed[tuple(key)] = (stored_total + total, stored_count + count)
+
+    stored_rows = await db.execute(
+        select(
+            DailyRollup.user_id,
+            DailyRollup.day,
+            DailyRollup.category_id,
+            DailyRollup.type,
+            DailyRollup.total,
+            DailyRollup.count,
+        )
+    )
+    stored = {tuple(row[:4]): tuple(row[4:]) for row in stored_rows}
+
+    drifted = {
+        key[:2]
+        for key in computed.keys() | stored.keys()
+        if _differs(computed.get(key), stored.get(key))
+    }
+
+    await _replace(
+        db,
+        DailyRollup,
+        computed,
+        ("user_id", "day", "category_id", "type"),
+        ("total", "count"),
+    )
+    return sorted(drifted)
+
+
+async def rebuild_counters(
+    db: AsyncSession, archived: Iterable[RollupDelta] = ()
+) -> List[str]:
+    """
+    Пересчитывает global_counters по пользователям, транзакциям и archived.
+    Возвращает имена счетчиков, которые расходились
+    """
+    users = await db.scalar(select(func.count(User.id)))
+    totals = dict(
+        (
+            await db.execute(
+                select(Transaction.type, func.sum(Transaction.amount)).group_by(
+                    Transaction.type
+                )
+            )
+        ).all()
+    )
+    computed = {
+        COUNTER_USERS: users or 0,
+        COUNTER_TRANSACTIONS: await db.scalar(select(func.count(Transaction.id))) or 0,
+        COUNTER_INCOME: totals.get(TransactionType.INCOME) or 0.0,
+        COUNTER_EXPENSE: totals.get(TransactionType.EXPENSE) or 0.0,
+    }
+    for _, _, _, transaction_type, total, count in archived:
+        for name, value in _totals(transaction_type, total, count).items():
+            computed[name] += value
+    stored = await get_counters(db)
+
+    drifted = [
+        name
+        for name in COUNTER_NAMES
+        if abs(computed[name] - stored[name]) > DRIFT_TOLERANCE
+    ]
+
+    await _replace(
+        db,
+        GlobalCounter,
+        {(name,): (value,) for name, value in computed.items()},
+        ("name",),
+        ("value",),
+    )
+    return drifted
+
+
+async def reconcile(
+    db: AsyncSession, archived: Iterable[RollupDelta] = ()
+) -> Dict[str, int]:
+    """
+    Пересобирает все агрегаты; возвращает число расхождений по каждому.
+    archived — вклад архивных операций, иначе они пропадут из агрегатов
+    """
+    archived = list(archived)
+    return {
+        "user_balances": len(await rebuild_balances(db, archived)),
+        "daily_rollups": len(await rebuild_rollups(db, archived)),
+        "global_counters": len(await rebuild_counters(db, archived)),
+    }
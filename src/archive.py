@@ -0,0 +1,441 @@
+"""
+Холодный архив старых транзакций.
+
+/archive переносит транзакции старше N дней из таблицы transactions в
+сжатые CSV-сегменты data/archive/users/<user_id>/ГГГГ-ММ/*.csv.gz. Сегмент
+хранит операции одного пользователя за месяц, поэтому чтение истории
+пользователя не распаковывает чужие данные. Сегменты только
+добавляются и пишутся атомарно (временный файл + rename), поэтому сбой
+посреди записи не портит архив. Горячая таблица и её индексы остаются
+маленькими, а агрегаты (балансы, сводки, счетчики) не меняются: архивные
+операции в них по-прежнему учтены.
+
+Файл watermark хранит дату, раньше которой в архиве могут быть операции;
+/history, /category и /export читают архив, только если запрошенный
+период начинается раньше неё. Между записью сегмента и удалением порции из
+БД строка может оказаться в обоих местах, поэтому при чтении записи
+объединяются, и версия из БД важнее. Строку определяет пара (id,
+created_at): SQLite выдает id удаленных последних строк заново.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import os
+import threading
+from collections import deque
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from time import time_ns
+from typing import (
+    Awaitable,
+    Callable,
+    Deque,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import aggregates
+from src.cache import LRUCache
+from src.database import AsyncSessionLocal
+from src.models import TRANSACTION_ROW, Transaction, TransactionType
+from src.purge import count_before
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "data/archive"))
+# /archive без аргумента переносит операции старше стольких дней
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "5000"))
+# Сколько разобранных сегментов держать в памяти
+ARCHIVE_CACHE_SEGMENTS = int(os.getenv("ARCHIVE_CACHE_SEGMENTS", "16"))
+
+# Каталог сегментов внутри архива; в корне раньше лежали месяцы всех
+# пользователей вместе (см. split_legacy_segments)
+USERS_DIR = "users"
+
+# Вызывается после каждой порции: (перенесено, всего)
+Progress = Callable[[int, int], Awaitable[None]]
+
+
+class ArchivedTransaction(NamedTuple):
+    """Транзакция из архива; атрибуты совпадают с Transaction"""
+
+    id: int
+    user_id: int
+    created_at: datetime
+    type: TransactionType
+    amount: float
+    category_id: Optional[int]
+    description: Optional[str]
+
+
+def identity(row) -> tuple:
+    """Ключ строки, общий для БД и архива"""
+    return row.id, row.created_at
+
+
+def _month_key(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def _to_csv_row(row) -> list:
+    return [
+        row.id,
+        row.user_id,
+        row.created_at.isoformat(),
+        row.type.name,
+        repr(row.amount),
+        "" if row.category_id is None else row.category_id,
+        row.description or "",
+    ]
+
+
+def _from_csv_row(row: list) -> ArchivedTransaction:
+    return ArchivedTransaction(
+        id=int(row[0]),
+        user_id=int(row[1]),
+        created_at=datetime.fromisoformat(row[2]),
+        type=TransactionType[row[3]],
+        amount=float(row[4]),
+        category_id=int(row[5]) if row[5] else None,
+        description=row[6] or None,
+    )
+
+
+class TransactionArchive:
+    """Сегменты архива в каталоге, разбитые по месяцам created_at"""
+
+    def __init__(self, directory: Path = ARCHIVE_DIR):
+        self.directory = Path(directory)
+        # Сегменты неизменяемы, поэтому кэш по пути не нужно сбрасывать.
+        # Архив читают потоки (to_thread, пул выгрузок), а LRUCache не
+        # потокобезопасен: обращения к нему идут под блокировкой
+        self._segments = LRUCache(ARCHIVE_CACHE_SEGMENTS)
+        self._segments_lock = threading.Lock()
+
+    @property
+    def _watermark_path(self) -> Path:
+        return self.directory / "watermark"
+
+    def watermark(self) -> Optional[datetime]:
+        """Дата, раньше которой операции могут лежать в архиве"""
+        try:
+            return datetime.fromisoformat(self._watermark_path.read_text().strip())
+        except FileNotFoundError:
+            return None
+
+    def covers(self, start: Optional[datetime]) -> bool:
+        """Нужно ли читать архив для периода, начинающегося со start"""
+        watermark = self.watermark()
+        return watermark is not None and (start is None or start < watermark)
+
+    def raise_watermark(self, value: datetime):
+        """Сдвигает watermark вперед (назад он не двигается)"""
+        current = self.watermark()
+        if current is not None and current >= value:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write_atomic(self._watermark_path, value.isoformat().encode())
+
+    def _write_atomic(self, path: Path, data: bytes):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+    def _user_dir(self, user_id: int) -> Path:
+        return self.directory / USERS_DIR / str(user_id)
+
+    def append(self, rows: Iterable) -> int:
+        """Записывает строки новыми сегментами (по одному на пользователя и месяц)"""
+        by_segment = {}
+        for row in rows:
+            key = row.user_id, _month_key(row.created_at)
+            by_segment.setdefault(key, []).append(row)
+
+        for (user_id, month), segment_rows in by_segment.items():
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(_to_csv_row(row) for row in segment_rows)
+            month_dir = self._user_dir(user_id) / month
+            month_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{time_ns()}-{segment_rows[0].id}.csv.gz"
+            self._write_atomic(
+                month_dir / name, gzip.compress(buffer.getvalue().encode("utf-8"))
+            )
+        return sum(len(segment_rows) for segment_rows in by_segment.values())
+
+    def split_legacy_segments(self) -> int:
+        """
+        Переносит сегменты прежнего формата (ГГГГ-ММ/*.csv.gz с операциями
+        всех пользователей) в разбиение по пользователям; возвращает число
+        строк. Сбой посреди переноса оставляет строку в обоих местах, а
+        повторный запуск её дописывает — при чтении дубли объединяются
+        """
+        if not self.directory.exists():
+            return 0
+        moved = 0
+        for month in sorted(self.directory.iterdir()):
+            if not month.is_dir() or month.name == USERS_DIR:
+                continue
+            for segment in sorted(month.glob("*.csv.gz")):
+                moved += self.append(self._parse_segment(segment))
+                segment.unlink()
+            if not any(month.iterdir()):
+                month.rmdir()
+        return moved
+
+    def _months(
+        self, user_id: int, start: Optional[datetime], end: Optional[datetime]
+    ) -> List[Path]:
+        user_dir = self._user_dir(user_id)
+        if not user_dir.exists():
+            return []
+        months = sorted(
+            (path for path in user_dir.iterdir() if path.is_dir()),
+            key=lambda path: path.name,
+            reverse=True,
+        )
+        return [
+            path
+            for path in months
+            if (start is None or path.name >= _month_key(start))
+            and (end is None or path.name <= _month_key(end))
+        ]
+
+    @staticmethod
+    def _parse_segment(path: Path) -> List[ArchivedTransaction]:
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as file:
+            return [_from_csv_row(row) for row in csv.reader(file)]
+
+    def _read_segment(self, path: Path) -> List[ArchivedTransaction]:
+        with self._segments_lock:
+            rows = self._segments.get(path)
+        if rows is None:
+            # Разбор идет без блокировки, чтобы потоки не ждали друг друга
+            rows = self._parse_segment(path)
+            with self._segments_lock:
+                self._segments.put(path, rows)
+        return rows
+
+    def months(
+        self,
+        user_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[List[ArchivedTransaction]]:
+        """
+        Операции пользователя за [start, end) по месяцам, от новых к старым;
+        внутри месяца новые первыми. Месяц читается, только когда до него
+        дошла очередь
+        """
+        for month in self._months(user_id, start, end):
+            found = {}
+            for segment in sorted(month.glob("*.csv.gz")):
+                for row in self._read_segment(segment):
+                    if (start is None or row.created_at >= start) and (
+                        end is None or row.created_at < end
+                    ):
+                        found[identity(row)] = row
+            yield sorted(found.values(), key=lambda row: row.created_at, reverse=True)
+
+    def read(
+        self,
+        user_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[ArchivedTransaction]:
+        """
+        Архивные операции пользователя за [start, end), новые первыми. С
+        limit месяцы читаются от новых к старым, пока не наберется нужное
+        число строк
+        """
+        rows = []
+        for month_rows in self.months(user_id, start, end):
+            rows.extend(
+                row
+                for row in month_rows
+                if category_id is None or row.category_id == category_id
+            )
+            if limit is not None and len(rows) >= limit:
+                break
+        return rows if limit is None else rows[:limit]
+
+    def scan(self) -> Iterator[ArchivedTransaction]:
+        """
+        Все операции архива, пользователь за пользователем и месяц за
+        месяцем; в памяти одновременно только один месяц одного пользователя
+        """
+        users_dir = self.directory / USERS_DIR
+        if not users_dir.exists():
+            return
+        for user_dir in sorted(users_dir.iterdir()):
+            for month_rows in self.months(int(user_dir.name)):
+                yield from month_rows
+
+
+transaction_archive = TransactionArchive()
+
+
+def merge(hot: Iterable, archived: Iterable) -> list:
+    """Объединяет операции из БД и архива (БД важнее), новые первыми"""
+    rows = {identity(row): row for row in archived}
+    rows.update((identity(row), row) for row in hot)
+    return sorted(rows.values(), key=lambda row: row.created_at, reverse=True)
+
+
+class StreamMerge:
+    """
+    То же, что merge, для операций из БД, которые приходят порциями (новые
+    первыми): архивные операции вставляются между ними по дате. Архив
+    приходит по месяцам, как из TransactionArchive.months; следующий месяц
+    берется, только когда до него дошла очередь, так что в памяти один месяц
+    """
+
+    def __init__(self, months: Iterable[Iterable]):
+        self._months = iter(months)
+        self._pending: Deque = deque()
+        # Архивная копия строки из БД имеет ту же дату и выходит сразу после
+        # всех строк БД с этой датой, поэтому помнить нужно только их ключи
+        self._hot_at: Optional[datetime] = None
+        self._hot_keys = set()
+
+    def _peek(self):
+        while not self._pending:
+            month = next(self._months, None)
+            if month is None:
+                return None
+            self._pending.extend(month)
+        return self._pending[0]
+
+    def _archived_until(self, created_at: Optional[datetime]) -> Iterable:
+        """Архивные операции новее created_at (все оставшиеся при None)"""
+        while True:
+            row = self._peek()
+            if row is None or (created_at is not None and row.created_at <= created_at):
+                return
+            self._pending.popleft()
+            # Версия из БД важнее
+            if row.created_at != self._hot_at or identity(row) not in self._hot_keys:
+                yield row
+
+    def feed(self, hot: Iterable) -> Iterable:
+        for row in hot:
+            yield from self._archived_until(row.created_at)
+            if row.created_at != self._hot_at:
+                self._hot_at = row.created_at
+                self._hot_keys = set()
+            self._hot_keys.add(identity(row))
+            yield row
+
+    def finish(self) -> Iterable:
+        return self._archived_until(None)
+
+
+async def read_archived(
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    archive: TransactionArchive = transaction_archive,
+) -> List[ArchivedTransaction]:
+    """Операции пользователя из архива; пусто, если период архив не затрагивает"""
+    if not archive.covers(start):
+        return []
+    return await asyncio.to_thread(
+        archive.read, user_id, start, end, category_id, limit
+    )
+
+
+async def read_first_day(
+    user_id: int,
+    start: datetime,
+    archive: TransactionArchive = transaction_archive,
+) -> List[ArchivedTransaction]:
+    """Архивные операции неполного первого дня периода: [start, конец дня)"""
+    end = datetime.combine(start.date() + timedelta(days=1), time.min)
+    return await read_archived(user_id, start, end, archive=archive)
+
+
+async def archive_before(
+    cutoff: datetime,
+    archive: TransactionArchive = transaction_archive,
+    session_factory=AsyncSessionLocal,
+    chunk_size: int = ARCHIVE_CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+) -> int:
+    """Переносит транзакции старше cutoff в архив порциями, возвращает их число"""
+    await asyncio.to_thread(archive.split_legacy_segments)
+    # watermark сдвигаем до переноса: пока порция в пути, читатели уже
+    # смотрят в архив и не теряют её
+    archive.raise_watermark(cutoff)
+    total = await count_before(cutoff, session_factory)
+    moved = 0
+
+    while moved < total:
+        async with session_factory() as db:
+            rows = (
+                await db.execute(
+                    select(*TRANSACTION_ROW)
+                    .where(Transaction.created_at < cutoff)
+                    .order_by(Transaction.created_at, Transaction.id)
+                    .limit(chunk_size)
+                )
+            ).all()
+            if not rows:
+                break
+
+            # Сначала сегмент на диск, потом удаление: при сбое между ними
+            # строка окажется в обоих местах, а не потеряется
+            await asyncio.to_thread(archive.append, rows)
+            await db.execute(
+                delete(Transaction)
+                .where(Transaction.id.in_([row.id for row in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+        moved += len(rows)
+        if progress:
+            await progress(moved, total)
+        await asyncio.sleep(0)
+
+    return moved
+
+
+async def archived_deltas(
+    db: AsyncSession, archive: TransactionArchive = transaction_archive
+) -> List[aggregates.RollupDelta]:
+    """
+    Вклад архива в агрегаты для /reconcile: архивные операции, которых
+    нет в БД, сгруппированные по ключу дневной сводки
+    """
+    watermark = archive.watermark()
+    if watermark is None:
+        return []
+    hot = set(
+        (
+            await db.execute(
+                select(Transaction.id, Transaction.created_at).where(
+                    Transaction.created_at < watermark
+                )
+            )
+        ).all()
+    )
+
+    def contribution():
+        return aggregates.group_by_rollup(
+            row for row in archive.scan() if identity(row) not in hot
+        )
+
+    return await asyncio.to_thread(contribution)
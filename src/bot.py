@@ -7,6 +7,7 @@ from telegram import (
     InlineKeyboardMarkup,
     ReplyKeyboardMarkup,
 )
+from telegram.constants import MessageLimit
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,19 +17,29 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-import re
-from datetime import datetime, timedelta
-from sqlalchemy import func
+from datetime import date, datetime, timedelta
+from typing import Optional
 import csv
-from io import StringIO, BytesIO
-from logger import bot_logger
-from database import SessionLocal
-from models import User, Transaction, Category, TransactionType
-from messages import *  # Импортируем все сообщения
+import tempfile
+from io import StringIO
+from src.logger import bot_logger
+from src.database import AsyncSessionLocal, ExportSessionLocal, reads, writes
+from src import aggregates, archive, export, purge, repository, statement_import
+from src.categories import category_registry
+from src.categorization import (
+    CATEGORY_KEYWORDS,
+    KEYWORD_PRIORITIES,
+    CategorizationEngine,
+)
+from src.category_model import category_models
+from src.users import get_or_create_user_id, get_user_id
+from src.write_pipeline import write_batcher
+from src.models import Transaction, TransactionType
+from src.parser import ParseError, parse_message
+from src.messages import *  # Импортируем все сообщения
 import asyncio
-from middleware import LoggingMiddleware, MetricsMiddleware
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+import time
+from src.middleware import LoggingMiddleware, MetricsMiddleware
 
 # Проверяем наличие .env файла
 env_file = Path(".env")
@@ -56,6 +67,19 @@ if missing_vars:
 # Настраиваем логгер
 logger = bot_logger
 
+# Периоды /history: длительность и название в сообщениях
+HISTORY_PERIODS = {
+    "день": (timedelta(days=1), PERIOD_DAY),
+    "неделя": (timedelta(weeks=1), PERIOD_WEEK),
+    "месяц": (timedelta(days=30), PERIOD_MONTH),
+    "год": (timedelta(days=365), PERIOD_YEAR),
+}
+# Дней с операциями на одной странице /history
+HISTORY_PAGE_DAYS = 10
+# Операций, перечисленных в ответе на многострочное сообщение; об остальных
+# только число, иначе ответ не уложится в лимит длины сообщения Telegram
+SAVED_BATCH_MAX_LINES = 20
+
 
 class FinanceBot:
     def __init__(self):
@@ -72,125 +96,13 @@ class FinanceBot:
         self.logging_middleware = LoggingMiddleware()
         self.metrics_middleware = MetricsMiddleware()
 
-        # Регулярные выражения для парсинга сообщений
-        self.expense_pattern = re.compile(
-            r"^-\s*(\d+(?:[.,]\d+)?(?:\s*\d+)*)\s*(?:руб(?:лей|\.)?|р\.)?\s*(.+)$"
+        # Встроенная таблица правил (src/categorization.py)
+        self.category_keywords = CATEGORY_KEYWORDS
+        self.keyword_priorities = KEYWORD_PRIORITIES
+        # Встроенные правила вместе с ключевыми словами категорий из БД
+        self.categorizer = CategorizationEngine(
+            self.category_keywords, self.keyword_priorities
         )
-        self.income_pattern = re.compile(
-            r"^\+\s*(\d+(?:[.,]\d+)?(?:\s*\d+)*)\s*(?:руб(?:лей|\.)?|р\.)?\s*(.+)$"
-        )
-
-        # Регулярное выражение для поиска ключевых слов категорий
-        self.category_keywords = {
-            "Продукты": [
-                "продукты",
-                "еда",
-                "магазин",
-                "супермаркет",
-                "вкусно и точка",
-                "ростикс",
-                "обед",
-                "ужин",
-                "завтрак",
-                "перекус",
-                "кофе",
-                "мартирос",
-                "вода",
-                "шоколадки",
-            ],
-            "Транспорт": [
-                "такси",
-                "метро",
-                "автобус",
-                "транспорт",
-                "дорога",
-                "проезд",
-                "мытищи",
-                "подлипки",
-                "маршрутка",
-                "электричка",
-                "до мытищ",
-            ],
-            "Жилье": [
-                "аренда",
-                "квартира",
-                "коммуналка",
-                "интернет",
-                "счета",
-                "жкх",
-                "ремонт",
-            ],
-            "Развлечения": [
-                "кино",
-                "ресторан",
-                "кафе",
-                "бар",
-                "концерт",
-                "развлечения",
-                "кинотеатр",
-                "театр",
-                "музей",
-            ],
-            "Здоровье": [
-                "лекарства",
-                "врач",
-                "аптека",
-                "медицина",
-                "больница",
-                "анализы",
-                "стоматолог",
-                "окулист",
-            ],
-            "Одежда": [
-                "одежда",
-                "обувь",
-                "магазин",
-                "куртка",
-                "брюки",
-                "рубашка",
-                "платье",
-                "кроссовки",
-            ],
-            "Образование": [
-                "курсы",
-                "обучение",
-                "книги",
-                "образование",
-                "тренинг",
-                "семинар",
-                "мастер-класс",
-            ],
-            "Техника": [
-                "техника",
-                "гаджеты",
-                "электроника",
-                "телефон",
-                "компьютер",
-                "ноутбук",
-                "планшет",
-            ],
-            "Подарки": [
-                "подарок",
-                "подарки",
-                "сувенир",
-                "поздравление",
-                "праздник",
-                "8 марта",
-                "пакеты для",
-                "шоколадки",
-            ],
-            "Связь": [
-                "телефон",
-                "связь",
-                "симка",
-                "симку",
-                "впн",
-                "vpn",
-                "интернет",
-                "роутер",
-                "модем",
-            ],
-        }
 
         # Состояния для ConversationHandler
         (
@@ -245,6 +157,21 @@ class FinanceBot:
         application.add_handler(CommandHandler("category", wrap_handler(self.category)))
         application.add_handler(CommandHandler("export", wrap_handler(self.export)))
         application.add_handler(CommandHandler("clean_db", wrap_handler(self.clean_db)))
+        application.add_handler(
+            CommandHandler("archive", wrap_handler(self.archive_transactions))
+        )
+        application.add_handler(
+            CommandHandler("reconcile", wrap_handler(self.reconcile))
+        )
+
+        # Выписки CSV/XLSX для импорта
+        application.add_handler(
+            MessageHandler(
+                filters.Document.FileExtension("csv")
+                | filters.Document.FileExtension("xlsx"),
+                wrap_handler(self.import_statement),
+            )
+        )
 
         # Регистрируем обработчик текстовых сообщений
         application.add_handler(
@@ -279,169 +206,136 @@ class FinanceBot:
         # Регистрируем обработчик ошибок
         application.add_error_handler(self.error_handler)
 
+    @writes
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         try:
             # Получаем информацию о пользователе
             user = update.effective_user
-            db = SessionLocal()
 
-            # Создаем запись о пользователе, если его нет в базе
-            db_user = db.query(User).filter(User.telegram_id == user.id).first()
-            if not db_user:
-                db_user = User(telegram_id=user.id)
-                db.add(db_user)
-                db.commit()
-                logger.info(LOG_NEW_USER.format(user_id=user.id))
+            async with AsyncSessionLocal() as db:
+                # Создаем запись о пользователе, если его нет в базе
+                _, created = await get_or_create_user_id(db, user.id)
+                if created:
+                    logger.info(LOG_NEW_USER.format(user_id=user.id))
 
             await update.message.reply_text(START_MESSAGE)
 
         except Exception as e:
             logger.error(LOG_START_ERROR, exc_info=e)
             await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
         await update.message.reply_text(HELP_MESSAGE)
 
-    def parse_amount(self, amount_str: str) -> float:
-        """Парсинг суммы с учетом пробелов и других символов"""
-        # Удаляем все нецифровые символы, кроме точки, запятой и пробелов
-        clean_str = "".join(c for c in amount_str if c.isdigit() or c in "., ")
-        # Удаляем все пробелы
-        clean_str = clean_str.replace(" ", "")
-        # Заменяем запятую на точку
-        clean_str = clean_str.replace(",", ".")
-        return float(clean_str)
-
-    def split_message(self, message: str) -> tuple[str, str]:
-        """Разделяет сообщение на сумму и описание"""
-        # Пропускаем знак +/- в начале
-        message = message[1:].strip()
-
-        # Ищем первое слово, которое не является частью суммы
-        parts = message.split()
-        amount_parts = []
-        description_parts = []
-
-        for part in parts:
-            # Если часть содержит цифры или является обозначением валюты
-            if any(c.isdigit() for c in part) or part.lower() in [
-                "руб",
-                "руб.",
-                "р.",
-                "рублей",
-            ]:
-                amount_parts.append(part)
-            else:
-                description_parts.append(part)
-                break
-
-        # Добавляем оставшиеся части к описанию
-        description_parts.extend(parts[len(amount_parts) + len(description_parts) :])
-
-        return " ".join(amount_parts), " ".join(description_parts)
-
-    def determine_category(self, description: str) -> str:
-        """Определение категории по описанию"""
-        # Сначала проверяем специальные случаи
-        if "8 марта" in description.lower():
-            return "Подарки"
-
-        # Затем проверяем обычные ключевые слова
-        for category, keywords in self.category_keywords.items():
-            if any(keyword.lower() in description.lower() for keyword in keywords):
-                return category
-        return CATEGORY_DEFAULT
+    def determine_category(
+        self, description: str, user_id: Optional[int] = None
+    ) -> str:
+        """Определение категории по описанию и исправлениям пользователя users.id"""
+        return self.categorizer.categorize(description, user_id)
+
+    def format_saved_batch(self, parsed, category_names) -> str:
+        """Общее подтверждение для операций из одного сообщения"""
+        lines = []
+        totals = {TransactionType.EXPENSE: 0.0, TransactionType.INCOME: 0.0}
+        for record, category_name in zip(parsed, category_names):
+            sign = "-" if record.type == TransactionType.EXPENSE else "+"
+            lines.append(
+                ADD_TRANSACTIONS_LINE.format(
+                    sign=sign,
+                    amount=record.amount,
+                    category=category_name,
+                    description=record.description,
+                )
+            )
+            totals[record.type] += record.amount
+
+        # Первые строки, сколько помещается в одно сообщение
+        listed = lines[:SAVED_BATCH_MAX_LINES]
+        while True:
+            hidden = len(lines) - len(listed)
+            more = [ADD_TRANSACTIONS_MORE.format(count=hidden)] if hidden else []
+            message = ADD_TRANSACTIONS_SAVED.format(
+                count=len(parsed),
+                lines="\n".join(listed + more),
+                expenses=totals[TransactionType.EXPENSE],
+                income=totals[TransactionType.INCOME],
+            )
+            if len(message) <= MessageLimit.MAX_TEXT_LENGTH or not listed:
+                return message
+            listed.pop()
 
+    @writes
     async def process_transaction_message(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
-        """Обработка сообщений о транзакциях в свободной форме"""
-        message = update.message.text.strip()
+        """
+        Обработка сообщений о транзакциях в свободной форме. Каждая строка
+        сообщения — отдельная операция; операции из одного сообщения
+        сохраняются одной транзакцией БД и подтверждаются одним ответом
+        """
         user_id = update.effective_user.id
 
-        # Проверяем, является ли сообщение расходом или доходом
-        is_expense = message.startswith("-")
-        is_income = message.startswith("+")
-
-        if not (is_expense or is_income):
+        try:
+            parsed = parse_message(update.message.text)
+        except ParseError as e:
+            if e.line > 1 or "\n" in update.message.text.strip():
+                await update.message.reply_text(
+                    ERROR_BATCH_LINE.format(line=e.line, error=e.message)
+                )
+            else:
+                await update.message.reply_text(e.message)
+            return
+        if not parsed:
             # Не транзакция, игнорируем
             return
 
         try:
-            # Если это расход или доход, парсим сообщение
-            amount_str, description = self.split_message(message)
-
-            if not description:
-                # Если нет описания, просим добавить его
-                await update.message.reply_text(ERROR_NO_DESCRIPTION)
-                return
-
-            # Парсим сумму
-            try:
-                amount = self.parse_amount(amount_str)
-            except ValueError:
-                await update.message.reply_text(ERROR_INVALID_AMOUNT)
-                return
-
-            # Определяем категорию
-            category_name = self.determine_category(description)
-
-            # Сохраняем транзакцию в базу данных
-            db = SessionLocal()
-
-            # Получаем или создаем пользователя
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            if not user:
-                user = User(telegram_id=user_id)
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-
-            # Получаем или создаем категорию
-            category = db.query(Category).filter(Category.name == category_name).first()
-            if not category:
-                # Если категория не найдена и это не "Без категории", создаем новую
-                if category_name != CATEGORY_DEFAULT:
-                    category = Category(name=category_name)
-                    db.add(category)
-                    db.commit()
-                    db.refresh(category)
-                else:
-                    # Если это "Без категории", получаем существующую или создаем
-                    category = (
-                        db.query(Category)
-                        .filter(Category.name == CATEGORY_DEFAULT)
-                        .first()
+            # Пользователь, его модель категорий и категории обычно уже в
+            # кэшах, запросы к БД и отдельный commit нужны только для новых
+            async with AsyncSessionLocal() as db:
+                db_user_id, _ = await get_or_create_user_id(db, user_id)
+                await self.categorizer.ensure_loaded(db, db_user_id)
+                category_names = [
+                    self.determine_category(record.description, db_user_id)
+                    for record in parsed
+                ]
+                category_ids = [
+                    await category_registry.get_or_create(db, name)
+                    for name in category_names
+                ]
+                await db.commit()
+
+            # Операции пишутся общей пачкой; подтверждаем после её commit
+            now = datetime.now()
+            transactions = await write_batcher.add_transactions(
+                [
+                    dict(
+                        user_id=db_user_id,
+                        amount=record.amount,
+                        description=record.description,
+                        category_id=category_id,
+                        type=record.type,
+                        created_at=now,
                     )
-                    if not category:
-                        category = Category(name=CATEGORY_DEFAULT)
-                        db.add(category)
-                        db.commit()
-                        db.refresh(category)
-
-                # Создаем транзакцию
-            transaction_type = (
-                TransactionType.EXPENSE if is_expense else TransactionType.INCOME
+                    for record, category_id in zip(parsed, category_ids)
+                ]
             )
 
-            transaction = Transaction(
-                user_id=user.id,
-                amount=amount,
-                description=description,
-                category_id=category.id,
-                type=transaction_type,
-                created_at=datetime.now(),
-            )
+            if len(parsed) > 1:
+                await update.message.reply_text(
+                    self.format_saved_batch(parsed, category_names)
+                )
+                return
 
-            db.add(transaction)
-            db.commit()
+            (transaction,) = transactions
+            (record,) = parsed
+            category_name = category_names[0]
 
             # Предлагаем изменить категорию, если это нужно
-            categories = db.query(Category).all()
+            await category_registry.ensure_loaded()
+            categories = category_registry.all()
 
             # Создаем клавиатуру с кнопками категорий
             keyboard = []
@@ -449,29 +343,27 @@ class FinanceBot:
                 row = []
                 for j in range(2):
                     if i + j < len(categories):
-                        cat = categories[i + j]
+                        cat_id, cat_name = categories[i + j]
                         # В callback data сохраняем id категории и id транзакции
                         row.append(
                             InlineKeyboardButton(
-                                cat.name,
-                                callback_data=f"category:{cat.id}:{transaction.id}",
+                                cat_name,
+                                callback_data=f"category:{cat_id}:{transaction.id}",
                             )
                         )
                 if row:
                     keyboard.append(row)
 
-            db.close()
-
             reply_markup = InlineKeyboardMarkup(keyboard)
 
             # Отправляем сообщение с подтверждением
-            sign = "-" if transaction_type == TransactionType.EXPENSE else "+"
+            sign = "-" if record.type == TransactionType.EXPENSE else "+"
             await update.message.reply_text(
                 ADD_TRANSACTION_SAVED.format(
                     sign=sign,
-                    amount=amount,
+                    amount=record.amount,
                     category=category_name,
-                    description=description,
+                    description=record.description,
                 ),
                 reply_markup=reply_markup,
             )
@@ -493,39 +385,67 @@ class FinanceBot:
             user_id = int(data[2])
             return await self.set_category_for_transaction(query, category_id, user_id)
         elif action == "clean_db_confirm":
+            # Кнопку мог прислать не администратор: проверяем права повторно
+            if query.from_user.id not in self.admin_ids:
+                await query.edit_message_text(CLEAN_DB_NOT_ADMIN)
+                return
+
             days = int(data[1])
             # Получаем дату, старше которой будем удалять транзакции
             cutoff_date = datetime.now() - timedelta(days=days)
 
-            db = SessionLocal()
-            try:
-                # Получаем количество старых транзакций
-                old_transactions = (
-                    db.query(Transaction)
-                    .filter(Transaction.created_at < cutoff_date)
-                    .all()
+            # Прогресс показываем в том же сообщении, но не чаще раза в
+            # purge.PROGRESS_INTERVAL секунд: Telegram ограничивает правки
+            last_edit = 0.0
+
+            async def report_progress(deleted: int, total: int):
+                nonlocal last_edit
+                now = time.monotonic()
+                if deleted < total and now - last_edit < purge.PROGRESS_INTERVAL:
+                    return
+                last_edit = now
+                await query.edit_message_text(
+                    CLEAN_DB_PROGRESS.format(days=days, deleted=deleted, total=total)
                 )
 
-                if not old_transactions:
+            try:
+                count = await purge.purge_before(cutoff_date, progress=report_progress)
+                if not count:
                     await query.edit_message_text(
                         CLEAN_DB_NO_OLD_TRANSACTIONS.format(days=days)
                     )
                     return
 
-                # Удаляем старые транзакции
-                count = len(old_transactions)
-                for transaction in old_transactions:
-                    db.delete(transaction)
-                db.commit()
-
                 await query.edit_message_text(
                     CLEAN_DB_SUCCESS.format(count=count, days=days)
                 )
+
+                pages = await purge.reclaim_space()
+                logger.info(LOG_CLEAN_DB_VACUUM.format(pages=pages))
+            except Exception as e:
+                logger.error(LOG_CLEAN_DB_ERROR, exc_info=e)
+                await query.edit_message_text(ERROR_GENERAL)
+        elif action == "history":
+            # history:<период>:<before|after>:<день> — следующая страница
+            try:
+                _, period, direction, day = data
+                async with AsyncSessionLocal() as db:
+                    user_id = await get_user_id(db, query.from_user.id)
+                if user_id is None or period not in HISTORY_PERIODS:
+                    await query.edit_message_text(ERROR_NOT_STARTED)
+                    return
+
+                day = date.fromisoformat(day)
+                message, reply_markup = await self.history_page(
+                    user_id,
+                    period,
+                    before=day if direction == "before" else None,
+                    after=day if direction == "after" else None,
+                )
+                await query.edit_message_text(message, reply_markup=reply_markup)
             except Exception as e:
-                logger.error(f"Ошибка при очистке БД: {e}")
+                logger.error(LOG_HISTORY_ERROR, exc_info=e)
                 await query.edit_message_text(ERROR_GENERAL)
-            finally:
-                db.close()
         elif action == "clean_db_cancel":
             await query.edit_message_text(CLEAN_DB_CANCELLED)
 
@@ -592,28 +512,25 @@ class FinanceBot:
 
         self.user_data[user_id]["description"] = description
 
-        # Автоматическое определение категории
-        category = CATEGORY_DEFAULT
-        for cat, keywords in self.category_keywords.items():
-            if any(keyword.lower() in description.lower() for keyword in keywords):
-                category = cat
-                break
+        # Автоматическое определение категории; реестр нужен и для кнопок
+        async with AsyncSessionLocal() as db:
+            db_user_id = await get_user_id(db, user_id)
+            await self.categorizer.ensure_loaded(db, db_user_id)
+        category = self.determine_category(description, db_user_id)
 
         # Предлагаем пользователю выбрать или подтвердить категорию
         keyboard = []
         row = []
 
-        # Получаем все категории из базы данных
-        db = SessionLocal()
-        categories = db.query(Category).all()
-        db.close()
+        # Получаем все категории из реестра
+        categories = category_registry.all()
 
-        for i, cat in enumerate(categories):
+        for i, (cat_id, cat_name) in enumerate(categories):
             # Создаем кнопки по 3 в ряд
             row.append(
                 InlineKeyboardButton(
-                    f"{'✓ ' if cat.name == category else ''}{cat.name}",
-                    callback_data=f"cat:{cat.id}",
+                    f"{'✓ ' if cat_name == category else ''}{cat_name}",
+                    callback_data=f"cat:{cat_id}",
                 )
             )
 
@@ -630,6 +547,7 @@ class FinanceBot:
 
         return self.CHOOSING_CATEGORY
 
+    @writes
     async def category_choice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка выбора категории"""
         query = update.callback_query
@@ -639,22 +557,17 @@ class FinanceBot:
         data = query.data.split(":")
         category_id = int(data[1])
 
-        # Получаем категорию из базы данных
-        db = SessionLocal()
-        category = db.query(Category).filter(Category.id == category_id).first()
+        # Получаем категорию из реестра
+        await category_registry.ensure_loaded()
+        category_name = category_registry.get_name(category_id)
 
-        if not category:
+        if not category_name:
             await query.edit_message_text(ERROR_CATEGORY_NOT_FOUND)
-            db.close()
             return self.CHOOSING_CATEGORY
 
-        # Получаем пользователя или создаем нового
-        user = db.query(User).filter(User.telegram_id == user_id).first()
-        if not user:
-            user = User(telegram_id=user_id)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+        async with AsyncSessionLocal() as db:
+            # Получаем пользователя или создаем нового
+            db_user_id, _ = await get_or_create_user_id(db, user_id)
 
         # Создаем транзакцию
         transaction_type = (
@@ -665,19 +578,15 @@ class FinanceBot:
         amount = self.user_data[user_id]["amount"]
         description = self.user_data[user_id]["description"]
 
-        transaction = Transaction(
-            user_id=user.id,
+        await write_batcher.add_transaction(
+            user_id=db_user_id,
             amount=amount,
             description=description,
-            category_id=category.id,
+            category_id=category_id,
             type=transaction_type,
             created_at=datetime.now(),
         )
 
-        db.add(transaction)
-        db.commit()
-        db.close()
-
         # Очищаем данные пользователя
         del self.user_data[user_id]
 
@@ -687,7 +596,7 @@ class FinanceBot:
             ADD_TRANSACTION_SAVED.format(
                 sign=sign,
                 amount=amount,
-                category=category.name,
+                category=category_name,
                 description=description,
             )
         )
@@ -706,41 +615,19 @@ class FinanceBot:
         await update.message.reply_text(ADD_TRANSACTION_CANCELLED)
         return ConversationHandler.END
 
+    @reads
     async def balance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать текущий баланс пользователя"""
         try:
-            db = SessionLocal()
-            user = (
-                db.query(User)
-                .filter(User.telegram_id == update.effective_user.id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                user_id = await get_user_id(db, update.effective_user.id)
 
-            if not user:
-                await update.message.reply_text(ERROR_NOT_STARTED)
-                return
+                if user_id is None:
+                    await update.message.reply_text(ERROR_NOT_STARTED)
+                    return
 
-            # Получаем сумму доходов
-            income = (
-                db.query(func.sum(Transaction.amount))
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.type == TransactionType.INCOME,
-                )
-                .scalar()
-                or 0
-            )
-
-            # Получаем сумму расходов
-            expenses = (
-                db.query(func.sum(Transaction.amount))
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.type == TransactionType.EXPENSE,
-                )
-                .scalar()
-                or 0
-            )
+                # Итоги хранятся в user_balances: одна строка вместо SUM по истории
+                income, expenses = await aggregates.get_balance(db, user_id)
 
             balance = income - expenses
 
@@ -753,177 +640,185 @@ class FinanceBot:
         except Exception as e:
             logger.error(LOG_BALANCE_ERROR, exc_info=e)
             await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
 
+    @reads
     async def history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать историю транзакций"""
         try:
-            db = SessionLocal()
-            user = (
-                db.query(User)
-                .filter(User.telegram_id == update.effective_user.id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                user_id = await get_user_id(db, update.effective_user.id)
 
-            if not user:
+            if user_id is None:
                 await update.message.reply_text(ERROR_NOT_STARTED)
                 return
 
             # Определяем период из аргументов команды
             period = "месяц"  # По умолчанию
-            page = 1
-            page_size = 10
-
             if context.args:
                 for arg in context.args:
-                    if arg.lower() in ["день", "неделя", "месяц", "год"]:
+                    if arg.lower() in HISTORY_PERIODS:
                         period = arg.lower()
-                    elif arg.startswith("page="):
-                        try:
-                            page = int(arg.split("=")[1])
-                        except ValueError:
-                            pass
 
-            # Определяем начальную дату периода
-            now = datetime.utcnow()
-            if period == "день":
-                start_date = now - timedelta(days=1)
-                period_name = PERIOD_DAY
-            elif period == "неделя":
-                start_date = now - timedelta(weeks=1)
-                period_name = PERIOD_WEEK
-            elif period == "месяц":
-                start_date = now - timedelta(days=30)
-                period_name = PERIOD_MONTH
-            elif period == "год":
-                start_date = now - timedelta(days=365)
-                period_name = PERIOD_YEAR
+            message, reply_markup = await self.history_page(user_id, period)
+            await update.message.reply_text(message, reply_markup=reply_markup)
 
-            # Получаем транзакции за период
-            transactions = (
-                db.query(Transaction)
-                .filter(
-                    Transaction.user_id == user.id, Transaction.created_at >= start_date
-                )
-                .order_by(Transaction.created_at.desc())
-                .all()
-            )
-
-            if not transactions:
-                await update.message.reply_text(
-                    HISTORY_EMPTY.format(period=period_name)
-                )
-                return
+        except Exception as e:
+            logger.error(LOG_HISTORY_ERROR, exc_info=e)
+            await update.message.reply_text(ERROR_GENERAL)
 
-            # Группируем транзакции по дням
-            transactions_by_day = {}
-            for t in transactions:
-                day = t.created_at.date()
-                if day not in transactions_by_day:
-                    transactions_by_day[day] = {
-                        "transactions": [],
-                        "income": 0,
-                        "expenses": 0,
-                    }
-                transactions_by_day[day]["transactions"].append(t)
-                if t.type == TransactionType.INCOME:
-                    transactions_by_day[day]["income"] += t.amount
-                else:
-                    transactions_by_day[day]["expenses"] += t.amount
+    @reads
+    async def history_page(self, user_id: int, period: str, before=None, after=None):
+        """
+        Страница истории: до HISTORY_PAGE_DAYS дней с операциями раньше дня
+        before или позже дня after. Из БД читаются только операции этих
+        дней, итоги берутся из дневных сводок. Возвращает текст и кнопки
+        """
+        length, period_name = HISTORY_PERIODS[period]
+        start_date = datetime.utcnow() - length
+
+        # Неполный первый день периода может быть уже в архиве
+        first_day_archived = await archive.read_first_day(user_id, start_date)
+
+        async with AsyncSessionLocal() as db:
+            # На день больше, чтобы узнать, есть ли следующая страница
+            days = await aggregates.active_days(
+                db,
+                user_id,
+                start_date,
+                HISTORY_PAGE_DAYS + 1,
+                before=before,
+                after=after,
+                archived=first_day_archived,
+            )
+            if not days:
+                return HISTORY_EMPTY.format(period=period_name), None
 
-            # Сортируем дни по убыванию
-            sorted_days = sorted(transactions_by_day.keys(), reverse=True)
+            has_more = len(days) > HISTORY_PAGE_DAYS
+            if after is None:
+                days = days[:HISTORY_PAGE_DAYS]
+                has_newer, has_older = before is not None, has_more
+            else:
+                days = days[-HISTORY_PAGE_DAYS:]
+                has_newer, has_older = has_more, True
 
-            # Подсчитываем общие суммы за период
-            total_income = sum(
-                day_data["income"] for day_data in transactions_by_day.values()
+            # Границы страницы: от начала самого старого дня до конца самого нового
+            page_start = max(
+                start_date, datetime.combine(days[-1], datetime.min.time())
             )
-            total_expenses = sum(
-                day_data["expenses"] for day_data in transactions_by_day.values()
+            page_end = datetime.combine(
+                days[0] + timedelta(days=1), datetime.min.time()
             )
+            archived = await archive.read_archived(user_id, page_start, page_end)
 
-            # Готовим сообщение
-            message = HISTORY_HEADER.format(period=period_name)
-            message += HISTORY_SUMMARY.format(
-                total_income=total_income,
-                total_expenses=total_expenses,
-                balance=total_income - total_expenses,
+            # Общие итоги периода и итоги по дням страницы — из дневных сводок
+            total_income, total_expenses, _ = await aggregates.period_totals(
+                db, user_id, start_date, first_day_archived
+            )
+            totals_by_day = await aggregates.daily_totals(
+                db, user_id, page_start, archived, end=days[0]
             )
 
-            # Пагинация
-            total_pages = (len(sorted_days) + page_size - 1) // page_size
-            page = min(max(1, page), total_pages)
-            start_idx = (page - 1) * page_size
-            end_idx = start_idx + page_size
-            current_days = sorted_days[start_idx:end_idx]
-
-            # Добавляем транзакции по дням
-            for day in current_days:
-                day_data = transactions_by_day[day]
-                message += HISTORY_DAY_HEADER.format(
-                    date=day.strftime("%d.%m.%Y"),
-                    income=day_data["income"],
-                    expenses=day_data["expenses"],
-                )
+            transactions = await repository.transactions_between(
+                db, user_id, page_start, page_end
+            )
+        transactions = archive.merge(transactions, archived)
+        await category_registry.ensure_loaded()
+
+        # Группируем транзакции по дням
+        transactions_by_day = {}
+        for t in transactions:
+            day = t.created_at.date()
+            if day not in transactions_by_day:
+                totals = totals_by_day.get(day, {})
+                transactions_by_day[day] = {
+                    "transactions": [],
+                    "income": totals.get("income", 0),
+                    "expenses": totals.get("expenses", 0),
+                }
+            transactions_by_day[day]["transactions"].append(t)
+
+        # Дни страницы по убыванию
+        current_days = [day for day in days if day in transactions_by_day]
+
+        # Готовим сообщение
+        message = HISTORY_HEADER.format(period=period_name)
+        message += HISTORY_SUMMARY.format(
+            total_income=total_income,
+            total_expenses=total_expenses,
+            balance=total_income - total_expenses,
+        )
 
-                # Группировка одинаковых транзакций
-                grouped_transactions = {}
-                for t in day_data["transactions"]:
-                    category = t.category.name if t.category else CATEGORY_DEFAULT
-                    # Ключ для группировки: тип, сумма, описание, категория
-                    key = (t.type, t.amount, t.description, category)
-                    if key in grouped_transactions:
-                        grouped_transactions[key]["count"] += 1
-                    else:
-                        grouped_transactions[key] = {
-                            "transaction": t,
-                            "count": 1,
-                            "category": category,
-                        }
-
-                # Выводим транзакции (с учетом группировки)
-                for key, group in grouped_transactions.items():
-                    t = group["transaction"]
-                    category = group["category"]
-                    count = group["count"]
-
-                    # Если это единичная транзакция
-                    if count == 1:
-                        message += HISTORY_TRANSACTION.format(
-                            emoji="-" if t.type == TransactionType.EXPENSE else "+",
-                            amount=t.amount,
-                            description=t.description,
-                            category=category,
-                        )
-                    else:
-                        # Если это группа одинаковых транзакций
-                        message += HISTORY_TRANSACTION_GROUP.format(
-                            emoji="—" if t.type == TransactionType.EXPENSE else " +",
-                            amount=t.amount,
-                            description=t.description,
-                            category=category,
-                            count=count,
-                        )
+        # Добавляем транзакции по дням
+        for day in current_days:
+            day_data = transactions_by_day[day]
+            message += HISTORY_DAY_HEADER.format(
+                date=day.strftime("%d.%m.%Y"),
+                income=day_data["income"],
+                expenses=day_data["expenses"],
+            )
 
-                # Убираем пустую строку после каждого дня
-                if day != current_days[-1]:  # Если не последний день
-                    message += "\n"
+            # Группировка одинаковых транзакций
+            grouped_transactions = {}
+            for t in day_data["transactions"]:
+                category = category_registry.get_name(t.category_id) or CATEGORY_DEFAULT
+                # Ключ для группировки: тип, сумма, описание, категория
+                key = (t.type, t.amount, t.description, category)
+                if key in grouped_transactions:
+                    grouped_transactions[key]["count"] += 1
+                else:
+                    grouped_transactions[key] = {
+                        "transaction": t,
+                        "count": 1,
+                        "category": category,
+                    }
 
-            # Добавляем информацию о пагинации
-            if total_pages > 1:
-                message += HISTORY_PAGINATION.format(
-                    current_page=page, total_pages=total_pages
-                )
+            # Выводим транзакции (с учетом группировки)
+            for key, group in grouped_transactions.items():
+                t = group["transaction"]
+                category = group["category"]
+                count = group["count"]
+
+                # Если это единичная транзакция
+                if count == 1:
+                    message += HISTORY_TRANSACTION.format(
+                        emoji="-" if t.type == TransactionType.EXPENSE else "+",
+                        amount=t.amount,
+                        description=t.description,
+                        category=category,
+                    )
+                else:
+                    # Если это группа одинаковых транзакций
+                    message += HISTORY_TRANSACTION_GROUP.format(
+                        emoji="—" if t.type == TransactionType.EXPENSE else " +",
+                        amount=t.amount,
+                        description=t.description,
+                        category=category,
+                        count=count,
+                    )
 
-            await update.message.reply_text(message)
+            # Убираем пустую строку после каждого дня
+            if day != current_days[-1]:  # Если не последний день
+                message += "\n"
 
-        except Exception as e:
-            logger.error(LOG_HISTORY_ERROR, exc_info=e)
-            await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
+        # Кнопки листания несут ключ страницы: день, от которого читать дальше
+        buttons = []
+        if has_newer:
+            buttons.append(
+                InlineKeyboardButton(
+                    HISTORY_NEWER,
+                    callback_data=f"history:{period}:after:{days[0].isoformat()}",
+                )
+            )
+        if has_older:
+            buttons.append(
+                InlineKeyboardButton(
+                    HISTORY_OLDER,
+                    callback_data=f"history:{period}:before:{days[-1].isoformat()}",
+                )
+            )
+        return message, InlineKeyboardMarkup([buttons]) if buttons else None
 
+    @reads
     async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статистику за период"""
         try:
@@ -931,14 +826,10 @@ class FinanceBot:
             if context.args:
                 period = context.args[0].lower()
 
-            db = SessionLocal()
-            user = (
-                db.query(User)
-                .filter(User.telegram_id == update.effective_user.id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                user_id = await get_user_id(db, update.effective_user.id)
 
-            if not user:
+            if user_id is None:
                 await update.message.reply_text(ERROR_NOT_STARTED)
                 return
 
@@ -960,43 +851,29 @@ class FinanceBot:
                 await update.message.reply_text(SYSTEM_INVALID_PERIOD)
                 return
 
-            # Получаем статистику
-            income = (
-                db.query(func.sum(Transaction.amount))
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.type == TransactionType.INCOME,
-                    Transaction.created_at >= start_date,
-                )
-                .scalar()
-                or 0
-            )
+            # Неполный первый день периода может быть уже в архиве
+            archived = await archive.read_first_day(user_id, start_date)
+            # Реестр загружается до сессии: обновление берет свое соединение
+            # из пула чтения, и держать два сразу нельзя
+            await category_registry.ensure_loaded()
 
-            expenses = (
-                db.query(func.sum(Transaction.amount))
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.type == TransactionType.EXPENSE,
-                    Transaction.created_at >= start_date,
+            async with AsyncSessionLocal() as db:
+                # Получаем статистику из дневных сводок
+                income, expenses, by_category = await aggregates.period_totals(
+                    db, user_id, start_date, archived
                 )
-                .scalar()
-                or 0
-            )
 
-            # Топ категорий расходов
-            top_expenses = (
-                db.query(Category.name, func.sum(Transaction.amount).label("total"))
-                .join(Transaction.category)
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.type == TransactionType.EXPENSE,
-                    Transaction.created_at >= start_date,
-                )
-                .group_by(Category.name)
-                .order_by(func.sum(Transaction.amount).desc())
-                .limit(5)
-                .all()
-            )
+                # Топ категорий расходов
+                top_ids = sorted(
+                    (cid for cid in by_category if cid != aggregates.NO_CATEGORY),
+                    key=by_category.get,
+                    reverse=True,
+                )[:5]
+                top_expenses = [
+                    (category_registry.get_name(cid), by_category[cid])
+                    for cid in top_ids
+                    if category_registry.get_name(cid)
+                ]
 
             # Формируем сообщение о категориях
             categories_message = ""
@@ -1020,32 +897,18 @@ class FinanceBot:
         except Exception as e:
             logger.error(LOG_STATS_ERROR, exc_info=e)
             await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
 
+    @reads
     async def total(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать общую сумму расходов и доходов группы"""
         try:
-            db = SessionLocal()
-
-            # Получаем общую сумму доходов всех пользователей
-            total_income = (
-                db.query(func.sum(Transaction.amount))
-                .filter(Transaction.type == TransactionType.INCOME)
-                .scalar()
-                or 0
-            )
+            # Общие суммы и число пользователей хранятся в global_counters
+            async with AsyncSessionLocal() as db:
+                counters = await aggregates.get_counters(db)
 
-            # Получаем общую сумму расходов всех пользователей
-            total_expenses = (
-                db.query(func.sum(Transaction.amount))
-                .filter(Transaction.type == TransactionType.EXPENSE)
-                .scalar()
-                or 0
-            )
-
-            # Получаем количество пользователей
-            users_count = db.query(User).count()
+            users_count = int(counters[aggregates.COUNTER_USERS])
+            total_income = counters[aggregates.COUNTER_INCOME]
+            total_expenses = counters[aggregates.COUNTER_EXPENSE]
 
             # Формируем сообщение
             message = TOTAL_STATS.format(
@@ -1062,24 +925,23 @@ class FinanceBot:
         except Exception as e:
             logger.error(LOG_TOTAL_ERROR, exc_info=e)
             await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
 
+    @reads
     async def category(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать статистику по конкретной категории"""
         try:
             if not context.args:
                 # Показываем список всех категорий
-                db = SessionLocal()
-                categories = db.query(Category).all()
+                await category_registry.ensure_loaded()
+                categories = category_registry.all()
 
                 if not categories:
                     await update.message.reply_text(CATEGORY_NO_CATEGORIES)
                     return
 
                 message = CATEGORY_LIST_HEADER
-                for cat in categories:
-                    message += CATEGORY_LIST_ITEM.format(name=cat.name)
+                for _, cat_name in categories:
+                    message += CATEGORY_LIST_ITEM.format(name=cat_name)
 
                 message += CATEGORY_LIST_FOOTER
 
@@ -1089,73 +951,69 @@ class FinanceBot:
             # Получаем название категории из аргументов
             category_name = " ".join(context.args)
 
-            db = SessionLocal()
-            # Ищем категорию
-            category = (
-                db.query(Category).filter(Category.name.ilike(category_name)).first()
-            )
+            # Ищем категорию без учета регистра
+            await category_registry.ensure_loaded()
+            category_id = category_registry.find(category_name)
 
-            if not category:
-                await query.edit_message_text(
+            if category_id is None:
+                await update.message.reply_text(
                     CATEGORY_NOT_FOUND.format(name=category_name)
                 )
-                db.close()
                 return
+            category_name = category_registry.get_name(category_id)
 
-            # Получаем статистику по категории для текущего пользователя
-            user = (
-                db.query(User)
-                .filter(User.telegram_id == update.effective_user.id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                # Получаем статистику по категории для текущего пользователя
+                user_id = await get_user_id(db, update.effective_user.id)
 
-            if not user:
-                await update.message.reply_text(
-                    "Пожалуйста, запустите бота командой /start"
+                if user_id is None:
+                    await update.message.reply_text(
+                        "Пожалуйста, запустите бота командой /start"
+                    )
+                    return
+
+                # Итоги по категории берем из дневных сводок
+                totals = await aggregates.category_totals(db, user_id, category_id)
+
+                # Последние 5 операций пользователя в этой категории
+                transactions = await repository.category_transactions(
+                    db, user_id, category_id, 5
                 )
-                return
 
-            # Получаем транзакции пользователя в этой категории
-            transactions = (
-                db.query(Transaction)
-                .filter(
-                    Transaction.user_id == user.id,
-                    Transaction.category_id == category.id,
+            # Остальное добираем из архива
+            if len(transactions) < 5:
+                archived = await archive.read_archived(
+                    user_id, category_id=category_id, limit=5
                 )
-                .order_by(Transaction.created_at.desc())
-                .all()
-            )
+                transactions = archive.merge(transactions, archived)[:5]
 
-            if not transactions:
+            total_expenses, expense_count = totals.get(TransactionType.EXPENSE, (0, 0))
+            total_incomes, income_count = totals.get(TransactionType.INCOME, (0, 0))
+            total_count = expense_count + income_count
+
+            if not total_count:
                 await update.message.reply_text(
-                    CATEGORY_NO_TRANSACTIONS.format(name=category.name)
+                    CATEGORY_NO_TRANSACTIONS.format(name=category_name)
                 )
                 return
 
             # Считаем статистику
-            total_amount = sum(t.amount for t in transactions)
-            avg_amount = total_amount / len(transactions)
-
-            # Разделяем на доходы и расходы
-            expenses = [t for t in transactions if t.type == TransactionType.EXPENSE]
-            incomes = [t for t in transactions if t.type == TransactionType.INCOME]
-
-            total_expenses = sum(t.amount for t in expenses)
-            total_incomes = sum(t.amount for t in incomes)
+            total_amount = total_expenses + total_incomes
+            avg_amount = total_amount / total_count
 
             message = CATEGORY_STATS.format(
-                name=category.name,
-                total=len(transactions),
+                name=category_name,
+                total=total_count,
                 total_amount=total_amount,
                 avg_amount=avg_amount,
                 expenses=total_expenses,
-                expense_count=len(expenses),
+                expense_count=expense_count,
                 incomes=total_incomes,
-                income_count=len(incomes),
+                income_count=income_count,
             )
 
             # Добавляем последние 5 операций
-            for t in transactions[:5]:
+            for t in transactions:
                 operation = "📉" if t.type == TransactionType.EXPENSE else "📈"
                 message += CATEGORY_TRANSACTION.format(
                     emoji=operation,
@@ -1171,129 +1029,112 @@ class FinanceBot:
             await update.message.reply_text(
                 "Произошла ошибка при получении статистики по категории"
             )
-        finally:
-            db.close()
 
+    @reads
     async def export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Экспорт истории транзакций в Excel"""
         try:
-            db = SessionLocal()
-            user = (
-                db.query(User)
-                .filter(User.telegram_id == update.effective_user.id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                user_id = await get_user_id(db, update.effective_user.id)
 
-            if not user:
+            if user_id is None:
                 await update.message.reply_text(
                     "Пожалуйста, запустите бота командой /start"
                 )
                 return
 
-            # Получаем все транзакции пользователя
-            transactions = (
-                db.query(Transaction)
-                .filter(Transaction.user_id == user.id)
-                .order_by(Transaction.created_at.desc())
-                .all()
-            )
+            # Выгрузка читает через свой пул и не занимает пул чтения;
+            # реестр категорий загружается до того, как взято соединение
+            async def write(path):
+                await category_registry.ensure_loaded()
+                categories = dict(category_registry.all())
+                async with ExportSessionLocal() as db:
+                    return await export.export_transactions(
+                        db, user_id, path, categories
+                    )
 
-            if not transactions:
-                await update.message.reply_text(EXPORT_EMPTY)
-                return
+            # Книга пишется во временный файл в пуле выгрузок; повторный
+            # /export во время выгрузки получает тот же файл
+            async with export.export_pool.export(user_id, write) as (count, path):
+                if not count:
+                    await update.message.reply_text(EXPORT_EMPTY)
+                    return
 
-            # Создаем новую книгу Excel
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Транзакции"
+                # Отправляем файл
+                with open(path, "rb") as document:
+                    await update.message.reply_document(
+                        document=document,
+                        filename=f"transactions_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                        caption=EXPORT_CAPTION,
+                    )
 
-            # Определяем стили
-            header_font = Font(bold=True)
-            header_fill = PatternFill(
-                start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"
-            )
-            border = Border(
-                left=Side(style="thin"),
-                right=Side(style="thin"),
-                top=Side(style="thin"),
-                bottom=Side(style="thin"),
-            )
+        except Exception as e:
+            logger.error(LOG_TRANSACTION_ERROR, exc_info=e)
+            await update.message.reply_text(ERROR_GENERAL)
 
-            # Записываем заголовки
-            for col, header in enumerate(EXPORT_HEADERS, 1):
-                cell = ws.cell(row=1, column=col)
-                cell.value = header
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.border = border
-                cell.alignment = Alignment(horizontal="center")
-
-            # Записываем данные
-            for row, t in enumerate(transactions, 2):
-                # Дата
-                ws.cell(
-                    row=row, column=1, value=t.created_at.strftime("%d.%m.%Y %H:%M")
-                )
+    @writes
+    async def import_statement(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """Импорт выписки из присланного файла CSV или XLSX"""
+        document = update.message.document
+        suffix = Path(document.file_name or "").suffix.lower()
+        if suffix not in statement_import.READERS:
+            await update.message.reply_text(IMPORT_UNSUPPORTED_FORMAT)
+            return
 
-                # Тип
-                transaction_type = (
-                    EXPORT_TRANSACTION_TYPE_EXPENSE
-                    if t.type == TransactionType.EXPENSE
-                    else EXPORT_TRANSACTION_TYPE_INCOME
-                )
-                ws.cell(row=row, column=2, value=transaction_type)
+        try:
+            async with AsyncSessionLocal() as db:
+                user_id, _ = await get_or_create_user_id(db, update.effective_user.id)
+                await self.categorizer.ensure_loaded(db, user_id)
+                await db.commit()
 
-                # Сумма с форматированием в зависимости от типа
-                amount_cell = ws.cell(row=row, column=3, value=t.amount)
-                if t.type == TransactionType.EXPENSE:
-                    amount_cell.font = Font(color="FF0000")  # Красный для расходов
-                else:
-                    amount_cell.font = Font(color="008000")  # Зеленый для доходов
+            message = await update.message.reply_text(
+                IMPORT_PROGRESS.format(imported=0, duplicates=0, skipped=0)
+            )
 
-                # Описание
-                ws.cell(row=row, column=4, value=t.description)
+            # Как и в /clean_db, правим сообщение не чаще PROGRESS_INTERVAL
+            last_edit = time.monotonic()
 
-                # Категория
-                ws.cell(
-                    row=row,
-                    column=5,
-                    value=t.category.name if t.category else CATEGORY_DEFAULT,
+            async def report_progress(imported: int, duplicates: int, skipped: int):
+                nonlocal last_edit
+                now = time.monotonic()
+                if now - last_edit < purge.PROGRESS_INTERVAL:
+                    return
+                last_edit = now
+                await message.edit_text(
+                    IMPORT_PROGRESS.format(
+                        imported=imported, duplicates=duplicates, skipped=skipped
+                    )
                 )
 
-                # Добавляем границы для всех ячеек
-                for col in range(1, 6):
-                    ws.cell(row=row, column=col).border = border
-
-            # Автоматическая ширина столбцов
-            for col in ws.columns:
-                max_length = 0
-                column = col[0].column_letter
-                for cell in col:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = max_length + 2
-                ws.column_dimensions[column].width = adjusted_width
-
-            # Сохраняем в буфер
-            excel_buffer = BytesIO()
-            wb.save(excel_buffer)
-            excel_buffer.seek(0)
-
-            # Отправляем файл
-            await update.message.reply_document(
-                document=excel_buffer,
-                filename=f"transactions_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                caption=EXPORT_CAPTION,
-            )
+            # Файл сохраняется на диск и читается оттуда порциями
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / f"statement{suffix}"
+                telegram_file = await document.get_file()
+                await telegram_file.download_to_drive(path)
+                try:
+                    result = await statement_import.import_statement(
+                        user_id,
+                        statement_import.parse_statement(
+                            statement_import.read_statement(path)
+                        ),
+                        lambda description: self.determine_category(
+                            description, user_id
+                        ),
+                        AsyncSessionLocal,
+                        progress=report_progress,
+                    )
+                except statement_import.StatementError as e:
+                    await message.edit_text(str(e))
+                    return
+
+            await message.edit_text(IMPORT_SUCCESS.format(**result._asdict()))
+            logger.info(LOG_IMPORT_DONE.format(user_id=user_id, **result._asdict()))
 
         except Exception as e:
-            logger.error(LOG_TRANSACTION_ERROR, exc_info=e)
+            logger.error(LOG_IMPORT_ERROR, exc_info=e)
             await update.message.reply_text(ERROR_GENERAL)
-        finally:
-            db.close()
 
     async def error_handler(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
@@ -1311,35 +1152,41 @@ class FinanceBot:
         except Exception as e:
             logger.error(LOG_ERROR_MESSAGE_ERROR.format(error=e), exc_info=True)
 
+    @writes
     async def set_category_for_transaction(self, query, category_id, transaction_id):
         """Устанавливает категорию для транзакции после выбора пользователем"""
-        db = None
         try:
-            db = SessionLocal()
-            transaction = (
-                db.query(Transaction).filter(Transaction.id == transaction_id).first()
-            )
-            category = db.query(Category).filter(Category.id == category_id).first()
+            async with AsyncSessionLocal() as db:
+                transaction = await db.get(Transaction, transaction_id)
+                await category_registry.ensure_loaded()
+                category_name = category_registry.get_name(category_id)
 
-            if not transaction or not category:
-                await query.edit_message_text(ERROR_CATEGORY_NOT_FOUND)
-                return
+                if not transaction or not category_name:
+                    await query.edit_message_text(ERROR_CATEGORY_NOT_FOUND)
+                    return
 
-            # Обновляем категорию
-            transaction.category_id = category.id
-            db.commit()
+                # Обновляем категорию и переносим сумму между дневными сводками
+                old_category_id = transaction.category_id
+                transaction.category_id = category_id
+                await aggregates.record_category_change(
+                    db, transaction, old_category_id
+                )
+                # Исправление категории учит модель пользователя
+                tokens = []
+                if old_category_id != category_id:
+                    tokens = await category_models.record(
+                        db, transaction.user_id, transaction.description, category_id
+                    )
+                await db.commit()
+            category_models.apply(transaction.user_id, tokens, category_id)
 
-            # Получаем обновленную транзакцию для отображения
-            transaction = (
-                db.query(Transaction).filter(Transaction.id == transaction_id).first()
-            )
             sign = "-" if transaction.type == TransactionType.EXPENSE else "+"
 
             await query.edit_message_text(
                 CHANGE_CATEGORY_SUCCESS.format(
                     sign=sign,
                     amount=transaction.amount,
-                    category=category.name,
+                    category=category_name,
                     description=transaction.description,
                 )
             )
@@ -1347,9 +1194,6 @@ class FinanceBot:
         except Exception as e:
             bot_logger.error(LOG_CATEGORY_CHANGE_ERROR.format(error=e))
             await query.edit_message_text(ERROR_GENERAL)
-        finally:
-            if db:
-                db.close()
 
     async def clean_db(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Очистка старых транзакций из БД (только для администраторов)"""
@@ -1380,10 +1224,97 @@ class FinanceBot:
             CLEAN_DB_CONFIRM.format(days=days), reply_markup=reply_markup
         )
 
+    @writes
+    async def archive_transactions(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        """Перенос старых транзакций в архив (только для администраторов)"""
+        if update.effective_user.id not in self.admin_ids:
+            await update.message.reply_text(CLEAN_DB_NOT_ADMIN)
+            return
+
+        days = archive.ARCHIVE_AFTER_DAYS
+        if context.args and context.args[0].isdigit():
+            days = int(context.args[0])
+        # created_at пишется в локальном времени, как и в /clean_db
+        cutoff_date = datetime.now() - timedelta(days=days)
+
+        try:
+            message = await update.message.reply_text(
+                ARCHIVE_PROGRESS.format(days=days, moved=0, total="?")
+            )
+
+            # Как и в /clean_db, правим сообщение не чаще PROGRESS_INTERVAL
+            last_edit = 0.0
+
+            async def report_progress(moved: int, total: int):
+                nonlocal last_edit
+                now = time.monotonic()
+                if moved < total and now - last_edit < purge.PROGRESS_INTERVAL:
+                    return
+                last_edit = now
+                await message.edit_text(
+                    ARCHIVE_PROGRESS.format(days=days, moved=moved, total=total)
+                )
+
+            count = await archive.archive_before(cutoff_date, progress=report_progress)
+            if not count:
+                await message.edit_text(ARCHIVE_NO_OLD_TRANSACTIONS.format(days=days))
+                return
+
+            await message.edit_text(ARCHIVE_SUCCESS.format(count=count, days=days))
+            logger.info(LOG_ARCHIVE_DONE.format(count=count, cutoff=cutoff_date))
+
+        except Exception as e:
+            logger.error(LOG_ARCHIVE_ERROR, exc_info=e)
+            await update.message.reply_text(ERROR_GENERAL)
+
+    @writes
+    async def reconcile(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пересчет агрегатов с проверкой расхождений (только для администраторов)"""
+        if update.effective_user.id not in self.admin_ids:
+            await update.message.reply_text(CLEAN_DB_NOT_ADMIN)
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                # Архивные операции остаются в агрегатах
+                archived = await archive.archived_deltas(db)
+                drift = await aggregates.reconcile(db, archived)
+                await db.commit()
+
+            message = RECONCILE_HEADER
+            for name, count in drift.items():
+                message += RECONCILE_ITEM.format(name=name, count=count)
+            if any(drift.values()):
+                logger.warning(LOG_RECONCILE_DRIFT.format(drift=drift))
+
+            await update.message.reply_text(message)
+
+        except Exception as e:
+            logger.error(LOG_RECONCILE_ERROR, exc_info=e)
+            await update.message.reply_text(ERROR_GENERAL)
+
+    async def post_init(self, application: Application):
+        """Подготовка кэшей и архива перед приемом обновлений"""
+        await category_registry.ensure_loaded()
+        # Архив прежнего формата разбиваем по пользователям до первых чтений
+        await asyncio.to_thread(archive.transaction_archive.split_legacy_segments)
+
+    async def post_shutdown(self, application: Application):
+        """Дописываем операции, оставшиеся в очереди групповой записи"""
+        await write_batcher.close()
+
     def run(self):
         """Запуск бота"""
         # Создаем приложение
-        application = Application.builder().token(self.token).build()
+        application = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
 
         # Регистрируем обработчики
         self.register_handlers(application)
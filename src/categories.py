@@ -0,0 +1,165 @@
+"""
+Справочник категорий в памяти процесса.
+
+Категории меняются редко, поэтому обработчики берут их из реестра без
+запросов к БД. Вместе с именами хранятся ключевые слова из колонки
+Category.keywords (через запятую). Любая вставка, изменение или удаление
+Category через сессию бота помечает реестр устаревшим после commit, и при
+следующем обращении он перечитывается целиком.
+
+Правки в обход бота (SQL, миграция, другой процесс) так не видны, поэтому
+не чаще раза в CATEGORY_REFRESH_SECONDS реестр сверяется с таблицей
+categories (она маленькая, это один запрос). Версия реестра меняется,
+только если содержимое действительно изменилось.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import repository
+from src.database import AsyncSessionLocal
+from src.models import Category
+
+# Ключ в session.info: в транзакции сессии менялись категории
+_CHANGED_KEY = "categories_changed"
+
+CATEGORY_REFRESH_SECONDS = float(os.getenv("CATEGORY_REFRESH_SECONDS", "60"))
+
+# Разделители ключевых слов в Category.keywords
+_KEYWORD_SEPARATORS = re.compile(r"[,;\n]")
+
+
+def parse_keywords(keywords: Optional[str]) -> List[str]:
+    """Список ключевых слов из значения колонки Category.keywords"""
+    if not keywords:
+        return []
+    return [k.strip() for k in _KEYWORD_SEPARATORS.split(keywords) if k.strip()]
+
+
+class CategoryRegistry:
+    """Отображения имя → id, id → имя и ключевые слова с номером версии"""
+
+    def __init__(self, refresh_interval: float = CATEGORY_REFRESH_SECONDS):
+        self.version = 0
+        self.refresh_interval = refresh_interval
+        self._loaded_version = -1
+        self._rows: List[Tuple[int, str, Optional[str]]] = []
+        self._checked_at: Optional[float] = None
+        self._by_id: Dict[int, str] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_casefold: Dict[str, int] = {}
+        self._keywords: Dict[str, List[str]] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded_version(self) -> int:
+        """Версия, с которой загружены текущие данные"""
+        return self._loaded_version
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_version != self.version
+
+    @property
+    def refresh_due(self) -> bool:
+        """Пора сверить реестр с БД"""
+        return (
+            self._checked_at is None
+            or time.monotonic() - self._checked_at >= self.refresh_interval
+        )
+
+    def invalidate(self):
+        """Помечает реестр устаревшим"""
+        self.version += 1
+
+    async def load(self, db: AsyncSession):
+        """Перечитывает все категории из БД"""
+        version = self.version
+        rows = sorted(tuple(row) for row in await repository.categories(db))
+        self._checked_at = time.monotonic()
+        if rows != self._rows and version == self._loaded_version:
+            # Категории изменили в обход бота: это тоже новая версия
+            self.invalidate()
+            version += 1
+        self._rows = rows
+        self._by_id = {category_id: name for category_id, name, _ in rows}
+        self._by_name = {name: category_id for category_id, name, _ in rows}
+        self._by_casefold = {
+            name.casefold(): category_id for category_id, name, _ in rows
+        }
+        self._keywords = {
+            name: parse_keywords(keywords) for _, name, keywords in rows if keywords
+        }
+        self._loaded_version = version
+
+    async def ensure_loaded(self, session_factory=AsyncSessionLocal):
+        """
+        Загружает реестр, если он устарел или подошел срок сверки с БД;
+        иначе не обращается к БД
+        """
+        if not self.is_stale and not self.refresh_due:
+            return
+        async with self._lock:
+            if self.is_stale or self.refresh_due:
+                async with session_factory() as db:
+                    await self.load(db)
+
+    def get_id(self, name: str) -> Optional[int]:
+        return self._by_name.get(name)
+
+    def get_name(self, category_id: Optional[int]) -> Optional[str]:
+        return self._by_id.get(category_id)
+
+    def find(self, name: str) -> Optional[int]:
+        """Поиск категории по имени без учета регистра"""
+        return self._by_casefold.get(name.casefold())
+
+    def keywords(self) -> Dict[str, List[str]]:
+        """Ключевые слова из БД: {категория: [слова]} в порядке id"""
+        return self._keywords
+
+    def all(self) -> List[Tuple[int, str]]:
+        """Все категории в порядке id"""
+        return sorted(self._by_id.items())
+
+    async def get_or_create(self, db: AsyncSession, name: str) -> int:
+        """id категории по имени; создает категорию, если её нет"""
+        category_id = self.get_id(name)
+        if category_id is not None:
+            return category_id
+
+        category_id = await repository.category_id_by_name(db, name)
+        if category_id is None:
+            category = Category(name=name)
+            db.add(category)
+            await db.flush()
+            category_id = category.id
+        return category_id
+
+
+category_registry = CategoryRegistry()
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def _mark_categories_changed(mapper, connection, target):
+    Session.object_session(target).info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(_CHANGED_KEY, False):
+        category_registry.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changes_after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
@@ -0,0 +1,214 @@
+"""
+Определение категории по описанию операции.
+
+Правила — встроенная таблица CATEGORY_KEYWORDS и ключевые слова из
+Category.keywords — компилируются в один KeywordMatcher по основам слов
+(src/stemmer.py), так что разные формы слова совпадают с одним ключевым
+словом. Реестр
+категорий перечитывается после изменения Category в боте или, не позже
+чем через CATEGORY_REFRESH_SECONDS, после правки в обход бота (см.
+src/categories.py). Движок пересобирает автомат, как только видит новую
+версию реестра: правила меняются без перезапуска бота, а компиляция
+выполняется один раз на версию, а не на каждое сообщение.
+
+Раньше общих правил проверяется модель пользователя, выученная по его
+исправлениям категорий (src/category_model.py).
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.categories import CategoryRegistry, category_registry
+from src.category_model import CategoryModels, category_models
+from src.keyword_matcher import KeywordMatcher
+from src.messages import CATEGORY_DEFAULT
+from src.stemmer import keyword_forms, stem_tokens
+
+# Встроенная таблица правил {категория: [ключевые слова]}. Ключевые слова
+# сравниваются по основам, поэтому формы слова ("симка" и "симку")
+# отдельно не перечисляются
+CATEGORY_KEYWORDS = {
+    "Продукты": [
+        "продукты",
+        "еда",
+        "магазин",
+        "супермаркет",
+        "вкусно и точка",
+        "ростикс",
+        "обед",
+        "ужин",
+        "завтрак",
+        "перекус",
+        "кофе",
+        "мартирос",
+        "вода",
+        "шоколадки",
+    ],
+    "Транспорт": [
+        "такси",
+        "метро",
+        "автобус",
+        "транспорт",
+        "дорога",
+        "проезд",
+        "мытищи",
+        "подлипки",
+        "маршрутка",
+        "электричка",
+    ],
+    "Жилье": [
+        "аренда",
+        "квартира",
+        "коммуналка",
+        "интернет",
+        "счета",
+        "жкх",
+        "ремонт",
+    ],
+    "Развлечения": [
+        "кино",
+        "ресторан",
+        "кафе",
+        "бар",
+        "концерт",
+        "развлечения",
+        "кинотеатр",
+        "театр",
+        "музей",
+    ],
+    "Здоровье": [
+        "лекарства",
+        "врач",
+        "аптека",
+        "медицина",
+        "больница",
+        "анализы",
+        "стоматолог",
+        "окулист",
+    ],
+    "Одежда": [
+        "одежда",
+        "обувь",
+        "магазин",
+        "куртка",
+        "брюки",
+        "рубашка",
+        "платье",
+        "кроссовки",
+    ],
+    "Образование": [
+        "курсы",
+        "обучение",
+        "книги",
+        "образование",
+        "тренинг",
+        "семинар",
+        "мастер-класс",
+    ],
+    "Техника": [
+        "техника",
+        "гаджеты",
+        "электроника",
+        "телефон",
+        "компьютер",
+        "ноутбук",
+        "планшет",
+    ],
+    "Подарки": [
+        "подарок",
+        "подарки",
+        "сувенир",
+        "поздравление",
+        "праздник",
+        "8 марта",
+        "пакеты для",
+        "шоколадки",
+    ],
+    "Связь": [
+        "телефон",
+        "связь",
+        "симка",
+        "впн",
+        "vpn",
+        "интернет",
+        "роутер",
+        "модем",
+    ],
+}
+
+# Приоритеты правил: при нескольких совпадениях выигрывает больший,
+# при равных — категория, стоящая в таблице выше
+KEYWORD_PRIORITIES = {"8 марта": 10}
+
+
+def compile_rules(
+    table: Mapping[str, Sequence[str]], priorities: Mapping[str, int]
+) -> KeywordMatcher:
+    """Автомат по основам слов для таблицы {категория: [ключевые слова]}"""
+    priorities = {k.lower(): v for k, v in priorities.items()}
+    return KeywordMatcher(
+        (
+            (form, category, priorities.get(keyword.lower(), 0))
+            for category, keywords in table.items()
+            for keyword in keywords
+            for form in keyword_forms(keyword)
+        ),
+        normalize=stem_tokens,
+    )
+
+
+class CategorizationEngine:
+    """Общий для всех обработчиков автомат правил категорий"""
+
+    def __init__(
+        self,
+        builtin: Mapping[str, Sequence[str]],
+        priorities: Optional[Mapping[str, int]] = None,
+        registry: CategoryRegistry = category_registry,
+        models: CategoryModels = category_models,
+    ):
+        self.builtin = builtin
+        self.priorities = priorities or {}
+        self.registry = registry
+        self.models = models
+        self._matcher: Optional[KeywordMatcher] = None
+        self._version: Optional[int] = None
+
+    def rules(self) -> Dict[str, List[str]]:
+        """
+        Встроенная таблица, дополненная словами из БД. Порядок категорий
+        (и значит, выбор при равных приоритетах) задает встроенная таблица,
+        категории только из БД идут после неё
+        """
+        table = {category: list(words) for category, words in self.builtin.items()}
+        for category, words in self.registry.keywords().items():
+            table.setdefault(category, []).extend(words)
+        return table
+
+    @property
+    def matcher(self) -> KeywordMatcher:
+        """Автомат для текущей версии реестра; пересобирается при её смене"""
+        version = self.registry.loaded_version
+        if self._matcher is None or self._version != version:
+            self._matcher = compile_rules(self.rules(), self.priorities)
+            self._version = version
+        return self._matcher
+
+    async def ensure_loaded(
+        self, db: Optional[AsyncSession] = None, user_id: Optional[int] = None
+    ):
+        """Перечитывает реестр категорий, если он устарел, и модель пользователя"""
+        await self.registry.ensure_loaded()
+        if db is not None and user_id is not None:
+            await self.models.ensure_loaded(db, user_id)
+
+    def categorize(self, description: str, user_id: Optional[int] = None) -> str:
+        """Категория по модели пользователя, иначе по общим правилам"""
+        if user_id is not None:
+            category_id = self.models.predict(user_id, description)
+            # Категория могла быть удалена после исправления
+            name = self.registry.get_name(category_id)
+            if name is not None:
+                return name
+        return self.matcher.best(description) or CATEGORY_DEFAULT
@@ -0,0 +1,225 @@
+"""
+Категории, выученные по исправлениям пользователя.
+
+Когда пользователь переносит операцию в другую категорию кнопками, основа
+каждого значимого слова её описания получает +1 к этой категории
+(таблица user_category_tokens). Служебные слова и слова короче
+MIN_TOKEN_LENGTH букв не учитываются: "на" или "до" встречаются в любых
+описаниях и ничего не говорят о категории.
+
+При определении категории слова описания голосуют за свои категории с
+весом числа исправлений. Модель пользователя проверяется раньше общих
+правил по ключевым словам, но решает, только если уверена: слово лучшей
+категории встретилось хотя бы в USER_MODEL_MIN_VOTES исправлениях, и она
+опережает следующую категорию на USER_MODEL_MIN_MARGIN голосов. Иначе
+категорию выбирают общие правила.
+
+Модели загружаются из БД при первом обращении и хранятся в LRU-кэше;
+предсказание — один поиск в словаре на слово описания.
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import repository
+from src.aggregates import upsert
+from src.cache import LRUCache
+from src.models import UserCategoryToken
+from src.stemmer import stem
+
+USER_MODEL_CACHE_SIZE = int(os.getenv("USER_MODEL_CACHE_SIZE", "10000"))
+# В скольких исправлениях должно встретиться слово описания, чтобы модель
+# перебила общие правила, и на сколько голосов лучшая категория должна
+# опережать следующую
+USER_MODEL_MIN_VOTES = int(os.getenv("USER_MODEL_MIN_VOTES", "2"))
+USER_MODEL_MIN_MARGIN = int(os.getenv("USER_MODEL_MIN_MARGIN", "2"))
+
+# Слова короче не учитываются (предлоги, союзы, частицы)
+MIN_TOKEN_LENGTH = 4
+# Служебные и общие слова подлиннее, которые тоже ничего не говорят о
+# категории
+STOPWORDS = frozenset(
+    {
+        "около",
+        "после",
+        "перед",
+        "через",
+        "между",
+        "возле",
+        "вокруг",
+        "кроме",
+        "вместо",
+        "ради",
+        "чтобы",
+        "если",
+        "когда",
+        "тоже",
+        "также",
+        "этот",
+        "этого",
+        "этой",
+        "этом",
+        "этих",
+        "того",
+        "тому",
+        "свой",
+        "собой",
+        "свою",
+        "своей",
+        "свои",
+        "своих",
+        "моей",
+        "мои",
+        "моих",
+        "твой",
+        "наши",
+        "нашей",
+        "ваши",
+        "всех",
+        "всем",
+        "весь",
+        "было",
+        "будет",
+        "есть",
+        "очень",
+        "просто",
+        "снова",
+        "опять",
+        "сегодня",
+        "вчера",
+        "завтра",
+    }
+)
+
+_TOKEN = re.compile(r"[^\W\d_]+")
+
+
+def tokenize(description: Optional[str]) -> List[str]:
+    """
+    Основы значимых слов описания без повторов; числа, короткие и
+    служебные слова не учитываются
+    """
+    if not description:
+        return []
+    words = _TOKEN.findall(description.lower())
+    return list(
+        dict.fromkeys(
+            stem(word)
+            for word in words
+            if len(word) >= MIN_TOKEN_LENGTH and word not in STOPWORDS
+        )
+    )
+
+
+class UserModel:
+    """Частоты слово → категория одного пользователя"""
+
+    __slots__ = ("counts",)
+
+    def __init__(self, rows: Iterable[Tuple[str, int, int]] = ()):
+        self.counts: Dict[str, Dict[int, int]] = {}
+        for token, category_id, count in rows:
+            self.counts.setdefault(token, {})[category_id] = count
+
+    def learn(self, tokens: Iterable[str], category_id: int):
+        """Учитывает одно исправление: O(число слов)"""
+        for token in tokens:
+            counts = self.counts.setdefault(token, {})
+            counts[category_id] = counts.get(category_id, 0) + 1
+
+    def predict(
+        self,
+        tokens: Iterable[str],
+        min_votes: int = USER_MODEL_MIN_VOTES,
+        min_margin: int = USER_MODEL_MIN_MARGIN,
+    ) -> Optional[int]:
+        """
+        Категория с наибольшим числом голосов слов или None, если у неё
+        нет слова хотя бы из min_votes исправлений или отрыв от следующей
+        категории меньше min_margin
+        """
+        votes: Dict[int, int] = {}
+        # Наибольшее число исправлений у одного слова категории
+        support: Dict[int, int] = {}
+        for token in tokens:
+            for category_id, count in self.counts.get(token, {}).items():
+                votes[category_id] = votes.get(category_id, 0) + count
+                support[category_id] = max(support.get(category_id, 0), count)
+        if not votes:
+            return None
+        ranked = sorted(votes, key=lambda c: (-votes[c], c))
+        category_id = ranked[0]
+        runner_up = votes[ranked[1]] if len(ranked) > 1 else 0
+        if support[category_id] < min_votes:
+            return None
+        if votes[category_id] - runner_up < min_margin:
+            return None
+        return category_id
+
+
+class CategoryModels:
+    """LRU-кэш моделей пользователей и их запись в user_category_tokens"""
+
+    def __init__(self, maxsize: int = USER_MODEL_CACHE_SIZE):
+        self._models = LRUCache(maxsize)
+
+    def get(self, user_id: int) -> Optional[UserModel]:
+        """Модель из кэша без обращения к БД"""
+        return self._models.get(user_id)
+
+    async def ensure_loaded(self, db: AsyncSession, user_id: int) -> UserModel:
+        model = self._models.get(user_id)
+        if model is None:
+            model = UserModel(await repository.user_category_tokens(db, user_id))
+            self._models.put(user_id, model)
+        return model
+
+    def predict(self, user_id: int, description: str) -> Optional[int]:
+        """Категория по модели пользователя, если она загружена"""
+        model = self._models.get(user_id)
+        if model is None or not model.counts:
+            return None
+        return model.predict(tokenize(description))
+
+    async def record(
+        self, db: AsyncSession, user_id: int, description: str, category_id: int
+    ) -> List[str]:
+        """
+        Добавляет исправление в user_category_tokens в транзакции сессии, без
+        commit. Возвращает слова, которые после commit передаются в apply
+        """
+        tokens = tokenize(description)
+        if not tokens:
+            return tokens
+        stmt = upsert(db, UserCategoryToken)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                UserCategoryToken.user_id,
+                UserCategoryToken.token,
+                UserCategoryToken.category_id,
+            ],
+            set_={"count": UserCategoryToken.count + stmt.excluded.count},
+        )
+        await db.execute(
+            stmt,
+            [
+                {"user_id": user_id, "token": t, "category_id": category_id, "count": 1}
+                for t in tokens
+            ],
+        )
+        return tokens
+
+    def apply(self, user_id: int, tokens: List[str], category_id: int):
+        """Обновляет модель в кэше после commit; незагруженная прочитается из БД"""
+        model = self._models.get(user_id)
+        if model is not None:
+            model.learn(tokens, category_id)
+
+    def clear(self):
+        self._models.clear()
+
+
+category_models = CategoryModels()
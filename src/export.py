@@ -0,0 +1,342 @@
+"""
+Выгрузка истории операций в Excel (/export).
+
+Операции читаются из БД порциями по EXPORT_CHUNK_SIZE строк (yield_per) и
+сразу дописываются в книгу openpyxl в режиме write_only: строка уходит в
+XML листа при добавлении, и в памяти не копятся ни строки БД, ни ячейки.
+Оформление задается именованными стилями, которые регистрируются в книге
+один раз, — ячейка лишь ссылается на стиль по имени вместо собственных
+Font и Border.
+
+В режиме write_only ширины колонок записываются до первой строки, поэтому
+их нельзя досчитать по ходу выгрузки. Они берутся из известных границ:
+ширина даты и типа постоянна, длинное имя категории известно из
+справочника, а крайние суммы и наибольшая длина описания — из одного
+запроса MIN()/MAX() по индексу пользователя и из прохода по архиву.
+Сумма выводится в формате AMOUNT_FORMAT, и ширина считается по той же
+записи, что увидит пользователь. Архив читается по месяцам, от новых к
+старым, и при проходе, и при выгрузке: в памяти не больше одного месяца.
+
+Заполнение и сохранение книги нагружают процессор, поэтому они идут в
+потоках пула EXPORT_WORKERS, а цикл событий только читает порции из БД и
+продолжает отвечать остальным пользователям. Порции читаются через
+ExportSessionLocal: у выгрузок свой пул соединений на EXPORT_WORKERS, и
+долгая выгрузка не отнимает соединения у пула чтения. Одновременно идет не больше
+EXPORT_WORKERS выгрузок, остальные ждут в очереди (ExportPool); повторный
+/export, пока выгрузка пользователя еще идет, получает тот же файл.
+"""
+
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import archive, repository
+from src.database import EXPORT_WORKERS
+from src.messages import (
+    CATEGORY_DEFAULT,
+    EXPORT_HEADERS,
+    EXPORT_SHEET_TITLE,
+    EXPORT_TRANSACTION_TYPE_EXPENSE,
+    EXPORT_TRANSACTION_TYPE_INCOME,
+)
+from src.models import TransactionType
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "2000"))
+EXPORT_FILE_NAME = "transactions.xlsx"
+
+# Потоки для заполнения и сохранения книг; их столько же, сколько
+# выгрузок может идти одновременно, поэтому выгрузка не ждет поток
+executor = ThreadPoolExecutor(EXPORT_WORKERS, thread_name_prefix="export")
+
+DATE_FORMAT = "%d.%m.%Y %H:%M"
+# Формат ячейки суммы в Excel и та же запись в Python для расчета ширины
+AMOUNT_FORMAT = "0.00"
+AMOUNT_TEXT = "{:.2f}"
+# Запас к ширине колонки, как у прежней автоширины, и предел Excel
+WIDTH_PADDING = 2
+MAX_COLUMN_WIDTH = 255
+
+_THIN = Side(style="thin")
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+
+# Стили ячеек; имена с префиксом, чтобы не совпасть со встроенными
+STYLES = (
+    NamedStyle(
+        name="export_header",
+        font=Font(bold=True),
+        fill=PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid"),
+        border=_BORDER,
+        alignment=Alignment(horizontal="center"),
+    ),
+    NamedStyle(name="export_cell", border=_BORDER),
+    NamedStyle(
+        name="export_expense",
+        font=Font(color="FF0000"),
+        border=_BORDER,
+        number_format=AMOUNT_FORMAT,
+    ),
+    NamedStyle(
+        name="export_income",
+        font=Font(color="008000"),
+        border=_BORDER,
+        number_format=AMOUNT_FORMAT,
+    ),
+)
+
+
+class Bounds(NamedTuple):
+    """Число операций, наименьшая и наибольшая суммы, наибольшая длина описания"""
+
+    count: int
+    min_amount: Optional[float]
+    max_amount: Optional[float]
+    max_description: Optional[int]
+
+
+def with_archived(bounds: Bounds, archived: Iterable) -> Bounds:
+    """Границы с учетом архивных операций; archived читается один раз"""
+    count, low, high, longest = bounds
+    for row in archived:
+        count += 1
+        if low is None or row.amount < low:
+            low = row.amount
+        if high is None or row.amount > high:
+            high = row.amount
+        if row.description and (longest is None or len(row.description) > longest):
+            longest = len(row.description)
+    return Bounds(count, low, high, longest)
+
+
+def column_widths(bounds: Bounds, category_names: Iterable[str]) -> List[int]:
+    """Ширины колонок EXPORT_HEADERS: самое длинное значение или заголовок"""
+    amounts = [
+        len(AMOUNT_TEXT.format(amount))
+        for amount in (bounds.min_amount, bounds.max_amount)
+        if amount is not None
+    ]
+    longest = [
+        len(datetime.min.strftime(DATE_FORMAT)),
+        max(len(EXPORT_TRANSACTION_TYPE_EXPENSE), len(EXPORT_TRANSACTION_TYPE_INCOME)),
+        max(amounts, default=0),
+        bounds.max_description or 0,
+        max(map(len, category_names), default=0),
+    ]
+    return [
+        min(max(length, len(header)) + WIDTH_PADDING, MAX_COLUMN_WIDTH)
+        for length, header in zip(longest, EXPORT_HEADERS)
+    ]
+
+
+class TransactionSheet:
+    """Лист выгрузки в книге write_only; строки пишутся по мере добавления"""
+
+    def __init__(
+        self, widths: Sequence[int], category_name: Callable[[Optional[int]], str]
+    ):
+        self.category_name = category_name
+        self.rows = 0
+        self.workbook = Workbook(write_only=True)
+        for style in STYLES:
+            self.workbook.add_named_style(style)
+        self.sheet = self.workbook.create_sheet(EXPORT_SHEET_TITLE)
+        for column, width in enumerate(widths, 1):
+            self.sheet.column_dimensions[get_column_letter(column)].width = width
+        self.sheet.append(
+            [self._cell(header, "export_header") for header in EXPORT_HEADERS]
+        )
+
+        # Строка XML пишется сразу при append, поэтому ячейки строки
+        # создаются один раз и дальше только получают новые значения
+        self._date = self._cell(None, "export_cell")
+        self._type = self._cell(None, "export_cell")
+        self._amounts = {
+            TransactionType.EXPENSE: self._cell(None, "export_expense"),
+            TransactionType.INCOME: self._cell(None, "export_income"),
+        }
+        self._description = self._cell(None, "export_cell")
+        self._category = self._cell(None, "export_cell")
+
+    def _cell(self, value, style: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(self.sheet, value)
+        cell.style = style
+        return cell
+
+    def append(self, transactions: Iterable):
+        """Дописывает операции (атрибуты как у TRANSACTION_ROW)"""
+        sheet, category_name = self.sheet, self.category_name
+        date, type_, description, category = (
+            self._date,
+            self._type,
+            self._description,
+            self._category,
+        )
+        for t in transactions:
+            date.value = t.created_at.strftime(DATE_FORMAT)
+            if t.type == TransactionType.EXPENSE:
+                type_.value = EXPORT_TRANSACTION_TYPE_EXPENSE
+            else:
+                type_.value = EXPORT_TRANSACTION_TYPE_INCOME
+            amount = self._amounts[t.type]
+            amount.value = t.amount
+            description.value = t.description
+            category.value = category_name(t.category_id)
+            sheet.append((date, type_, amount, description, category))
+            self.rows += 1
+
+    def save(self, output):
+        """Сохраняет книгу в файл или файловый объект; после этого лист закрыт"""
+        self.workbook.save(output)
+
+
+def _archived_months(
+    store: archive.TransactionArchive, user_id: int
+) -> Iterable[List[archive.ArchivedTransaction]]:
+    return store.months(user_id) if store.covers(None) else ()
+
+
+async def export_transactions(
+    db: AsyncSession,
+    user_id: int,
+    output,
+    categories: Dict[int, str],
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    store: archive.TransactionArchive = archive.transaction_archive,
+) -> int:
+    """
+    Пишет все операции пользователя (вместе с архивными, новые первыми) в
+    XLSX output; возвращает число строк, 0 — книга не создавалась.
+    categories — имена категорий по id, их загружает вызывающий код: сессия
+    db уже держит соединение пула выгрузок, и второе, для реестра, брать
+    нельзя
+    """
+    loop = asyncio.get_running_loop()
+    bounds = Bounds(*await repository.user_transaction_bounds(db, user_id))
+    archived = (row for month in _archived_months(store, user_id) for row in month)
+    bounds = await loop.run_in_executor(executor, with_archived, bounds, archived)
+    if not bounds.count:
+        return 0
+
+    names = list(categories.values()) + [CATEGORY_DEFAULT]
+    sheet = TransactionSheet(
+        column_widths(bounds, names),
+        lambda category_id: categories.get(category_id, CATEGORY_DEFAULT),
+    )
+
+    # Книга заполняется в потоке пула; порции передаются по одной, так что
+    # с листом и StreamMerge (и чтением архива) в каждый момент работает
+    # один поток
+    merged = archive.StreamMerge(_archived_months(store, user_id))
+    async for rows in repository.stream_user_transactions(db, user_id, chunk_size):
+        await loop.run_in_executor(executor, sheet.append, merged.feed(rows))
+    await loop.run_in_executor(executor, sheet.append, merged.finish())
+    await loop.run_in_executor(executor, sheet.save, output)
+    return sheet.rows
+
+
+class _Job:
+    """Выгрузка пользователя во временный файл и ожидающие её запросы"""
+
+    def __init__(self, directory: tempfile.TemporaryDirectory):
+        self.directory = directory
+        self.path = Path(directory.name) / EXPORT_FILE_NAME
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+
+class ExportPool:
+    """
+    Ограничивает число одновременных выгрузок; запросы сверх предела ждут
+    в очереди. Повторный запрос пользователя присоединяется к его идущей
+    выгрузке, файл удаляется после отправки всем ожидающим
+    """
+
+    def __init__(self, max_concurrent: int = EXPORT_WORKERS):
+        self.max_concurrent = max_concurrent
+        self.queued = 0
+        self.running = 0
+        self.joined = 0
+        self._jobs: Dict[int, _Job] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def status(self) -> Dict[str, int]:
+        """Метрики: выгрузки в работе, глубина очереди, присоединившиеся запросы"""
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "joined": self.joined,
+        }
+
+    async def _run(self, write: Callable[[Path], Awaitable[int]], path: Path) -> int:
+        # Семафор создается в цикле событий, где работает бот
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        try:
+            return await write(path)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def _finished(self, user_id: int, job: _Job):
+        if self._jobs.get(user_id) is job:
+            del self._jobs[user_id]
+        if not job.waiters:
+            job.directory.cleanup()
+
+    @asynccontextmanager
+    async def export(
+        self, user_id: int, write: Callable[[Path], Awaitable[int]]
+    ) -> AsyncIterator[Tuple[int, Path]]:
+        """
+        (число строк, путь к файлу) выгрузки пользователя; write(path)
+        пишет файл и возвращает число строк. Файл существует до выхода
+        из блока
+        """
+        job = self._jobs.get(user_id)
+        if job is None:
+            job = _Job(tempfile.TemporaryDirectory())
+            job.task = asyncio.ensure_future(self._run(write, job.path))
+            job.task.add_done_callback(lambda _: self._finished(user_id, job))
+            self._jobs[user_id] = job
+        else:
+            self.joined += 1
+
+        job.waiters += 1
+        try:
+            # Отмена одного запроса не прерывает выгрузку для остальных
+            count = await asyncio.shield(job.task)
+            yield count, job.path
+        finally:
+            job.waiters -= 1
+            if not job.waiters and job.task.done():
+                job.directory.cleanup()
+
+
+export_pool = ExportPool()
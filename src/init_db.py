@@ -1,40 +1,95 @@
 import os
-from sqlalchemy import create_engine
+import sys
+from pathlib import Path
+
+# Добавляем корневую директорию проекта в PYTHONPATH
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, select
 from sqlalchemy.orm import Session
-from src.models import Base, Category
-from src.database import DATABASE_URL
+from src.models import Category
+from src.database import DATABASE_URL, SQLITE_AUTO_VACUUM_INCREMENTAL
 
-def init_db():
-    # Создаем engine заново для инициализации
-    engine = create_engine(DATABASE_URL)
-    
-    # Создаем все таблицы
-    Base.metadata.drop_all(bind=engine)  # Сначала удаляем все таблицы
-    Base.metadata.create_all(bind=engine)
-    
-    # Создаем сессию
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Ревизия, соответствующая схеме, которую раньше создавал create_all()
+BASELINE_REVISION = "0001"
+
+DEFAULT_CATEGORIES = [
+    "Продукты", "Транспорт", "Жилье", "Развлечения",
+    "Здоровье", "Одежда", "Образование", "Техника",
+    "Подарки", "Связь", "Без категории"
+]
+
+
+def get_alembic_config(url: str = DATABASE_URL) -> Config:
+    """Конфигурация Alembic с абсолютными путями, чтобы не зависеть от cwd"""
+    config = Config(str(ROOT_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(ROOT_DIR / "migrations"))
+    # ConfigParser воспринимает % как интерполяцию
+    config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    return config
+
+
+def enable_incremental_vacuum(engine):
+    """
+    Включает в SQLite auto_vacuum=INCREMENTAL, чтобы после /clean_db файл
+    можно было уменьшать через PRAGMA incremental_vacuum. Для уже созданной
+    базы режим вступает в силу только после полного VACUUM (один раз)
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as connection:
+        mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        if mode == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+
+
+def upgrade_db(url: str = DATABASE_URL):
+    """Применяет все миграции Alembic к базе данных"""
+    engine = create_engine(url)
+    tables = inspect(engine).get_table_names()
+    enable_incremental_vacuum(engine)
+    engine.dispose()
+
+    config = get_alembic_config(url)
+
+    # База создана старым init_db без Alembic: помечаем начальной ревизией,
+    # чтобы не пересоздавать таблицы с данными
+    if "transactions" in tables and "alembic_version" not in tables:
+        command.stamp(config, BASELINE_REVISION)
+
+    command.upgrade(config, "head")
+
+
+def seed_categories(url: str = DATABASE_URL):
+    """Добавляет недостающие базовые категории"""
+    engine = create_engine(url)
     session = Session(engine)
-    
+
     try:
-        # Создаем базовые категории
-        default_categories = [
-            "Продукты", "Транспорт", "Жилье", "Развлечения",
-            "Здоровье", "Одежда", "Образование", "Техника",
-            "Подарки", "Связь", "Без категории"
-        ]
-        
-        # Добавляем категории
-        for category_name in default_categories:
-            category = Category(name=category_name)
-            session.add(category)
-        
+        existing = set(session.scalars(select(Category.name)))
+        for category_name in DEFAULT_CATEGORIES:
+            if category_name not in existing:
+                session.add(Category(name=category_name))
         session.commit()
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def init_db():
+    try:
+        upgrade_db()
+        seed_categories()
         print("База данных успешно инициализирована!")
     except Exception as e:
         print(f"Ошибка при инициализации базы данных: {e}")
-        session.rollback()
-    finally:
-        session.close()
+
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,149 @@
+"""
+Поиск ключевых слов категорий в описании операции.
+
+Все ключевые слова собираются в один автомат Ахо–Корасик, который находит
+все вхождения за один проход по описанию. Символы автомата задает функция
+normalize, одна для ключевых слов и описаний: по умолчанию это буквы текста
+в нижнем регистре (ключевое слово может стоять внутри слова), а с
+src.stemmer.stem_tokens — основы слов, и тогда "симку" совпадает с
+ключевым словом "симка", а шаг автомата — один поиск в словаре на слово.
+
+Если подошло несколько правил, выигрывает правило с большим приоритетом,
+при равных приоритетах — категория, стоящая в таблице выше.
+"""
+
+from collections import deque
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+# Ранг правила: (-приоритет, порядок категории); меньший ранг выигрывает
+Rank = Tuple[int, int]
+NO_MATCH: Rank = (0, 1 << 62)
+
+# Текст → последовательность символов автомата
+Normalize = Callable[[str], Sequence[Hashable]]
+
+
+class KeywordMatcher:
+    """Автомат Ахо–Корасик по правилам (ключевое слово, категория, приоритет)"""
+
+    def __init__(
+        self, rules: Iterable[Tuple[str, str, int]], normalize: Normalize = str.lower
+    ):
+        self.normalize = normalize
+        self.categories: List[str] = []
+        category_order: Dict[str, int] = {}
+
+        # Бор: переходы, ссылки неудач, слова, оканчивающиеся в узле, —
+        # (слово, его длина в символах автомата, категория)
+        self._goto: List[Dict[Hashable, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._keywords: List[List[Tuple[str, int, int]]] = [[]]
+        # Лучший ранг среди слов узла и всех его суффиксных ссылок
+        self._best: List[Rank] = [NO_MATCH]
+
+        for keyword, category, priority in rules:
+            symbols = normalize(keyword)
+            if not symbols:
+                continue
+            if category not in category_order:
+                category_order[category] = len(self.categories)
+                self.categories.append(category)
+            rank = (-priority, category_order[category])
+
+            node = 0
+            for symbol in symbols:
+                node = self._goto[node].get(symbol) or self._add_node(node, symbol)
+            self._keywords[node].append((keyword.lower(), len(symbols), rank[1]))
+            self._best[node] = min(self._best[node], rank)
+
+        self._build_links()
+
+    @classmethod
+    def from_table(
+        cls,
+        table: Mapping[str, Iterable[str]],
+        priorities: Optional[Mapping[str, int]] = None,
+        normalize: Normalize = str.lower,
+    ) -> "KeywordMatcher":
+        """Правила из таблицы {категория: [слова]} и приоритетов {слово: приоритет}"""
+        priorities = {k.lower(): v for k, v in (priorities or {}).items()}
+        return cls(
+            (
+                (keyword, category, priorities.get(keyword.lower(), 0))
+                for category, keywords in table.items()
+                for keyword in keywords
+            ),
+            normalize,
+        )
+
+    def _add_node(self, parent: int, symbol: Hashable) -> int:
+        node = len(self._goto)
+        self._goto[parent][symbol] = node
+        self._goto.append({})
+        self._fail.append(0)
+        self._keywords.append([])
+        self._best.append(NO_MATCH)
+        return node
+
+    def _build_links(self):
+        """Ссылки неудач обходом в ширину; лучший ранг наследуется по ним"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for symbol, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and symbol not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(symbol, 0)
+                self._fail[child] = fail
+                self._best[child] = min(self._best[child], self._best[fail])
+                queue.append(child)
+
+    def _states(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Состояния автомата после каждого символа: (позиция, узел)"""
+        goto, fail = self._goto, self._fail
+        node = 0
+        for position, symbol in enumerate(self.normalize(text)):
+            while node and symbol not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(symbol, 0)
+            yield position, node
+
+    def best(self, text: str) -> Optional[str]:
+        """Категория лучшего совпавшего правила или None"""
+        # Тот же обход, что в _states, без генератора: это горячий путь
+        goto, fail, ranks = self._goto, self._fail, self._best
+        best_rank = NO_MATCH
+        node = 0
+        for symbol in self.normalize(text):
+            while node and symbol not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(symbol, 0)
+            rank = ranks[node]
+            if rank < best_rank:
+                best_rank = rank
+        if best_rank == NO_MATCH:
+            return None
+        return self.categories[best_rank[1]]
+
+    def matches(self, text: str) -> List[Tuple[int, str, str]]:
+        """Все вхождения: (номер первого символа, ключевое слово, категория)"""
+        found = []
+        for position, node in self._states(text):
+            while node:
+                for keyword, length, category in self._keywords[node]:
+                    start = position - length + 1
+                    found.append((start, keyword, self.categories[category]))
+                node = self._fail[node]
+        return found
@@ -7,7 +7,9 @@ START_MESSAGE = (
     "👋 Привет! Я бот для учета финансов.\n\n"
     "🔍 Как меня использовать:\n"
     "1. Добавить расход: -500 за продукты\n"
-    "2. Добавить доход: +5000 зарплата\n\n"
+    "2. Добавить доход: +5000 зарплата\n"
+    "3. Несколько операций сразу — каждая с новой строки\n"
+    "4. Загрузить выписку — отправьте файл CSV или XLSX\n\n"
     "📋 Основные команды:\n"
     "/balance - текущий баланс 💰\n"
     "/history - история операций 📅\n"
@@ -28,6 +30,10 @@ HELP_MESSAGE = (
     "Доход: +сумма описание\n\n"
     "Примеры:\n -100 продукты, -50 такси\n"
     "  +50000 зарплата, +1000 возврат\n\n"
+    "Несколько операций можно отправить одним сообщением, по одной на строку:\n"
+    "  -100 кофе\n  -350 такси\n  +5000 зарплата\n\n"
+    "📥 Выписка из банка: отправьте файл CSV или XLSX с колонками «Дата», "
+    "«Сумма» и «Описание». Уже сохраненные операции не задваиваются.\n\n"
     "🔍Команды:\n"
     "/balance — текущий баланс\n"
     "/history [период словом: день, неделя, месяц, год] — история за период\n"
@@ -76,11 +82,8 @@ HISTORY_TRANSACTION = "{emoji} {amount:.2f} руб. | {description} | {category}
 HISTORY_TRANSACTION_GROUP = (
     "{emoji} {amount:.2f} руб. | {description} | {category} [x{count}]\n"
 )
-HISTORY_PAGINATION = (
-    "\nСтраница {current_page}/{total_pages}\n"
-    "Используйте /history [период] page=N\n"
-    "Периоды: day, week, month, year"
-)
+HISTORY_NEWER = "⬅️ Новее"
+HISTORY_OLDER = "Старее ➡️"
 
 # Сообщения об ошибках
 ERROR_NOT_STARTED = "Пожалуйста, запустите бота командой /start"
@@ -93,6 +96,9 @@ ERROR_NO_DESCRIPTION = (
     "-100 такси\n"
     "+500 зарплата"
 )
+ERROR_BATCH_LINE = (
+    "Строка {line}: {error}\nНи одна транзакция из сообщения не сохранена."
+)
 ERROR_PROCESSING = "Произошла ошибка при обработке сообщения. Попробуйте снова."
 ERROR_BOT = (
     "😔 Произошла ошибка при обработке вашего запроса.\n"
@@ -117,6 +123,18 @@ STATS_MESSAGE = (
 TOP_CATEGORIES_HEADER = "Топ категорий расходов:\n"
 TOP_CATEGORY_ITEM = "• {category}: {amount:.2f} руб.\n"
 
+# Сообщения для команды /total
+TOTAL_STATS = (
+    "👥 Общая статистика группы\n\n"
+    "Пользователей: {users_count}\n"
+    "Доходы: {total_income:.2f} руб.\n"
+    "Расходы: {total_expenses:.2f} руб.\n"
+    "Баланс группы: {group_balance:.2f} руб.\n\n"
+    "В среднем на пользователя:\n"
+    "Доходы: {avg_income:.2f} руб.\n"
+    "Расходы: {avg_expenses:.2f} руб."
+)
+
 # Сообщения для категорий
 CATEGORY_LIST_HEADER = "📋 Доступные категории:\n\n"
 CATEGORY_LIST_ITEM = "• {name}\n"
@@ -152,6 +170,14 @@ ADD_TRANSACTION_SAVED = (
     "Категория: {category}\n"
     "Описание: {description}"
 )
+ADD_TRANSACTIONS_SAVED = (
+    "Добавлено транзакций: {count}\n"
+    "{lines}\n\n"
+    "Расходы: {expenses:.2f} руб.\n"
+    "Доходы: {income:.2f} руб."
+)
+ADD_TRANSACTIONS_LINE = "{sign}{amount:.2f} руб. — {description} ({category})"
+ADD_TRANSACTIONS_MORE = "… и еще {count}"
 ADD_TRANSACTION_CANCELLED = "Добавление транзакции отменено."
 ADD_TRANSACTION_INVALID_AMOUNT = (
     "Пожалуйста, введите корректное число. Попробуйте снова:"
@@ -194,6 +220,7 @@ LOG_TRANSACTION_ERROR = "Ошибка при обработке сообщени
 
 # Сообщения для экспорта
 EXPORT_HEADERS = ["Дата", "Тип", "Сумма", "Описание", "Категория"]
+EXPORT_SHEET_TITLE = "Транзакции"
 EXPORT_TRANSACTION_TYPE_EXPENSE = "Расход"
 EXPORT_TRANSACTION_TYPE_INCOME = "Доход"
 CATEGORY_DEFAULT = "Без категории"
@@ -208,3 +235,47 @@ CLEAN_DB_CONFIRM = (
 CLEAN_DB_SUCCESS = "🗑 Удалено {count} транзакций старше {days} дней."
 CLEAN_DB_CANCELLED = "Очистка БД отменена."
 CLEAN_DB_NO_OLD_TRANSACTIONS = "Нет транзакций старше {days} дней для удаления."
+CLEAN_DB_PROGRESS = "🗑 Удаление транзакций старше {days} дней: {deleted} из {total}..."
+LOG_CLEAN_DB_ERROR = "Ошибка при очистке БД"
+LOG_CLEAN_DB_VACUUM = "После очистки БД освобождено страниц: {pages}"
+
+# Сообщения для пересчета агрегатов
+RECONCILE_HEADER = "🔄 Агрегаты пересчитаны. Найдено расхождений:\n\n"
+RECONCILE_ITEM = "• {name}: {count}\n"
+LOG_RECONCILE_DRIFT = "Расхождение агрегатов при сверке: {drift}"
+LOG_RECONCILE_ERROR = "Ошибка при пересчете агрегатов"
+
+# Сообщения для архивации
+ARCHIVE_PROGRESS = (
+    "📦 Перенос в архив транзакций старше {days} дней: {moved} из {total}..."
+)
+ARCHIVE_SUCCESS = "📦 В архив перенесено {count} транзакций старше {days} дней."
+ARCHIVE_NO_OLD_TRANSACTIONS = "Нет транзакций старше {days} дней для архивации."
+LOG_ARCHIVE_DONE = "В архив перенесено транзакций: {count} (старше {cutoff})"
+LOG_ARCHIVE_ERROR = "Ошибка при переносе транзакций в архив"
+
+# Сообщения для импорта выписки
+IMPORT_UNSUPPORTED_FORMAT = "Поддерживаются выписки в форматах CSV и XLSX."
+IMPORT_NO_HEADER = (
+    "Не нашел в файле строку заголовка. Нужны как минимум колонки "
+    "«Дата» и «Сумма», можно также «Описание», «Тип» и «Категория»."
+)
+IMPORT_PROGRESS = (
+    "📥 Импорт выписки: добавлено {imported}, дублей {duplicates}, "
+    "пропущено строк {skipped}..."
+)
+IMPORT_SUCCESS = (
+    "📥 Импорт завершен: добавлено {imported} транзакций.\n"
+    "Уже были сохранены: {duplicates}\n"
+    "Не распознано строк: {skipped}"
+)
+LOG_IMPORT_DONE = (
+    "Импорт выписки пользователя {user_id}: добавлено {imported}, "
+    "дублей {duplicates}, пропущено {skipped}"
+)
+LOG_IMPORT_ERROR = "Ошибка при импорте выписки"
+
+# Сообщения групповой записи
+LOG_WRITE_BATCH_FAILED = (
+    "Пачка из {count} операций не записана, повторяем по одной: {error}"
+)
@@ -2,10 +2,22 @@ from typing import Any, Awaitable, Callable, Dict, Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 import json
+import os
 import time
 from datetime import datetime
+from src.database import (
+    async_engine,
+    async_export_engine,
+    async_read_engine,
+    count_queries,
+    pool_status,
+)
+from src.export import export_pool
 from src.logger import bot_logger, metrics_logger
 
+# Состояние пулов пишется в лог не чаще раза в столько секунд
+POOL_STATUS_INTERVAL = float(os.getenv("METRICS_POOL_STATUS_INTERVAL", "60"))
+
 
 class LoggingMiddleware:
     """Middleware для логирования всех входящих обновлений и ответов бота"""
@@ -99,8 +111,34 @@ class LoggingMiddleware:
 class MetricsMiddleware:
     """Middleware для сбора метрик производительности"""
 
-    def __init__(self):
+    def __init__(self, pool_status_interval: float = POOL_STATUS_INTERVAL):
         self.metrics: Dict[str, Dict[str, float]] = {}
+        self.pool_status_interval = pool_status_interval
+        self._pool_status_logged: Optional[float] = None
+
+    def _log_pool_status(self):
+        """Пулы соединений БД и выгрузок; раз в pool_status_interval секунд"""
+        now = time.monotonic()
+        if (
+            self._pool_status_logged is not None
+            and now - self._pool_status_logged < self.pool_status_interval
+        ):
+            return
+        self._pool_status_logged = now
+
+        pools = [
+            ("DB pool", pool_status(async_engine)),
+            ("DB read pool", pool_status(async_read_engine)),
+            ("DB export pool", pool_status(async_export_engine)),
+            # Выгрузки в Excel: в работе и в очереди
+            ("Export pool", export_pool.status()),
+        ]
+        for label, status in pools:
+            if status:
+                metrics_logger.info(
+                    f"{label} - "
+                    + ", ".join(f"{name}={value}" for name, value in status.items())
+                )
 
     async def __call__(
         self,
@@ -112,7 +150,8 @@ class MetricsMiddleware:
         start_time = time.time()
 
         try:
-            result = await handler(update, context)
+            with count_queries() as queries:
+                result = await handler(update, context)
             execution_time = time.time() - start_time
 
             # Обновляем метрики
@@ -138,9 +177,12 @@ class MetricsMiddleware:
                 f"calls={stats['total_calls']}, "
                 f"avg_time={stats['avg_time']:.3f}s, "
                 f"min_time={stats['min_time']:.3f}s, "
-                f"max_time={stats['max_time']:.3f}s"
+                f"max_time={stats['max_time']:.3f}s, "
+                f"queries={queries.count}"
             )
 
+            self._log_pool_status()
+
             return result
 
         except Exception:
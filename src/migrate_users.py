@@ -1,61 +1,61 @@
 """
 Скрипт для упрощения модели User в базе данных.
 Удаляет лишние поля из таблицы users (username, first_name, last_name),
-сохраняя только id и telegram_id.
+сохраняя только id, telegram_id и created_at.
+
+Таблица перестраивается онлайн (src/online_migration.py): бот продолжает
+работать, а прерванную миграцию можно запустить снова — она продолжится
+с последней скопированной порции.
+
+    python -m src.migrate_users [--batch-size N] [--pause SECONDS]
 """
 
-from sqlalchemy import text
-from src.database import SessionLocal, engine
-import sqlite3
+import argparse
 
+from sqlalchemy import inspect
+from src.database import engine
+from src.models import User
+from src.online_migration import (
+    MIGRATION_BATCH_SIZE,
+    MIGRATION_PAUSE,
+    OnlineTableRebuild,
+)
 
-def run_user_migration():
-    # Используем непосредственно сессию SQLAlchemy
-    db = SessionLocal()
-    connection = db.connection()
+# Поля старой модели User, которых больше нет
+LEGACY_COLUMNS = ("username", "first_name", "last_name")
+MIGRATION_NAME = "users_drop_legacy_columns"
 
-    try:
-        # 1. Создаем временную таблицу только с нужными полями
-        connection.execute(
-            text(
-                """
-        CREATE TABLE users_new (
-            id INTEGER PRIMARY KEY,
-            telegram_id BIGINT NOT NULL UNIQUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        """
-            )
-        )
 
-        # 2. Копируем данные из старой таблицы в новую
-        connection.execute(
-            text(
-                """
-        INSERT INTO users_new (id, telegram_id, created_at)
-        SELECT id, telegram_id, created_at FROM users
-        """
-            )
+def run_user_migration(
+    engine=engine, batch_size=MIGRATION_BATCH_SIZE, pause=MIGRATION_PAUSE
+):
+    try:
+        inspector = inspect(engine)
+        columns = {column["name"] for column in inspector.get_columns("users")}
+        unfinished = any(
+            table.startswith(("_new_users", "_old_users"))
+            for table in inspector.get_table_names()
         )
+        if not unfinished and not any(column in columns for column in LEGACY_COLUMNS):
+            print("Таблица users уже в новом формате, миграция не нужна.")
+            return
 
-        # 3. Удаляем старую таблицу
-        connection.execute(text("DROP TABLE users"))
+        def report(copied, total):
+            print(f"Скопировано {copied} из {total} пользователей")
 
-        # 4. Переименовываем новую таблицу
-        connection.execute(text("ALTER TABLE users_new RENAME TO users"))
-
-        # Фиксируем изменения
-        db.commit()
+        rebuild = OnlineTableRebuild(
+            engine, MIGRATION_NAME, User.__table__, batch_size=batch_size, pause=pause
+        )
+        rebuild.run(progress=report)
         print("Миграция модели User успешно выполнена!")
 
     except Exception as e:
-        # В случае ошибки откатываем изменения
-        db.rollback()
         print(f"Ошибка при выполнении миграции: {e}")
-    finally:
-        # Закрываем соединение
-        db.close()
 
 
 if __name__ == "__main__":
-    run_user_migration()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE)
+    args = parser.parse_args()
+    run_user_migration(batch_size=args.batch_size, pause=args.pause)
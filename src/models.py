@@ -2,14 +2,17 @@ from sqlalchemy import (
     Column,
     Integer,
     String,
+    Date,
     Float,
     DateTime,
     ForeignKey,
     Enum,
     BigInteger,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from hashlib import blake2b
 import enum
 from src.database import Base
 
@@ -35,6 +38,32 @@ class User(Base):
         return f"<User {self.telegram_id}>"
 
 
+def transaction_fingerprint(created_at, type, amount, description) -> int:
+    """
+    Отпечаток операции для поиска дублей при импорте выписок: день, тип,
+    сумма в копейках и описание без регистра и лишних пробелов. Тот же
+    расчет повторяет миграция 0008 для уже сохраненных операций
+    """
+    type_name = getattr(type, "name", type)
+    text = " ".join((description or "").lower().split())
+    key = f"{created_at:%Y-%m-%d}|{type_name}|{round(amount * 100)}|{text}"
+    digest = blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _fingerprint_default(context) -> int:
+    values = context.get_current_parameters()
+    if values.get("created_at") is None or values.get("amount") is None:
+        # Без суммы вставка не пройдет NOT NULL, без даты отпечаток не нужен
+        return None
+    return transaction_fingerprint(
+        values["created_at"],
+        values.get("type"),
+        values["amount"],
+        values.get("description"),
+    )
+
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
@@ -45,15 +74,47 @@ class Transaction(Base):
     type = Column(Enum(TransactionType), nullable=False)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Считается при вставке из остальных колонок, см. transaction_fingerprint
+    fingerprint = Column(BigInteger, nullable=True, default=_fingerprint_default)
 
-    # Отношения
+    # Отношения. Категорию при чтении списков не подгружаем вовсе: имена
+    # берутся из category_registry, а ленивая загрузка (запрос на каждую
+    # строку) запрещена
     user = relationship("User", back_populates="transactions")
-    category = relationship("Category")
+    category = relationship("Category", lazy="raise")
+
+    # Индексы под запросы истории, статистики, категорий, экспорта и очистки.
+    # Меняются только через миграции Alembic (migrations/versions)
+    __table_args__ = (
+        Index("ix_transactions_created_at", "created_at"),
+        Index("ix_transactions_user_created", "user_id", "created_at"),
+        Index("ix_transactions_user_type_created", "user_id", "type", "created_at"),
+        Index(
+            "ix_transactions_user_category_created",
+            "user_id",
+            "category_id",
+            "created_at",
+        ),
+        Index("ix_transactions_user_fingerprint", "user_id", "fingerprint"),
+    )
 
     def __repr__(self):
         return f"<Transaction {self.type.value} {self.amount}>"
 
 
+# Колонки операции для чтения списками (/history, /category, /export):
+# компактные кортежи без ORM-объектов; порядок как у ArchivedTransaction
+TRANSACTION_ROW = (
+    Transaction.id,
+    Transaction.user_id,
+    Transaction.created_at,
+    Transaction.type,
+    Transaction.amount,
+    Transaction.category_id,
+    Transaction.description,
+)
+
+
 class Category(Base):
     __tablename__ = "categories"
 
@@ -65,3 +126,60 @@ class Category(Base):
 
     def __repr__(self):
         return f"<Category {self.name}>"
+
+
+class UserBalance(Base):
+    """Итоги пользователя, поддерживаемые при каждой записи транзакций"""
+
+    __tablename__ = "user_balances"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    income = Column(Float, nullable=False, default=0)
+    expense = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserBalance {self.user_id} +{self.income} -{self.expense}>"
+
+
+class DailyRollup(Base):
+    """Дневная сводка: сумма и число операций пользователя по категории и типу"""
+
+    __tablename__ = "daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    # 0 — операции без категории (NULL не может входить в первичный ключ)
+    category_id = Column(Integer, primary_key=True, autoincrement=False)
+    type = Column(Enum(TransactionType), primary_key=True)
+    total = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DailyRollup {self.user_id} {self.day} {self.type.value} {self.total}>"
+
+
+class GlobalCounter(Base):
+    """Общие счетчики по всем пользователям для /total"""
+
+    __tablename__ = "global_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<GlobalCounter {self.name}={self.value}>"
+
+
+class UserCategoryToken(Base):
+    """Сколько раз пользователь относил операции со словом token к категории"""
+
+    __tablename__ = "user_category_tokens"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    token = Column(String, primary_key=True)
+    category_id = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<UserCategoryToken {self.user_id} {self.token} {self.category_id}>"
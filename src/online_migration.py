@@ -0,0 +1,441 @@
+"""
+Перестройка таблицы без остановки бота.
+
+Перестройка одним INSERT ... SELECT (так делает batch-режим Alembic в
+SQLite) держит блокировку записи все время копирования. Здесь копирование
+идет короткими порциями:
+
+1. Создается теневая таблица с новой схемой, а на исходную вешаются
+   триггеры: вставки, изменения и удаления, которые бот делает во время
+   копирования, сразу повторяются в теневой таблице.
+2. Строки копируются порциями по диапазону первичного ключа, каждая в
+   своей транзакции, до последнего id на момент установки триггеров (новые
+   строки уже скопировали триггеры). Граница последней скопированной порции
+   записывается в online_migrations в той же транзакции, поэтому после сбоя
+   копирование продолжается с того же места.
+3. В одной транзакции таблицы меняются местами, а триггеры удаляются.
+   Старая таблица удаляется после этого.
+
+Требования к таблице: целочисленный первичный ключ id. Колонки новой схемы,
+которых нет в старой, получают значения по умолчанию.
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    func,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from src.database import configure_sqlite
+
+# Строк в одной порции копирования и пауза между порциями, секунды:
+# в паузах бот успевает записать свои операции
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "10000"))
+MIGRATION_PAUSE = float(os.getenv("MIGRATION_PAUSE", "0.01"))
+
+# Состояния миграции в online_migrations
+STATE_COPYING = "copying"
+STATE_DONE = "done"
+
+# Вызывается после каждой порции: (скопировано, всего в исходной таблице)
+Progress = Callable[[int, int], None]
+
+_progress_metadata = MetaData()
+online_migrations = Table(
+    "online_migrations",
+    _progress_metadata,
+    Column("name", String, primary_key=True),
+    Column("table_name", String, nullable=False),
+    Column("state", String, nullable=False),
+    Column("last_id", Integer, nullable=False, default=0),
+    Column("copied", Integer, nullable=False, default=0),
+    # Последний id и число строк на момент установки триггеров: более новые
+    # строки триггеры уже скопировали
+    Column("end_id", Integer, nullable=False),
+    Column("total", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+
+def migration_engine(engine: Engine) -> Engine:
+    """
+    Движок для шагов миграции. sqlite3 не открывает транзакцию перед DDL,
+    поэтому для SQLite транзакции начинаются явно: BEGIN IMMEDIATE сразу
+    берет блокировку записи и ждет её по busy_timeout
+    """
+    if engine.dialect.name != "sqlite":
+        return engine
+
+    sqlite_engine = create_engine(engine.url, connect_args={"isolation_level": None})
+    configure_sqlite(sqlite_engine)
+
+    @event.listens_for(sqlite_engine, "begin")
+    def begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return sqlite_engine
+
+
+class OnlineTableRebuild:
+    """Перестройка таблицы target.name по схеме target"""
+
+    def __init__(
+        self,
+        engine: Engine,
+        name: str,
+        target: Table,
+        batch_size: int = MIGRATION_BATCH_SIZE,
+        pause: float = MIGRATION_PAUSE,
+    ):
+        self.source_engine = engine
+        self.engine = migration_engine(engine)
+        self.name = name
+        self.table_name = target.name
+        self.shadow_name = f"_new_{target.name}"
+        self.old_name = f"_old_{target.name}"
+        self.batch_size = batch_size
+        self.pause = pause
+        self.dialect = engine.dialect.name
+
+        # Теневая таблица: та же схема под другим именем. Имена индексов в
+        # схеме общие, поэтому до замены у индексов временные имена
+        metadata = MetaData()
+        self.shadow = target.to_metadata(metadata, name=self.shadow_name)
+        self.index_names = {}
+        for index in self.shadow.indexes:
+            final_name = index.name
+            index.name = f"{self.shadow_name}__{final_name}"
+            self.index_names[index.name] = final_name
+
+        source_columns = {
+            column["name"] for column in inspect(engine).get_columns(self.table_name)
+        }
+        self.columns = [c.name for c in self.shadow.columns if c.name in source_columns]
+        self.source = Table(
+            self.table_name, MetaData(), *(Column(name) for name in self.columns)
+        )
+
+    # Состояние
+
+    def state(self, connection: Connection) -> Optional[dict]:
+        row = connection.execute(
+            select(online_migrations).where(online_migrations.c.name == self.name)
+        ).first()
+        return row._asdict() if row else None
+
+    def _save_progress(self, connection: Connection, **values):
+        connection.execute(
+            online_migrations.update()
+            .where(online_migrations.c.name == self.name)
+            .values(updated_at=datetime.utcnow(), **values)
+        )
+
+    # Запуск
+
+    def run(self, progress: Optional[Progress] = None) -> int:
+        """Выполняет или продолжает миграцию; возвращает число строк в таблице"""
+        try:
+            return self._run(progress)
+        finally:
+            if self.engine is not self.source_engine:
+                self.engine.dispose()
+
+    def _run(self, progress: Optional[Progress]) -> int:
+        _progress_metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            state = self.state(connection)
+            if state is None:
+                self._prepare(connection)
+            elif state["state"] == STATE_DONE:
+                # Сбой мог случиться между заменой и уборкой
+                self._cleanup()
+                return state["copied"]
+
+        self._copy(progress)
+        copied = self._swap()
+        self._cleanup()
+        return copied
+
+    def _prepare(self, connection: Connection):
+        """Теневая таблица, триггеры и запись о миграции — одной транзакцией"""
+        self.shadow.create(connection)
+        for statement in self._trigger_ddl():
+            connection.exec_driver_sql(statement)
+        end_id, total = connection.execute(
+            select(func.coalesce(func.max(self.source.c.id), 0), func.count())
+        ).one()
+        connection.execute(
+            online_migrations.insert().values(
+                name=self.name,
+                table_name=self.table_name,
+                state=STATE_COPYING,
+                last_id=0,
+                copied=0,
+                end_id=end_id,
+                total=total,
+            )
+        )
+
+    def _copy(self, progress: Optional[Progress]):
+        source_id = self.source.c.id
+        while True:
+            with self.engine.begin() as connection:
+                state = self.state(connection)
+                last_id, end_id = state["last_id"], state["end_id"]
+                if last_id >= end_id:
+                    return
+
+                # Верхняя граница порции: batch_size-й id после last_id
+                upper = connection.scalar(
+                    select(source_id)
+                    .where(source_id > last_id, source_id <= end_id)
+                    .order_by(source_id)
+                    .offset(self.batch_size - 1)
+                    .limit(1)
+                )
+                if upper is None:
+                    upper = end_id
+
+                copied = state["copied"] + self._copy_range(connection, last_id, upper)
+                self._save_progress(connection, last_id=upper, copied=copied)
+
+            self._checkpoint()
+            if progress:
+                progress(copied, state["total"])
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _checkpoint(self):
+        """
+        Переносит порцию из журнала WAL в файл БД. Иначе журнал растет, и
+        автоматический checkpoint на миллионы строк достается случайной
+        записи бота
+        """
+        if self.dialect != "sqlite":
+            return
+        with self.engine.connect() as connection:
+            connection.connection.dbapi_connection.execute(
+                "PRAGMA wal_checkpoint(PASSIVE)"
+            )
+
+    def _copy_range(self, connection: Connection, low: int, high: int) -> int:
+        """Копирует строки с id в (low, high]; уже скопированные триггером пропускает"""
+        insert = (postgresql if self.dialect == "postgresql" else sqlite).insert
+        rows = (
+            select(*(self.source.c[name] for name in self.columns)).where(
+                self.source.c.id > low, self.source.c.id <= high
+            )
+            # В PostgreSQL удаление строки из порции ждет её commit, иначе
+            # триггер удаления не увидел бы ещё не скопированную строку
+            .with_for_update(read=True)
+        )
+        result = connection.execute(
+            insert(self.shadow)
+            .from_select(self.columns, rows)
+            .on_conflict_do_nothing(index_elements=["id"])
+        )
+        return result.rowcount
+
+    def _swap(self):
+        """Меняет таблицы местами в одной транзакции"""
+        with self.engine.begin() as connection:
+            if self.dialect == "sqlite":
+                # Иначе SQLite перепишет внешние ключи других таблиц на
+                # переименованную старую таблицу
+                connection.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+            else:
+                connection.exec_driver_sql(
+                    f'LOCK TABLE "{self.table_name}" IN ACCESS EXCLUSIVE MODE'
+                )
+
+            foreign_keys = (
+                self._referencing_foreign_keys(connection)
+                if self.dialect == "postgresql"
+                else []
+            )
+            for statement in self._drop_trigger_ddl():
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(
+                f'ALTER TABLE "{self.table_name}" RENAME TO "{self.old_name}"'
+            )
+            connection.exec_driver_sql(
+                f'ALTER TABLE "{self.shadow_name}" RENAME TO "{self.table_name}"'
+            )
+
+            if self.dialect == "postgresql":
+                # Внешние ключи PostgreSQL ссылаются на саму таблицу, а не на
+                # имя: переводим их на новую без проверки строк (NOT VALID)
+                for table, fk in foreign_keys:
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE "{table}" DROP CONSTRAINT "{fk["name"]}"'
+                    )
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE "{table}" ADD CONSTRAINT "{fk["name"]}" '
+                        f'FOREIGN KEY ({", ".join(fk["constrained_columns"])}) '
+                        f'REFERENCES "{self.table_name}" '
+                        f'({", ".join(fk["referred_columns"])}) NOT VALID'
+                    )
+                # Последовательность id теневой таблицы начиналась с 1
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{self.table_name}', 'id'), "
+                    f'COALESCE((SELECT MAX(id) FROM "{self.table_name}"), 0) + 1, false)'
+                )
+
+            copied = connection.scalar(
+                text(f'SELECT COUNT(*) FROM "{self.table_name}"')
+            )
+            self._save_progress(connection, state=STATE_DONE, copied=copied)
+
+            if self.dialect == "sqlite":
+                connection.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+        return copied
+
+    def _cleanup(self):
+        """Проверка внешних ключей, удаление старой таблицы, имена индексов"""
+        if self.dialect == "sqlite":
+            self._empty_old_table()
+        with self.engine.begin() as connection:
+            if self.dialect == "postgresql":
+                not_valid = connection.execute(
+                    text(
+                        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+                        "WHERE confrelid = CAST(:table AS regclass) "
+                        "AND contype = 'f' AND NOT convalidated"
+                    ),
+                    {"table": self.table_name},
+                )
+                for table, name in not_valid.all():
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"'
+                    )
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{self.old_name}"')
+
+            existing = {
+                index["name"]
+                for index in inspect(connection).get_indexes(self.table_name)
+            }
+            for index in self.shadow.indexes:
+                if index.name not in existing:
+                    continue
+                final = self.index_names[index.name]
+                if self.dialect == "postgresql":
+                    connection.exec_driver_sql(
+                        f'ALTER INDEX "{index.name}" RENAME TO "{final}"'
+                    )
+                else:
+                    # SQLite не умеет переименовывать индексы
+                    columns = ", ".join(f'"{c.name}"' for c in index.columns)
+                    unique = "UNIQUE " if index.unique else ""
+                    connection.exec_driver_sql(f'DROP INDEX "{index.name}"')
+                    connection.exec_driver_sql(
+                        f'CREATE {unique}INDEX "{final}" '
+                        f'ON "{self.table_name}" ({columns})'
+                    )
+
+    def _empty_old_table(self):
+        """
+        DROP TABLE в SQLite освобождает все страницы таблицы под блокировкой
+        записи, поэтому старая таблица сначала очищается порциями
+        """
+        if self.old_name not in inspect(self.engine).get_table_names():
+            return
+        delete = text(
+            f'DELETE FROM "{self.old_name}" WHERE id IN '
+            f'(SELECT id FROM "{self.old_name}" ORDER BY id LIMIT :limit)'
+        )
+        while True:
+            with self.engine.begin() as connection:
+                if not connection.execute(delete, {"limit": self.batch_size}).rowcount:
+                    return
+            self._checkpoint()
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _referencing_foreign_keys(self, connection: Connection) -> List[tuple]:
+        inspector = inspect(connection)
+        return [
+            (table, fk)
+            for table in inspector.get_table_names()
+            if table not in (self.table_name, self.shadow_name)
+            for fk in inspector.get_foreign_keys(table)
+            if fk["referred_table"] == self.table_name and fk.get("name")
+        ]
+
+    # Триггеры
+
+    def _trigger_ddl(self) -> List[str]:
+        columns = ", ".join(f'"{name}"' for name in self.columns)
+        new_values = ", ".join(f'NEW."{name}"' for name in self.columns)
+        shadow, source = self.shadow_name, self.table_name
+
+        if self.dialect == "postgresql":
+            updates = ", ".join(
+                f'"{name}" = EXCLUDED."{name}"' for name in self.columns if name != "id"
+            )
+            return [
+                f"""
+                CREATE FUNCTION "{shadow}_sync"() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.id <> NEW.id) THEN
+                        DELETE FROM "{shadow}" WHERE id = OLD.id;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        INSERT INTO "{shadow}" ({columns}) VALUES ({new_values})
+                        ON CONFLICT (id) DO UPDATE SET {updates};
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql
+                """,
+                f"""
+                CREATE TRIGGER "{shadow}_sync"
+                AFTER INSERT OR UPDATE OR DELETE ON "{source}"
+                FOR EACH ROW EXECUTE FUNCTION "{shadow}_sync"()
+                """,
+            ]
+
+        return [
+            f"""
+            CREATE TRIGGER "{shadow}_insert" AFTER INSERT ON "{source}" BEGIN
+                INSERT OR REPLACE INTO "{shadow}" ({columns}) VALUES ({new_values});
+            END
+            """,
+            f"""
+            CREATE TRIGGER "{shadow}_update" AFTER UPDATE ON "{source}" BEGIN
+                DELETE FROM "{shadow}" WHERE id = OLD.id;
+                INSERT OR REPLACE INTO "{shadow}" ({columns}) VALUES ({new_values});
+            END
+            """,
+            f"""
+            CREATE TRIGGER "{shadow}_delete" AFTER DELETE ON "{source}" BEGIN
+                DELETE FROM "{shadow}" WHERE id = OLD.id;
+            END
+            """,
+        ]
+
+    def _drop_trigger_ddl(self) -> List[str]:
+        shadow = self.shadow_name
+        if self.dialect == "postgresql":
+            return [
+                f'DROP TRIGGER "{shadow}_sync" ON "{self.table_name}"',
+                f'DROP FUNCTION "{shadow}_sync"()',
+            ]
+        return [
+            f'DROP TRIGGER "{shadow}_{event}"'
+            for event in ("insert", "update", "delete")
+        ]
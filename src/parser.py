@@ -0,0 +1,79 @@
+"""
+Разбор сообщений о транзакциях в свободной форме.
+
+Каждая строка со знаком — одна операция: знак, сумма, необязательная
+валюта и описание ("-1 234,50 руб. продукты"). Строка разбирается одним
+проходом скомпилированного выражения сразу в типизированную запись;
+сообщение из нескольких строк дает несколько операций. Строка без знака
+продолжает описание предыдущей операции.
+"""
+
+import re
+from typing import List, NamedTuple
+
+from src.messages import ERROR_INVALID_AMOUNT, ERROR_NO_DESCRIPTION
+from src.models import TransactionType
+
+# Знак, сумма (разряды можно отделять пробелом: "1 234 567"), валюта
+# отдельным словом и описание
+_LINE = re.compile(
+    r"""
+    \s*(?P<sign>[-+])\s*
+    (?P<amount>(?:\d{1,3}(?:[  ]\d{3})+|\d+)(?:[.,]\d+)?)?
+    \s*(?:(?:рублей|руб\.|руб|р\.)(?=\s|$))?
+    \s*(?P<description>.*?)\s*
+    """,
+    re.VERBOSE | re.IGNORECASE,
+)
+
+_TYPES = {"-": TransactionType.EXPENSE, "+": TransactionType.INCOME}
+
+
+class ParsedTransaction(NamedTuple):
+    type: TransactionType
+    amount: float
+    description: str
+
+
+class ParseError(ValueError):
+    """Строка line (с 1) не разобрана; message — текст ошибки для пользователя"""
+
+    def __init__(self, line: int, message: str):
+        super().__init__(message)
+        self.line = line
+        self.message = message
+
+
+def parse_line(line: str, number: int = 1) -> ParsedTransaction:
+    match = _LINE.fullmatch(line)
+    if match is None:
+        raise ParseError(number, ERROR_INVALID_AMOUNT)
+    sign, amount, description = match.group("sign", "amount", "description")
+    if not description:
+        raise ParseError(number, ERROR_NO_DESCRIPTION)
+    if amount is None:
+        raise ParseError(number, ERROR_INVALID_AMOUNT)
+    amount = float(amount.replace(" ", "").replace(" ", "").replace(",", "."))
+    return ParsedTransaction(_TYPES[sign], amount, description)
+
+
+def parse_message(text: str) -> List[ParsedTransaction]:
+    """
+    Операции из сообщения; пустой список, если сообщение не начинается со
+    знака + или - (это не операция). Пустые строки пропускаются, строки без
+    знака дописываются к описанию предыдущей операции, первая же ошибочная
+    строка отменяет разбор всего сообщения
+    """
+    records: List[ParsedTransaction] = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] in _TYPES:
+            records.append(parse_line(line, number))
+        elif records:
+            record = records[-1]
+            records[-1] = record._replace(description=f"{record.description} {line}")
+        else:
+            return []
+    return records
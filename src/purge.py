@@ -0,0 +1,114 @@
+"""
+Очистка старых транзакций для /clean_db.
+
+Транзакции удаляются порциями по PURGE_CHUNK_SIZE строк запросом
+DELETE ... RETURNING: в память попадает только одна порция, а агрегаты
+уменьшаются ровно на удаленные строки в той же транзакции БД. Между
+порциями блокировка записи отпускается, и бот продолжает принимать
+операции.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import delete, func, select, text
+
+from src import aggregates
+from src.database import SQLITE_AUTO_VACUUM_INCREMENTAL, AsyncSessionLocal
+from src.models import Transaction
+
+PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "5000"))
+# Минимальный интервал между сообщениями о прогрессе, секунды
+PROGRESS_INTERVAL = float(os.getenv("PURGE_PROGRESS_INTERVAL", "1.0"))
+# Сколько страниц SQLite освобождать за один PRAGMA incremental_vacuum
+VACUUM_PAGES_PER_STEP = int(os.getenv("VACUUM_PAGES_PER_STEP", "1000"))
+
+# Вызывается после каждой порции: (удалено, всего)
+Progress = Callable[[int, int], Awaitable[None]]
+
+
+async def count_before(cutoff: datetime, session_factory=AsyncSessionLocal) -> int:
+    """Число транзакций старше cutoff"""
+    async with session_factory() as db:
+        return await db.scalar(
+            select(func.count()).where(Transaction.created_at < cutoff)
+        )
+
+
+async def purge_before(
+    cutoff: datetime,
+    session_factory=AsyncSessionLocal,
+    chunk_size: int = PURGE_CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+) -> int:
+    """Удаляет транзакции старше cutoff порциями, возвращает число удаленных"""
+    total = await count_before(cutoff, session_factory)
+    deleted = 0
+
+    while deleted < total:
+        chunk = (
+            select(Transaction.id)
+            .where(Transaction.created_at < cutoff)
+            .limit(chunk_size)
+            .scalar_subquery()
+        )
+        stmt = (
+            delete(Transaction)
+            .where(Transaction.id.in_(chunk))
+            .returning(
+                Transaction.user_id,
+                Transaction.created_at,
+                Transaction.category_id,
+                Transaction.type,
+                Transaction.amount,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with session_factory() as db:
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                break
+            await aggregates.record_deletions(db, aggregates.group_by_rollup(rows))
+            await db.commit()
+
+        deleted += len(rows)
+        if progress:
+            await progress(deleted, total)
+        # Даем обработчикам пользователей выполниться между порциями
+        await asyncio.sleep(0)
+
+    return deleted
+
+
+async def reclaim_space(
+    session_factory=AsyncSessionLocal, pages_per_step: int = VACUUM_PAGES_PER_STEP
+) -> int:
+    """
+    Возвращает свободные страницы SQLite файловой системе небольшими шагами,
+    не блокируя БД надолго. Возвращает число освобожденных страниц;
+    для других БД ничего не делает (PostgreSQL чистит autovacuum)
+    """
+    freed = 0
+    async with session_factory() as db:
+        if db.get_bind().dialect.name != "sqlite":
+            return 0
+        auto_vacuum = await db.scalar(text("PRAGMA auto_vacuum"))
+        if auto_vacuum != SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return 0
+
+        # sqlite3 выполняет один шаг PRAGMA incremental_vacuum, а это одна
+        # страница; executescript доводит команду до конца
+        connection = await (await db.connection()).get_raw_connection()
+        free = await db.scalar(text("PRAGMA freelist_count"))
+        while free:
+            await connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(pages_per_step)});"
+            )
+            remaining = await db.scalar(text("PRAGMA freelist_count"))
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+    return freed
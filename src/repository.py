@@ -0,0 +1,202 @@
+"""
+Готовые запросы горячих путей: пользователи, транзакции, категории и
+агрегаты.
+
+Каждый select строится один раз при импорте, а значения передаются через
+bindparam. Обработчик не собирает конструкцию заново на каждый вызов, и
+SQLAlchemy берет скомпилированный SQL из кэша по готовому ключу, а не
+вычисляет ключ по свежему дереву выражений.
+"""
+
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models import (
+    TRANSACTION_ROW,
+    Category,
+    DailyRollup,
+    GlobalCounter,
+    Transaction,
+    User,
+    UserBalance,
+    UserCategoryToken,
+)
+
+# Пользователи
+
+_USER_ID = select(User.id).where(User.telegram_id == bindparam("telegram_id"))
+
+
+async def user_id_by_telegram_id(db: AsyncSession, telegram_id: int) -> Optional[int]:
+    return await db.scalar(_USER_ID, {"telegram_id": telegram_id})
+
+
+# Категории
+
+_CATEGORIES = select(Category.id, Category.name, Category.keywords)
+_CATEGORY_ID = select(Category.id).where(Category.name == bindparam("name"))
+
+
+async def categories(db: AsyncSession) -> List[Tuple[int, str, Optional[str]]]:
+    """(id, имя, ключевые слова) всех категорий"""
+    return (await db.execute(_CATEGORIES)).all()
+
+
+async def category_id_by_name(db: AsyncSession, name: str) -> Optional[int]:
+    return await db.scalar(_CATEGORY_ID, {"name": name})
+
+
+_USER_CATEGORY_TOKENS = select(
+    UserCategoryToken.token, UserCategoryToken.category_id, UserCategoryToken.count
+).where(UserCategoryToken.user_id == bindparam("user_id"))
+
+
+async def user_category_tokens(
+    db: AsyncSession, user_id: int
+) -> List[Tuple[str, int, int]]:
+    """(слово, категория, число исправлений) пользователя"""
+    return (await db.execute(_USER_CATEGORY_TOKENS, {"user_id": user_id})).all()
+
+
+# Транзакции (кортежи TRANSACTION_ROW, новые первыми)
+
+_TRANSACTIONS_BETWEEN = (
+    select(*TRANSACTION_ROW)
+    .where(
+        Transaction.user_id == bindparam("user_id"),
+        Transaction.created_at >= bindparam("start"),
+        Transaction.created_at < bindparam("end"),
+    )
+    .order_by(Transaction.created_at.desc())
+)
+_CATEGORY_TRANSACTIONS = (
+    select(*TRANSACTION_ROW)
+    .where(
+        Transaction.user_id == bindparam("user_id"),
+        Transaction.category_id == bindparam("category_id"),
+    )
+    .order_by(Transaction.created_at.desc())
+    .limit(bindparam("limit"))
+)
+_USER_TRANSACTIONS = (
+    select(*TRANSACTION_ROW)
+    .where(Transaction.user_id == bindparam("user_id"))
+    .order_by(Transaction.created_at.desc())
+)
+_USER_TRANSACTION_BOUNDS = select(
+    func.count().label("count"),
+    func.min(Transaction.amount).label("min_amount"),
+    func.max(Transaction.amount).label("max_amount"),
+    func.max(func.length(Transaction.description)).label("max_description"),
+).where(Transaction.user_id == bindparam("user_id"))
+_HAS_TRANSACTIONS_BETWEEN = (
+    select(Transaction.id)
+    .where(
+        Transaction.user_id == bindparam("user_id"),
+        Transaction.created_at >= bindparam("start"),
+        Transaction.created_at < bindparam("end"),
+    )
+    .limit(1)
+)
+
+
+async def transactions_between(
+    db: AsyncSession, user_id: int, start: datetime, end: datetime
+) -> list:
+    """Операции пользователя за [start, end)"""
+    params = {"user_id": user_id, "start": start, "end": end}
+    return (await db.execute(_TRANSACTIONS_BETWEEN, params)).all()
+
+
+async def has_transactions_between(
+    db: AsyncSession, user_id: int, start: datetime, end: datetime
+) -> bool:
+    params = {"user_id": user_id, "start": start, "end": end}
+    return await db.scalar(_HAS_TRANSACTIONS_BETWEEN, params) is not None
+
+
+async def category_transactions(
+    db: AsyncSession, user_id: int, category_id: int, limit: int
+) -> list:
+    """Последние limit операций пользователя в категории"""
+    params = {"user_id": user_id, "category_id": category_id, "limit": limit}
+    return (await db.execute(_CATEGORY_TRANSACTIONS, params)).all()
+
+
+async def stream_user_transactions(
+    db: AsyncSession, user_id: int, chunk_size: int
+) -> AsyncIterator[list]:
+    """Все операции пользователя, новые первыми, порциями по chunk_size строк"""
+    result = await db.stream(
+        _USER_TRANSACTIONS,
+        {"user_id": user_id},
+        execution_options={"yield_per": chunk_size},
+    )
+    async for rows in result.partitions():
+        yield rows
+
+
+async def user_transaction_bounds(db: AsyncSession, user_id: int):
+    """Число операций пользователя, наименьшая и наибольшая суммы, длина описания"""
+    return (await db.execute(_USER_TRANSACTION_BOUNDS, {"user_id": user_id})).one()
+
+
+# Агрегаты
+
+_BALANCE = select(UserBalance.income, UserBalance.expense).where(
+    UserBalance.user_id == bindparam("user_id")
+)
+_COUNTERS = select(GlobalCounter.name, GlobalCounter.value)
+
+# Дни с операциями после first_day; вместо необязательных условий
+# before/after — границы date.max/date.min, чтобы запрос был один
+_ACTIVE_DAYS = (
+    select(DailyRollup.day)
+    .where(
+        DailyRollup.user_id == bindparam("user_id"),
+        DailyRollup.day > bindparam("first_day"),
+        DailyRollup.day < bindparam("before"),
+        DailyRollup.day > bindparam("after"),
+    )
+    .group_by(DailyRollup.day)
+    .having(func.sum(DailyRollup.count) > 0)
+)
+_ACTIVE_DAYS_DESC = _ACTIVE_DAYS.order_by(DailyRollup.day.desc()).limit(
+    bindparam("limit")
+)
+_ACTIVE_DAYS_ASC = _ACTIVE_DAYS.order_by(DailyRollup.day).limit(bindparam("limit"))
+
+
+async def balance(db: AsyncSession, user_id: int) -> Optional[Tuple[float, float]]:
+    """(доходы, расходы) из user_balances или None"""
+    return (await db.execute(_BALANCE, {"user_id": user_id})).first()
+
+
+async def counters(db: AsyncSession) -> Dict[str, float]:
+    return dict((await db.execute(_COUNTERS)).all())
+
+
+async def active_days(
+    db: AsyncSession,
+    user_id: int,
+    first_day: date,
+    limit: int,
+    before: Optional[date] = None,
+    after: Optional[date] = None,
+) -> List[date]:
+    """
+    Дни после first_day с ненулевыми сводками: limit ближайших раньше before
+    (по убыванию) или позже after (по возрастанию)
+    """
+    params = {
+        "user_id": user_id,
+        "first_day": first_day,
+        "before": before or date.max,
+        "after": after or date.min,
+        "limit": limit,
+    }
+    stmt = _ACTIVE_DAYS_DESC if after is None else _ACTIVE_DAYS_ASC
+    return list(await db.scalars(stmt, params))
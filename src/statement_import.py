@@ -0,0 +1,357 @@
+"""
+Импорт банковской выписки (CSV или XLSX) в историю пользователя.
+
+Файл читается потоком: CSV — модулем csv построчно, XLSX — openpyxl в
+режиме read_only, поэтому в памяти одновременно только одна порция из
+IMPORT_BATCH_SIZE строк. Разбор порции идет в отдельном потоке, чтобы
+большой файл не задерживал обработку остальных сообщений.
+
+Строку заголовка ищем среди первых строк файла по названиям колонок
+(дата, сумма, описание, необязательные тип и категория); подходит и файл
+из /export. Тип операции берется из колонки "Тип", иначе из знака суммы.
+Строки, которые не удалось разобрать (итоги, пустые, примечания),
+пропускаются и подсчитываются.
+
+Дубли ищутся по отпечатку (см. src.models.transaction_fingerprint) через
+индекс (user_id, fingerprint): строка выписки считается уже сохраненной,
+если в БД есть операция с тем же отпечатком, не сопоставленная раньше
+другой строкой. Так две одинаковые покупки за день в выписке не
+склеиваются в одну. Перенесенные в архив операции не проверяются.
+"""
+
+import asyncio
+import codecs
+import csv
+import os
+import re
+from datetime import date, datetime, time
+from itertools import islice
+from pathlib import Path
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from openpyxl import load_workbook
+from sqlalchemy import func, insert, select
+
+from src import aggregates
+from src.categories import category_registry
+from src.database import AsyncSessionLocal
+from src.messages import (
+    EXPORT_TRANSACTION_TYPE_EXPENSE,
+    EXPORT_TRANSACTION_TYPE_INCOME,
+    IMPORT_NO_HEADER,
+    IMPORT_UNSUPPORTED_FORMAT,
+)
+from src.models import Transaction, TransactionType, transaction_fingerprint
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+# В стольких первых строках файла ищется заголовок
+HEADER_SEARCH_ROWS = 30
+# Объем начала CSV-файла для определения кодировки и разделителя
+CSV_SAMPLE_SIZE = 64 * 1024
+# Отпечатков в одном запросе: старые сборки SQLite принимают не больше 999
+# параметров
+LOOKUP_CHUNK_SIZE = 500
+
+# Вызывается после каждой порции: (импортировано, дублей, пропущено строк)
+Progress = Callable[[int, int, int], Awaitable[None]]
+
+# Названия колонок выписок (без регистра) → поле строки
+COLUMNS = {
+    "date": ("дата", "дата операции", "дата платежа", "дата и время", "date"),
+    "amount": ("сумма", "сумма операции", "сумма платежа", "amount"),
+    "description": (
+        "описание",
+        "назначение",
+        "назначение платежа",
+        "комментарий",
+        "description",
+    ),
+    "type": ("тип", "тип операции", "type"),
+    "category": ("категория", "category"),
+}
+REQUIRED_COLUMNS = ("date", "amount")
+
+TYPES = {
+    EXPORT_TRANSACTION_TYPE_EXPENSE.lower(): TransactionType.EXPENSE,
+    EXPORT_TRANSACTION_TYPE_INCOME.lower(): TransactionType.INCOME,
+    "expense": TransactionType.EXPENSE,
+    "income": TransactionType.INCOME,
+}
+
+DATE_FORMATS = (
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+)
+
+# Сумма с разрядными пробелами, запятой и валютой: "-1 234,50 ₽"
+_AMOUNT = re.compile(r"([-+−]?)\s*(\d[\d  ]*(?:[.,]\d+)?)\s*(?:[^\d\s.,]{1,6}\.?)?")
+
+
+class StatementError(ValueError):
+    """Файл нельзя импортировать; текст ошибки — для пользователя"""
+
+
+class StatementRow(NamedTuple):
+    created_at: datetime
+    type: TransactionType
+    amount: float
+    description: Optional[str]
+    category: Optional[str]
+
+
+class _NewTransaction(NamedTuple):
+    """Значения колонок вставляемой операции; атрибуты совпадают с Transaction"""
+
+    user_id: int
+    created_at: datetime
+    type: TransactionType
+    amount: float
+    category_id: int
+    description: Optional[str]
+    fingerprint: int
+
+
+class ImportResult(NamedTuple):
+    imported: int
+    duplicates: int
+    skipped: int
+
+
+def _decode_sample(sample: bytes) -> str:
+    """Кодировка CSV: UTF-8 (в том числе с BOM), иначе cp1251 банковских выгрузок"""
+    try:
+        # Последний символ образца может быть обрезан посередине
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def read_csv(path: Path) -> Iterator[Sequence]:
+    with open(path, "rb") as file:
+        sample = file.read(CSV_SAMPLE_SIZE)
+    encoding = _decode_sample(sample)
+    # csv.Sniffer путается в запятых дробных сумм ("-350,00"), поэтому
+    # разделитель — самый частый из возможных
+    text = sample.decode(encoding, errors="ignore")
+    delimiter = max(";\t,", key=text.count)
+    with open(path, encoding=encoding, newline="") as file:
+        yield from csv.reader(file, delimiter=delimiter)
+
+
+def read_xlsx(path: Path) -> Iterator[Sequence]:
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+READERS = {".csv": read_csv, ".xlsx": read_xlsx}
+
+
+def read_statement(path: Path) -> Iterator[Sequence]:
+    """Строки файла выписки как последовательности значений ячеек"""
+    reader = READERS.get(Path(path).suffix.lower())
+    if reader is None:
+        raise StatementError(IMPORT_UNSUPPORTED_FORMAT)
+    return reader(path)
+
+
+def _find_header(rows: Iterator[Sequence]) -> Dict[str, int]:
+    """Номера колонок по строке заголовка; строки до неё пропускаются"""
+    names = {alias: field for field, aliases in COLUMNS.items() for alias in aliases}
+    for row in islice(rows, HEADER_SEARCH_ROWS):
+        columns: Dict[str, int] = {}
+        for index, cell in enumerate(row):
+            field = names.get(str(cell or "").strip().lower())
+            if field and field not in columns:
+                columns[field] = index
+        if all(field in columns for field in REQUIRED_COLUMNS):
+            return columns
+    raise StatementError(IMPORT_NO_HEADER)
+
+
+def parse_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            pass
+    raise ValueError(text)
+
+
+def parse_amount(value) -> float:
+    """Сумма со знаком; разрядные пробелы, запятая и валюта допускаются"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _AMOUNT.fullmatch(str(value).strip())
+    if match is None:
+        raise ValueError(value)
+    sign, number = match.groups()
+    amount = float(number.replace(" ", "").replace(" ", "").replace(",", "."))
+    return -amount if sign in ("-", "−") else amount
+
+
+def _cell(row: Sequence, columns: Dict[str, int], field: str):
+    index = columns.get(field)
+    if index is None or index >= len(row):
+        return None
+    return row[index]
+
+
+def _parse_row(row: Sequence, columns: Dict[str, int]) -> Optional[StatementRow]:
+    """Операция из строки выписки или None, если строку не удалось разобрать"""
+    try:
+        created_at = parse_date(_cell(row, columns, "date"))
+        amount = parse_amount(_cell(row, columns, "amount"))
+    except (TypeError, ValueError):
+        return None
+    if not amount:
+        return None
+
+    type_name = str(_cell(row, columns, "type") or "").strip().lower()
+    transaction_type = TYPES.get(type_name)
+    if transaction_type is None:
+        transaction_type = (
+            TransactionType.EXPENSE if amount < 0 else TransactionType.INCOME
+        )
+    description = str(_cell(row, columns, "description") or "").strip()
+    category = str(_cell(row, columns, "category") or "").strip()
+    return StatementRow(
+        created_at, transaction_type, abs(amount), description or None, category or None
+    )
+
+
+def parse_statement(rows: Iterable[Sequence]) -> Iterator[Optional[StatementRow]]:
+    """
+    Операции выписки по порядку; None на месте строк, которые не удалось
+    разобрать (пустые строки после заголовка не выдаются вовсе)
+    """
+    rows = iter(rows)
+    columns = _find_header(rows)
+    for row in rows:
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        yield _parse_row(row, columns)
+
+
+async def _existing_counts(db, user_id: int, fingerprints) -> Dict[int, int]:
+    """Сколько операций пользователя с каждым отпечатком уже есть в БД"""
+    fingerprints = list(fingerprints)
+    counts = dict.fromkeys(fingerprints, 0)
+    for start in range(0, len(fingerprints), LOOKUP_CHUNK_SIZE):
+        chunk = fingerprints[start : start + LOOKUP_CHUNK_SIZE]
+        rows = await db.execute(
+            select(Transaction.fingerprint, func.count())
+            .where(Transaction.user_id == user_id)
+            .where(Transaction.fingerprint.in_(chunk))
+            .group_by(Transaction.fingerprint)
+        )
+        counts.update(rows.all())
+    return counts
+
+
+async def import_statement(
+    user_id: int,
+    rows: Iterable[Optional[StatementRow]],
+    categorize: Callable[[str], str],
+    session_factory=AsyncSessionLocal,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Optional[Progress] = None,
+) -> ImportResult:
+    """
+    Сохраняет операции порциями по batch_size, каждая порция — одна
+    транзакция БД вместе с агрегатами. categorize(описание) → имя категории
+    для строк без известной категории
+    """
+    rows = iter(rows)
+    await category_registry.ensure_loaded(session_factory)
+    # Сколько еще не сопоставленных операций БД осталось у каждого отпечатка
+    unmatched: Dict[int, int] = {}
+    # id категорий по именам из выписки и из categorize
+    category_ids: Dict[str, int] = {}
+    imported = duplicates = skipped = 0
+
+    while True:
+        batch: List[Optional[StatementRow]] = await asyncio.to_thread(
+            list, islice(rows, batch_size)
+        )
+        if not batch:
+            break
+        records = [row for row in batch if row is not None]
+        skipped += len(batch) - len(records)
+        fingerprints = [
+            transaction_fingerprint(
+                row.created_at, row.type, row.amount, row.description
+            )
+            for row in records
+        ]
+
+        async with session_factory() as db:
+            unknown = set(fingerprints).difference(unmatched)
+            if unknown:
+                unmatched.update(await _existing_counts(db, user_id, unknown))
+
+            transactions = []
+            for row, fingerprint in zip(records, fingerprints):
+                if unmatched[fingerprint]:
+                    unmatched[fingerprint] -= 1
+                    duplicates += 1
+                    continue
+                name = None
+                if row.category:
+                    name = category_registry.get_name(
+                        category_registry.find(row.category)
+                    )
+                if name is None:
+                    name = categorize(row.description or "")
+                if name not in category_ids:
+                    category_ids[name] = await category_registry.get_or_create(db, name)
+                transactions.append(
+                    _NewTransaction(
+                        user_id,
+                        row.created_at,
+                        row.type,
+                        row.amount,
+                        category_ids[name],
+                        row.description,
+                        fingerprint,
+                    )
+                )
+
+            # Без ORM-объектов: id новых строк не нужны, а executemany
+            # вставляет порцию в несколько раз быстрее
+            if transactions:
+                await db.execute(
+                    insert(Transaction),
+                    [transaction._asdict() for transaction in transactions],
+                )
+            await aggregates.record_transactions(db, transactions)
+            await db.commit()
+
+        imported += len(transactions)
+        if progress:
+            await progress(imported, duplicates, skipped)
+
+    return ImportResult(imported, duplicates, skipped)
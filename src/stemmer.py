@@ -0,0 +1,151 @@
+"""
+Стемминг русских слов по алгоритму Snowball (Porter, Russian).
+
+Слова описаний приводятся к основе, чтобы "симка" и "симку", "аптека" и
+"в аптеке" совпадали с одним ключевым словом. Основы слов запоминаются в
+ограниченном LRU-кэше: словарь описаний небольшой и повторяется.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Tuple
+
+STEM_CACHE_SIZE = int(os.getenv("STEM_CACHE_SIZE", "65536"))
+
+_VOWELS = "аеиоуыэюя"
+_WORD = re.compile(r"\w+")
+_CONSONANT_END = re.compile(r"[бвгджзклмнпрстфхцчшщ]$")
+
+# Падежные окончания существительных на согласную для keyword_forms
+_CASE_ENDINGS = ("а", "у", "е", "ом", "ы")
+
+
+def _endings(*groups: str) -> Tuple[str, ...]:
+    """Окончания от длинных к коротким: при выборе побеждает самое длинное"""
+    return tuple(sorted((e for g in groups for e in g.split()), key=len, reverse=True))
+
+
+# Окончания, которые отбрасываются только после "а" или "я"
+_PERFECTIVE_GERUND_1 = _endings("в вши вшись")
+_PERFECTIVE_GERUND_2 = _endings("ив ивши ившись ыв ывши ывшись")
+_ADJECTIVE = _endings(
+    "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя ою ею"
+)
+_PARTICIPLE_1 = _endings("ем нн вш ющ щ")
+_PARTICIPLE_2 = _endings("ивш ывш ующ")
+_REFLEXIVE = _endings("ся сь")
+_VERB_1 = _endings("ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно")
+_VERB_2 = _endings(
+    "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует "
+    "уют ит ыт ены ить ыть ишь ую ю"
+)
+_NOUN = _endings(
+    "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у "
+    "ах иях ях ы ь ию ью ю ия ья я"
+)
+_SUPERLATIVE = _endings("ейш ейше")
+_DERIVATIONAL = _endings("ост ость")
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Начала областей RV и R2"""
+    rv = len(word)
+    for i, char in enumerate(word):
+        if char in _VOWELS:
+            rv = i + 1
+            break
+
+    def next_region(start: int) -> int:
+        # После первой согласной, идущей за гласной
+        for i in range(start + 1, len(word)):
+            if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = next_region(0)
+    return rv, next_region(r1)
+
+
+def _strip(word: str, start: int, endings: Tuple[str, ...]) -> str:
+    """Отбрасывает самое длинное из окончаний, целиком лежащее в word[start:]"""
+    for ending in endings:
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return word[: -len(ending)]
+    return word
+
+
+def _strip_after_a(word: str, start: int, endings: Tuple[str, ...]) -> str:
+    """Как _strip, но окончание должно стоять после "а" или "я" (они остаются)"""
+    for ending in endings:
+        cut = len(word) - len(ending)
+        if word.endswith(ending) and cut - 1 >= start and word[cut - 1] in "ая":
+            return word[:cut]
+    return word
+
+
+def _strip_group(
+    word: str, start: int, after_a: Tuple[str, ...], other: Tuple[str, ...]
+) -> str:
+    """Самое длинное окончание из двух групп алгоритма"""
+    first = _strip_after_a(word, start, after_a)
+    second = _strip(word, start, other)
+    return min(first, second, key=len)
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(word: str) -> str:
+    """Основа слова в нижнем регистре; слова без кириллицы не меняются"""
+    word = word.lower().replace("ё", "е")
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1: деепричастие, иначе возвратность и прилагательное, глагол
+    # или существительное
+    stemmed = _strip_group(word, rv, _PERFECTIVE_GERUND_1, _PERFECTIVE_GERUND_2)
+    if stemmed == word:
+        word = _strip(word, rv, _REFLEXIVE)
+        stemmed = _strip(word, rv, _ADJECTIVE)
+        if stemmed != word:
+            stemmed = _strip_group(stemmed, rv, _PARTICIPLE_1, _PARTICIPLE_2)
+        else:
+            stemmed = _strip_group(word, rv, _VERB_1, _VERB_2)
+            if stemmed == word:
+                stemmed = _strip(word, rv, _NOUN)
+    word = stemmed
+
+    # Шаг 2: конечное "и"
+    word = _strip(word, rv, ("и",))
+
+    # Шаг 3: словообразовательное окончание в R2
+    word = _strip(word, r2, _DERIVATIONAL)
+
+    # Шаг 4: "нн" → "н", превосходная степень или мягкий знак
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    stemmed = _strip(word, rv, _SUPERLATIVE)
+    if stemmed != word:
+        word = stemmed
+        if word.endswith("нн") and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+    return _strip(word, rv, ("ь",))
+
+
+def stem_tokens(text: str) -> Tuple[str, ...]:
+    """Основы слов текста по порядку: "Шоколадки на 8 марта" → (шоколадк, на, 8, март)"""
+    return tuple(stem(token) for token in _WORD.findall(text.lower()))
+
+
+def keyword_forms(keyword: str) -> Tuple[str, ...]:
+    """
+    Ключевое слово и его падежные формы для индекса. Snowball иногда
+    отрезает у начальной формы больше, чем у остальных ("ресторан" →
+    "рестора", но "ресторане" → "ресторан"), поэтому однословные ключевые
+    слова на согласную индексируются и по основам падежных форм
+    """
+    keyword = keyword.lower()
+    if " " in keyword or not _CONSONANT_END.search(keyword):
+        return (keyword,)
+    return (keyword,) + tuple(keyword + ending for ending in _CASE_ENDINGS)
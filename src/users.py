@@ -0,0 +1,52 @@
+"""
+Разрешение telegram_id во внутренний users.id.
+
+Пользователи не удаляются и не меняют id, поэтому соответствие можно
+держать в памяти: для известных пользователей запрос к users не нужен.
+"""
+
+import os
+from typing import Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import aggregates, repository
+from src.cache import LRUCache
+from src.models import User
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+user_id_cache = LRUCache(USER_CACHE_SIZE)
+
+
+async def get_user_id(db: AsyncSession, telegram_id: int) -> Optional[int]:
+    """users.id по telegram_id или None, если пользователь не запускал бота"""
+    user_id = user_id_cache.get(telegram_id)
+    if user_id is not None:
+        return user_id
+
+    user_id = await repository.user_id_by_telegram_id(db, telegram_id)
+    if user_id is not None:
+        user_id_cache.put(telegram_id, user_id)
+    return user_id
+
+
+async def get_or_create_user_id(db: AsyncSession, telegram_id: int) -> Tuple[int, bool]:
+    """
+    users.id по telegram_id, создает пользователя при первом обращении.
+    Возвращает (id, создан ли пользователь).
+
+    Новый пользователь фиксируется отдельным commit: в кэш попадает только
+    id, который уже есть в БД.
+    """
+    user_id = await get_user_id(db, telegram_id)
+    if user_id is not None:
+        return user_id, False
+
+    user = User(telegram_id=telegram_id)
+    db.add(user)
+    await aggregates.record_user(db)
+    await db.commit()
+
+    user_id_cache.put(telegram_id, user.id)
+    return user.id, True
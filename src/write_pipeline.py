@@ -0,0 +1,142 @@
+"""
+Групповая запись транзакций.
+
+Каждый commit в SQLite — это fsync, поэтому вставки из одновременных
+обновлений собираются в пачку и фиксируются одной транзакцией БД: раз в
+несколько миллисекунд или по набору WRITE_BATCH_SIZE строк. Вызывающий
+получает транзакцию только после commit пачки, то есть когда запись
+уже надежно сохранена. Группа операций из одного сообщения
+(add_transactions) всегда попадает в одну транзакцию БД целиком.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from src import aggregates
+from src.database import AsyncSessionLocal
+from src.logger import bot_logger
+from src.messages import LOG_WRITE_BATCH_FAILED
+from src.models import Transaction
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_BATCH_DELAY_MS = float(os.getenv("WRITE_BATCH_DELAY_MS", "5"))
+
+# Группа вставок, которая пишется атомарно, и future для её результата
+_Item = Tuple[List[Dict[str, Any]], asyncio.Future]
+
+
+class WriteBatcher:
+    """Очередь вставок транзакций с фоновым сбросом пачками"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch: int = WRITE_BATCH_SIZE,
+        max_delay: float = WRITE_BATCH_DELAY_MS / 1000,
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.rows = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        # Очередь и задача создаются в цикле событий, где работает бот
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def add_transaction(self, **values) -> Transaction:
+        """Ставит транзакцию в очередь и ждет commit её пачки"""
+        (transaction,) = await self.add_transactions([values])
+        return transaction
+
+    async def add_transactions(self, values: List[Dict[str, Any]]) -> List[Transaction]:
+        """Ставит группу транзакций в очередь: все они сохраняются или ни одна"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((values, future))
+        return await future
+
+    async def close(self):
+        """Записывает все, что уже в очереди, и останавливает сброс"""
+        if self._worker is None or self._worker.done():
+            return
+        await self._queue.put(None)
+        await self._worker
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            rows = len(item[0])
+            stop = False
+
+            deadline = loop.time() + self.max_delay
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            await self._flush(batch)
+            if stop:
+                return
+
+    async def _write(self, batch: List[_Item]) -> List[List[Transaction]]:
+        groups = [[Transaction(**values) for values in group] for group, _ in batch]
+        transactions = [transaction for group in groups for transaction in group]
+        async with self.session_factory() as db:
+            db.add_all(transactions)
+            await aggregates.record_transactions(db, transactions)
+            await db.commit()
+        self.rows += len(transactions)
+        return groups
+
+    async def _flush(self, batch: List[_Item]):
+        try:
+            groups = await self._write(batch)
+        except Exception as e:
+            # Откатилась вся пачка: пишем группы по одной, чтобы ошибка
+            # в одной не отменила остальные
+            bot_logger.warning(LOG_WRITE_BATCH_FAILED.format(count=len(batch), error=e))
+            for item in batch:
+                try:
+                    (group,) = await self._write([item])
+                except Exception as e:
+                    _resolve(item[1], error=e)
+                else:
+                    _resolve(item[1], group)
+            return
+
+        self.batches += 1
+        for (_, future), group in zip(batch, groups):
+            _resolve(future, group)
+
+
+def _resolve(future: asyncio.Future, result=None, error: Exception = None):
+    # Ожидающий обработчик мог быть отменен, пока пачка писалась
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+write_batcher = WriteBatcher()
@@ -0,0 +1,179 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+
+from src import aggregates
+from src.models import Transaction, TransactionType, User, UserBalance
+
+
+async def add_transaction(db, user_id, transaction_type, amount):
+    transaction = Transaction(
+        user_id=user_id,
+        amount=amount,
+        description="тест",
+        type=transaction_type,
+        created_at=datetime.now(),
+    )
+    db.add(transaction)
+    await aggregates.record_transaction(db, transaction)
+    await db.commit()
+    return transaction
+
+
+@pytest.mark.asyncio
+async def test_balance_follows_inserts_and_deletes(async_session_factory):
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+
+        await add_transaction(db, user.id, TransactionType.INCOME, 1000)
+        await add_transaction(db, user.id, TransactionType.EXPENSE, 300)
+        expense = await add_transaction(db, user.id, TransactionType.EXPENSE, 50)
+        assert await aggregates.get_balance(db, user.id) == (1000, 350)
+
+        await db.delete(expense)
+        await aggregates.record_deletions(
+            db, [aggregates.rollup_key(expense) + (50, 1)]
+        )
+        await db.commit()
+        assert await aggregates.get_balance(db, user.id) == (1000, 300)
+        assert (await db.get(UserBalance, user.id)).count == 2
+
+
+@pytest.mark.asyncio
+async def test_rebuild_balances_reports_drift(async_session_factory):
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+        await add_transaction(db, user.id, TransactionType.EXPENSE, 300)
+
+        assert await aggregates.rebuild_balances(db) == []
+
+        await db.execute(update(UserBalance).values(expense=1))
+        assert await aggregates.rebuild_balances(db) == [user.id]
+        assert await aggregates.get_balance(db, user.id) == (0, 300)
+
+
+@pytest.mark.asyncio
+async def test_rollups_follow_category_changes(async_session_factory):
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+        transaction = await add_transaction(db, user.id, TransactionType.EXPENSE, 70)
+
+        transaction.category_id = 3
+        await aggregates.record_category_change(db, transaction, None)
+        await db.commit()
+
+        assert await aggregates.category_totals(db, user.id, 3) == {
+            TransactionType.EXPENSE: (70, 1)
+        }
+        assert await aggregates.category_totals(db, user.id, 0) == {}
+        assert await aggregates.rebuild_rollups(db) == []
+
+
+@pytest.mark.asyncio
+async def test_period_totals_split_boundary_day(async_session_factory):
+    """Неполный первый день периода считается по транзакциям, остальные — по сводкам"""
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+
+        now = datetime.now()
+        start = now - timedelta(days=3)
+        for created_at, amount in [
+            (start - timedelta(minutes=1), 1),
+            (start + timedelta(minutes=1), 10),
+            (now - timedelta(days=1), 100),
+        ]:
+            transaction = Transaction(
+                user_id=user.id,
+                amount=amount,
+                type=TransactionType.EXPENSE,
+                category_id=2,
+                created_at=created_at,
+            )
+            db.add(transaction)
+            await aggregates.record_transaction(db, transaction)
+        await db.commit()
+
+        income, expenses, by_category = await aggregates.period_totals(
+            db, user.id, start
+        )
+        assert (income, expenses, by_category) == (0, 110, {2: 110})
+
+        days = await aggregates.daily_totals(db, user.id, start)
+        assert days[start.date()]["expenses"] == 10
+
+
+@pytest.mark.asyncio
+async def test_global_counters(async_session_factory):
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await aggregates.record_user(db)
+        await db.commit()
+        await add_transaction(db, user.id, TransactionType.INCOME, 500)
+        expense = await add_transaction(db, user.id, TransactionType.EXPENSE, 200)
+
+        await db.delete(expense)
+        await aggregates.record_deletions(
+            db, [aggregates.rollup_key(expense) + (200, 1)]
+        )
+        await db.commit()
+
+        assert await aggregates.get_counters(db) == {
+            aggregates.COUNTER_USERS: 1,
+            aggregates.COUNTER_TRANSACTIONS: 1,
+            aggregates.COUNTER_INCOME: 500,
+            aggregates.COUNTER_EXPENSE: 0,
+        }
+        assert await aggregates.rebuild_counters(db) == []
+
+
+@pytest.mark.asyncio
+async def test_active_days_keyset_pages(async_session_factory):
+    """Дни истории листаются ключом страницы в обе стороны"""
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+
+        # Полдень: операции не переходят через полночь
+        now = datetime.now().replace(hour=12)
+        start = now - timedelta(days=10, hours=1)
+        transactions = [
+            Transaction(
+                user_id=user.id,
+                amount=1,
+                type=TransactionType.EXPENSE,
+                created_at=now - timedelta(days=days),
+            )
+            # 11 дней назад — до начала периода; 10 дней назад — неполный день
+            for days in (11, 10, 8, 5, 5, 3, 1)
+        ]
+        db.add_all(transactions)
+        await aggregates.record_transactions(db, transactions)
+        await db.commit()
+
+        def day(ago):
+            return (now - timedelta(days=ago)).date()
+
+        first = await aggregates.active_days(db, user.id, start, 3)
+        assert first == [day(1), day(3), day(5)]
+        older = await aggregates.active_days(db, user.id, start, 3, before=day(5))
+        assert older == [day(8), day(10)]
+        newer = await aggregates.active_days(db, user.id, start, 2, after=day(8))
+        assert newer == [day(3), day(5)]
+
+        # Итоги только по дням страницы
+        totals = await aggregates.daily_totals(db, user.id, start, end=day(5))
+        assert totals == {
+            day(10): {"income": 0.0, "expenses": 1.0},
+            day(8): {"income": 0.0, "expenses": 1.0},
+            day(5): {"income": 0.0, "expenses": 2.0},
+        }
@@ -0,0 +1,214 @@
+import csv
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from src import aggregates, archive
+from src.models import Transaction, TransactionType, User
+
+
+async def _seed(session_factory, now):
+    """Пользователь с 10 операциями: 7 старых (100+ дней) и 3 свежих"""
+    async with session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await aggregates.apply_counter_delta(db, aggregates.COUNTER_USERS, 1)
+        await db.commit()
+
+        transactions = [
+            Transaction(
+                user_id=user.id,
+                amount=10 * (i + 1),
+                description=f"операция, {i}\nвторая строка",
+                type=TransactionType.EXPENSE if i % 3 else TransactionType.INCOME,
+                category_id=i % 4 or None,
+                created_at=now - timedelta(days=100 + 20 * i if i < 7 else i),
+            )
+            for i in range(10)
+        ]
+        db.add_all(transactions)
+        await aggregates.record_transactions(db, transactions)
+        await db.commit()
+        return user.id
+
+
+def test_segments_roundtrip_and_filters(tmp_path):
+    store = archive.TransactionArchive(tmp_path)
+    rows = [
+        archive.ArchivedTransaction(
+            id=i,
+            user_id=1 + i % 2,
+            created_at=datetime(2023, 1 + i % 3, 10, 12, 30),
+            type=TransactionType.EXPENSE,
+            amount=1.5 * i,
+            category_id=i % 2 or None,
+            description=None if i == 0 else f'"{i}", запятая',
+        )
+        for i in range(6)
+    ]
+    assert store.append(rows) == 6
+    # Повторная запись (сбой между записью и удалением) не дублирует строки
+    store.append(rows[:2])
+
+    assert sorted(store.read(1) + store.read(2)) == sorted(rows)
+    assert sorted(store.scan()) == sorted(rows)
+    assert {row.id for row in store.read(1)} == {0, 2, 4}
+    assert {row.id for row in store.read(2, category_id=1)} == {1, 3, 5}
+    assert {
+        row.id
+        for row in store.read(1, start=datetime(2023, 2, 1), end=datetime(2023, 3, 1))
+    } == {4}
+    # Читается только последний месяц пользователя: этого хватает для limit
+    assert {row.id for row in store.read(2, limit=1)} == {5}
+    # Сегменты разбиты по пользователям: чтение одного не трогает чужие
+    assert {path.parts[-3] for path in tmp_path.glob("users/*/*/*.csv.gz")} == {
+        "1",
+        "2",
+    }
+
+
+def test_segment_cache_is_used_under_lock(tmp_path):
+    """Кэш сегментов общий для потоков и трогается только под блокировкой"""
+    store = archive.TransactionArchive(tmp_path)
+    store.append(
+        [
+            archive.ArchivedTransaction(
+                id=i,
+                user_id=1,
+                created_at=datetime(2023, 1 + i, 10),
+                type=TransactionType.EXPENSE,
+                amount=i,
+                category_id=None,
+                description=None,
+            )
+            for i in range(3)
+        ]
+    )
+    cache, calls = store._segments, []
+
+    class CheckedCache:
+        def __getattr__(self, name):
+            calls.append(store._segments_lock.locked())
+            return getattr(cache, name)
+
+    store._segments = CheckedCache()
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: len(store.read(1)), range(8)))
+
+    assert results == [3] * 8
+    assert calls and all(calls)
+
+
+def test_legacy_segments_are_split_by_user(tmp_path):
+    rows = [
+        archive.ArchivedTransaction(
+            id=i,
+            user_id=1 + i % 2,
+            created_at=datetime(2023, 1 + i % 2, 10 + i),
+            type=TransactionType.EXPENSE,
+            amount=i,
+            category_id=None,
+            description=None,
+        )
+        for i in range(4)
+    ]
+    # Прежний формат: один сегмент месяца на всех пользователей
+    legacy = tmp_path / "2023-01"
+    legacy.mkdir()
+    with gzip.open(legacy / "1-0.csv.gz", "wt", encoding="utf-8", newline="") as file:
+        csv.writer(file).writerows(archive._to_csv_row(row) for row in rows)
+
+    store = archive.TransactionArchive(tmp_path)
+    assert store.split_legacy_segments() == 4
+    assert not legacy.exists()
+    assert store.split_legacy_segments() == 0
+    assert [row.id for row in store.read(1)] == [2, 0]
+    assert [row.id for row in store.read(2)] == [3, 1]
+
+
+def test_watermark_only_moves_forward(tmp_path):
+    store = archive.TransactionArchive(tmp_path)
+    assert store.watermark() is None
+    assert not store.covers(datetime(2020, 1, 1))
+
+    store.raise_watermark(datetime(2023, 6, 1))
+    store.raise_watermark(datetime(2023, 1, 1))
+
+    assert store.watermark() == datetime(2023, 6, 1)
+    assert store.covers(datetime(2023, 5, 1))
+    assert not store.covers(datetime(2023, 7, 1))
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_rows_and_keeps_aggregates(async_session_factory, tmp_path):
+    now = datetime.now()
+    user_id = await _seed(async_session_factory, now)
+    store = archive.TransactionArchive(tmp_path)
+    progress = []
+
+    async def report(moved, total):
+        progress.append((moved, total))
+
+    moved = await archive.archive_before(
+        now - timedelta(days=90),
+        store,
+        async_session_factory,
+        chunk_size=3,
+        progress=report,
+    )
+
+    assert moved == 7
+    assert progress == [(3, 7), (6, 7), (7, 7)]
+    async with async_session_factory() as db:
+        assert await db.scalar(select(func.count(Transaction.id))) == 3
+        income, expense = await aggregates.get_balance(db, user_id)
+        hot = (await db.scalars(select(Transaction))).all()
+
+    archived = await archive.read_archived(user_id, archive=store)
+    merged = archive.merge(hot, archived)
+    assert len(merged) == 10
+    assert income == sum(t.amount for t in merged if t.type == TransactionType.INCOME)
+    assert expense == sum(t.amount for t in merged if t.type == TransactionType.EXPENSE)
+    assert archived[0].description == "операция, 0\nвторая строка"
+
+    # Новая строка с тем же id (SQLite переиспользует id) не скрывается архивом
+    reused = archive.ArchivedTransaction(*archived[0][:2], now, *archived[0][3:])
+    assert len(archive.merge([reused], archived)) == 8
+
+    # Свежий период архив не затрагивает
+    assert (
+        await archive.read_archived(user_id, now - timedelta(days=30), archive=store)
+        == []
+    )
+
+    # Сверка учитывает архив и не находит расхождений
+    async with async_session_factory() as db:
+        deltas = await archive.archived_deltas(db, store)
+        assert await aggregates.reconcile(db, deltas) == {
+            "user_balances": 0,
+            "daily_rollups": 0,
+            "global_counters": 0,
+        }
+
+
+@pytest.mark.asyncio
+async def test_period_totals_with_archived_first_day(async_session_factory, tmp_path):
+    # Полдень: начало периода и операция 140 дней назад в одном дне
+    now = datetime.now().replace(hour=12)
+    user_id = await _seed(async_session_factory, now)
+    # Начало периода — в середине дня архивной операции
+    start = now - timedelta(days=140, hours=1)
+    async with async_session_factory() as db:
+        expected = await aggregates.period_totals(db, user_id, start)
+
+    store = archive.TransactionArchive(tmp_path)
+    await archive.archive_before(now - timedelta(days=90), store, async_session_factory)
+
+    archived = await archive.read_archived(user_id, start, archive=store)
+    async with async_session_factory() as db:
+        assert await aggregates.period_totals(db, user_id, start, archived) == expected
+        # Без архивных строк первый день периода теряется
+        assert await aggregates.period_totals(db, user_id, start) != expected
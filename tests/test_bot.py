@@ -2,6 +2,7 @@ import pytest
 import pytest_asyncio
 from src.bot import FinanceBot
 from src.models import TransactionType
+from src.parser import parse_message
 from unittest.mock import AsyncMock, MagicMock, patch
 from telegram import Update, User, Message, Chat
 from telegram.ext import ContextTypes
@@ -29,46 +30,6 @@ def mock_context():
     return MagicMock(spec=ContextTypes.DEFAULT_TYPE)
 
 
-def parse_amount(amount_str: str) -> float:
-    """Парсинг суммы с учетом пробелов"""
-    # Удаляем все нецифровые символы, кроме точки, запятой и пробелов
-    clean_str = "".join(c for c in amount_str if c.isdigit() or c in "., ")
-    # Удаляем все пробелы
-    clean_str = clean_str.replace(" ", "")
-    # Заменяем запятую на точку
-    clean_str = clean_str.replace(",", ".")
-    return float(clean_str)
-
-
-def split_message(message: str) -> tuple[str, str]:
-    """Разделяет сообщение на сумму и описание"""
-    # Пропускаем знак +/- в начале
-    message = message[1:].strip()
-
-    # Ищем первое слово, которое не является частью суммы
-    parts = message.split()
-    amount_parts = []
-    description_parts = []
-
-    for part in parts:
-        # Если часть содержит цифры или является обозначением валюты
-        if any(c.isdigit() for c in part) or part.lower() in [
-            "руб",
-            "руб.",
-            "р.",
-            "рублей",
-        ]:
-            amount_parts.append(part)
-        else:
-            description_parts.append(part)
-            break
-
-    # Добавляем оставшиеся части к описанию
-    description_parts.extend(parts[len(amount_parts) + len(description_parts) :])
-
-    return " ".join(amount_parts), " ".join(description_parts)
-
-
 def test_parse_expense_message():
     """Тест парсинга сообщений с расходами"""
     test_cases = [
@@ -87,12 +48,12 @@ def test_parse_expense_message():
     ]
 
     for message, expected in test_cases:
-        amount_str, description = split_message(message)
-        amount = parse_amount(amount_str)
+        (record,) = parse_message(message)
+        assert record.type == TransactionType.EXPENSE
         assert (
-            amount,
-            description,
-        ) == expected, f"Ошибка парсинга: '{message}' -> получено ({amount}, {description}), ожидалось {expected}"
+            record.amount,
+            record.description,
+        ) == expected, f"Ошибка парсинга: '{message}' -> получено ({record.amount}, {record.description}), ожидалось {expected}"
 
 
 def test_parse_income_message():
@@ -110,12 +71,12 @@ def test_parse_income_message():
     ]
 
     for message, expected in test_cases:
-        amount_str, description = split_message(message)
-        amount = parse_amount(amount_str)
+        (record,) = parse_message(message)
+        assert record.type == TransactionType.INCOME
         assert (
-            amount,
-            description,
-        ) == expected, f"Ошибка парсинга: '{message}' -> получено ({amount}, {description}), ожидалось {expected}"
+            record.amount,
+            record.description,
+        ) == expected, f"Ошибка парсинга: '{message}' -> получено ({record.amount}, {record.description}), ожидалось {expected}"
 
 
 def test_category_detection():
@@ -139,19 +100,14 @@ def test_category_detection():
         ("за симку", "Связь"),
         ("на впн", "Связь"),
         ("шоколадки на 8 марта", "Подарки"),
+        # Другие формы ключевых слов
+        ("пополнил симки", "Связь"),
+        ("в ресторане с друзьями", "Развлечения"),
+        ("купил книгу", "Образование"),
     ]
 
     for description, expected_category in test_cases:
-        found_category = "Другое"
-        # Сначала проверяем специальные случаи
-        if "8 марта" in description.lower():
-            found_category = "Подарки"
-        else:
-            # Затем проверяем обычные ключевые слова
-            for category, keywords in bot.category_keywords.items():
-                if any(keyword.lower() in description.lower() for keyword in keywords):
-                    found_category = category
-                    break
+        found_category = bot.determine_category(description)
         assert (
             found_category == expected_category
         ), f"Для описания '{description}' ожидалась категория '{expected_category}', получена '{found_category}'"
@@ -178,9 +134,333 @@ async def test_process_transaction_message(bot, mock_update, mock_context):
     mock_update.message.reply_text.assert_not_called()
 
 
+@pytest.mark.asyncio
+async def test_multiline_message_saves_batch(
+    bot, mock_update, mock_context, async_session_factory, monkeypatch
+):
+    """Операции из многострочного сообщения сохраняются вместе, ответ один"""
+    from src import aggregates
+    from src.categories import category_registry
+    from src.category_model import category_models
+    from src.users import get_user_id, user_id_cache
+    from src.write_pipeline import WriteBatcher
+
+    batcher = WriteBatcher(async_session_factory)
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", async_session_factory)
+    monkeypatch.setattr("src.bot.write_batcher", batcher)
+    user_id_cache.clear()
+    category_registry.invalidate()
+
+    mock_update.message.text = "-100 кофе\n-350 такси\n+5000 зарплата"
+    await bot.process_transaction_message(mock_update, mock_context)
+    await batcher.close()
+
+    mock_update.message.reply_text.assert_called_once()
+    reply = mock_update.message.reply_text.call_args.args[0]
+    assert "Добавлено транзакций: 3" in reply
+    assert "-350.00 руб. — такси (Транспорт)" in reply
+    assert "Расходы: 450.00 руб.\nДоходы: 5000.00 руб." in reply
+    async with async_session_factory() as db:
+        user_id = await get_user_id(db, 12345)
+        assert await aggregates.get_balance(db, user_id) == (5000, 450)
+
+    # Ошибка в любой строке отменяет все сообщение
+    mock_update.message.reply_text.reset_mock()
+    mock_update.message.text = "-100 кофе\n-такси"
+    await bot.process_transaction_message(mock_update, mock_context)
+    reply = mock_update.message.reply_text.call_args.args[0]
+    assert reply.startswith("Строка 2: ")
+    async with async_session_factory() as db:
+        assert await aggregates.get_balance(db, user_id) == (5000, 450)
+    user_id_cache.clear()
+    category_registry.invalidate()
+    category_models.clear()
+
+
+@pytest.mark.asyncio
+async def test_long_multiline_message_reply_fits_telegram_limit(
+    bot, mock_update, mock_context, async_session_factory, monkeypatch
+):
+    """Ответ на сообщение из сотен строк перечисляет первые и не длиннее лимита"""
+    from telegram.constants import MessageLimit
+
+    from src import aggregates
+    from src.categories import category_registry
+    from src.category_model import category_models
+    from src.messages import ADD_TRANSACTIONS_MORE
+    from src.users import get_user_id, user_id_cache
+    from src.write_pipeline import WriteBatcher
+
+    batcher = WriteBatcher(async_session_factory)
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", async_session_factory)
+    monkeypatch.setattr("src.bot.write_batcher", batcher)
+    user_id_cache.clear()
+    category_registry.invalidate()
+
+    count = 300
+    description = "покупка в магазине у дома " * 10
+    mock_update.message.text = "\n".join(
+        f"-{i + 1} {description}{i}" for i in range(count)
+    )
+    await bot.process_transaction_message(mock_update, mock_context)
+    await batcher.close()
+
+    mock_update.message.reply_text.assert_called_once()
+    reply = mock_update.message.reply_text.call_args.args[0]
+    assert len(reply) <= MessageLimit.MAX_TEXT_LENGTH
+    assert f"Добавлено транзакций: {count}" in reply
+    listed = reply.count(description)
+    assert 0 < listed < count
+    assert ADD_TRANSACTIONS_MORE.format(count=count - listed) in reply
+    assert f"Расходы: {count * (count + 1) / 2:.2f} руб." in reply
+    async with async_session_factory() as db:
+        user_id = await get_user_id(db, 12345)
+        assert await aggregates.get_balance(db, user_id) == (0, count * (count + 1) / 2)
+    user_id_cache.clear()
+    category_registry.invalidate()
+    category_models.clear()
+
+
 @pytest.mark.asyncio
 async def test_add_transaction_start(bot, mock_update, mock_context):
     """Тест начала диалога добавления транзакции"""
     result = await bot.add_transaction_start(mock_update, mock_context)
     assert result == bot.CHOOSING_TYPE
     mock_update.message.reply_text.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_read_paths_use_constant_queries(
+    bot, mock_update, mock_context, async_session_factory, monkeypatch
+):
+    """Число запросов /export и /history не зависит от числа операций"""
+    from datetime import datetime, timedelta
+
+    from src import aggregates
+    from src.categories import category_registry
+    from src.database import count_queries, track_queries
+    from src.models import Transaction
+    from src.users import get_or_create_user_id, user_id_cache
+
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", async_session_factory)
+    monkeypatch.setattr("src.bot.ExportSessionLocal", async_session_factory)
+    track_queries(async_session_factory.kw["bind"])
+    user_id_cache.clear()
+    mock_update.message.reply_document = AsyncMock()
+
+    async def add_transactions(count):
+        async with async_session_factory() as db:
+            user_id, _ = await get_or_create_user_id(db, 12345)
+            now = datetime.now()
+            transactions = [
+                Transaction(
+                    user_id=user_id,
+                    amount=i + 1,
+                    description=f"операция {i}",
+                    type=TransactionType.EXPENSE,
+                    category_id=i % 10 + 1,
+                    created_at=now - timedelta(days=i % 20, minutes=i),
+                )
+                for i in range(count)
+            ]
+            db.add_all(transactions)
+            await aggregates.record_transactions(db, transactions)
+            await db.commit()
+        return user_id
+
+    async def measure(user_id):
+        with count_queries() as export_queries:
+            await bot.export(mock_update, mock_context)
+        with count_queries() as history_queries:
+            await bot.history_page(user_id, "месяц")
+        return export_queries.count, history_queries.count
+
+    user_id = await add_transactions(20)
+    await category_registry.ensure_loaded(async_session_factory)
+    await measure(user_id)  # прогрев кэша пользователей
+    few = await measure(user_id)
+    await add_transactions(600)
+    many = await measure(user_id)
+
+    assert mock_update.message.reply_document.called
+    assert few == many
+    assert many[0] <= 2
+
+
+@pytest.mark.asyncio
+async def test_exports_do_not_hold_read_pool(bot, mock_context, db_url, monkeypatch):
+    """Пока идут EXPORT_WORKERS выгрузок, /balance получает соединение чтения"""
+    import asyncio
+
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import (
+        AsyncSession,
+        async_sessionmaker,
+        create_async_engine,
+    )
+
+    from src import export
+    from src.categories import category_registry
+    from src.database import (
+        EXPORT_WORKERS,
+        configure_sqlite,
+        read_engine_options,
+        routing_session_class,
+        to_async_url,
+    )
+    from src.messages import ERROR_GENERAL, EXPORT_EMPTY
+    from src.users import get_or_create_user_id, user_id_cache
+
+    url = to_async_url(db_url)
+    # Короткое ожидание пула: занятый пул чтения сразу даст ошибку
+    write_engine = create_async_engine(url)
+    read_engine = create_async_engine(
+        url, **dict(read_engine_options(url), pool_timeout=1)
+    )
+    export_engine = create_async_engine(
+        url, **dict(read_engine_options(url, EXPORT_WORKERS), pool_timeout=1)
+    )
+    for engine in (write_engine, read_engine, export_engine):
+        configure_sqlite(engine)
+    sessions = async_sessionmaker(
+        class_=AsyncSession,
+        sync_session_class=routing_session_class(write_engine, read_engine),
+        expire_on_commit=False,
+    )
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", sessions)
+    monkeypatch.setattr(
+        "src.bot.ExportSessionLocal",
+        async_sessionmaker(export_engine, expire_on_commit=False),
+    )
+    monkeypatch.setattr(export, "export_pool", export.ExportPool())
+    # Реестр категорий читается через тот же пул чтения
+    ensure_loaded = category_registry.ensure_loaded
+    monkeypatch.setattr(category_registry, "_lock", asyncio.Lock())
+    monkeypatch.setattr(
+        category_registry, "ensure_loaded", lambda: ensure_loaded(sessions)
+    )
+    user_id_cache.clear()
+
+    telegram_ids = range(1, EXPORT_WORKERS + 2)
+    async with sessions() as db:
+        for telegram_id in telegram_ids:
+            await get_or_create_user_id(db, telegram_id)
+        await db.commit()
+
+    started = 0
+    release = asyncio.Event()
+
+    async def blocked_export(db, user_id, path, categories):
+        nonlocal started
+        # Соединение занято до конца сессии, как при чтении порций
+        await db.execute(select(1))
+        started += 1
+        await release.wait()
+        return 0
+
+    monkeypatch.setattr(export, "export_transactions", blocked_export)
+
+    def update_for(telegram_id):
+        update = MagicMock(spec=Update)
+        update.effective_user = MagicMock(spec=User)
+        update.effective_user.id = telegram_id
+        update.message = MagicMock(spec=Message)
+        update.message.reply_text = AsyncMock()
+        return update
+
+    exports = [update_for(telegram_id) for telegram_id in telegram_ids[:-1]]
+    tasks = [
+        asyncio.create_task(bot.export(update, mock_context)) for update in exports
+    ]
+
+    async def exports_started():
+        while started < EXPORT_WORKERS:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(exports_started(), timeout=5)
+
+    balance = update_for(telegram_ids[-1])
+    await asyncio.wait_for(bot.balance(balance, mock_context), timeout=5)
+    assert balance.message.reply_text.call_args.args[0] != ERROR_GENERAL
+
+    release.set()
+    await asyncio.gather(*tasks)
+    for update in exports:
+        update.message.reply_text.assert_called_once_with(EXPORT_EMPTY)
+
+    user_id_cache.clear()
+    category_registry.invalidate()
+    for engine in (write_engine, read_engine, export_engine):
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_stats_fit_single_read_connection(
+    bot, mock_context, db_url, monkeypatch
+):
+    """/stats с обновлением реестра держит не больше одного соединения чтения"""
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import (
+        AsyncSession,
+        async_sessionmaker,
+        create_async_engine,
+    )
+
+    from src.categories import category_registry
+    from src.database import (
+        configure_sqlite,
+        read_engine_options,
+        routing_session_class,
+        to_async_url,
+    )
+    from src.messages import ERROR_GENERAL
+    from src.users import get_or_create_user_id, user_id_cache
+
+    url = to_async_url(db_url)
+    write_engine = create_async_engine(url)
+    read_engine = create_async_engine(
+        url, **dict(read_engine_options(url, pool_size=1), pool_timeout=1)
+    )
+    for engine in (write_engine, read_engine):
+        configure_sqlite(engine)
+    sessions = async_sessionmaker(
+        class_=AsyncSession,
+        sync_session_class=routing_session_class(write_engine, read_engine),
+        expire_on_commit=False,
+    )
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", sessions)
+    # Реестр обновляется через тот же пул чтения; блокировка реестра
+    # привязывается к циклу событий, поэтому у теста своя
+    ensure_loaded = category_registry.ensure_loaded
+    monkeypatch.setattr(category_registry, "_lock", asyncio.Lock())
+    monkeypatch.setattr(
+        category_registry, "ensure_loaded", lambda: ensure_loaded(sessions)
+    )
+    user_id_cache.clear()
+
+    async with sessions() as db:
+        for telegram_id in (1, 2):
+            await get_or_create_user_id(db, telegram_id)
+        await db.commit()
+
+    def update_for(telegram_id):
+        update = MagicMock(spec=Update)
+        update.effective_user = MagicMock(spec=User)
+        update.effective_user.id = telegram_id
+        update.message = MagicMock(spec=Message)
+        update.message.reply_text = AsyncMock()
+        return update
+
+    updates = [update_for(telegram_id) for telegram_id in (1, 2)]
+    mock_context.args = []
+    category_registry.invalidate()
+    await asyncio.gather(*(bot.stats(update, mock_context) for update in updates))
+
+    for update in updates:
+        assert update.message.reply_text.call_args.args[0] != ERROR_GENERAL
+
+    user_id_cache.clear()
+    category_registry.invalidate()
+    for engine in (write_engine, read_engine):
+        await engine.dispose()
@@ -0,0 +1,114 @@
+import pytest
+
+from src.categorization import CategorizationEngine
+from src.categories import CategoryRegistry, parse_keywords
+from src.messages import CATEGORY_DEFAULT
+from src.models import Category
+
+
+@pytest.mark.asyncio
+async def test_registry_lookups(async_session_factory):
+    registry = CategoryRegistry()
+    await registry.ensure_loaded(async_session_factory)
+
+    category_id = registry.get_id("Транспорт")
+    assert registry.get_name(category_id) == "Транспорт"
+    assert registry.find("транспорт") == category_id
+    assert "Без категории" in dict(registry.all()).values()
+    assert not registry.is_stale
+
+
+@pytest.fixture
+def category_registry():
+    """Общий реестр; после теста помечается устаревшим, т.к. загружен из временной БД"""
+    from src.categories import category_registry
+
+    yield category_registry
+    category_registry.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_registry_invalidated_on_commit(async_session_factory, category_registry):
+    await category_registry.ensure_loaded(async_session_factory)
+    version = category_registry.version
+
+    async with async_session_factory() as db:
+        category_id = await category_registry.get_or_create(db, "Питомцы")
+        assert not category_registry.is_stale
+        await db.commit()
+
+    assert category_registry.version == version + 1
+    await category_registry.ensure_loaded(async_session_factory)
+    assert category_registry.get_id("Питомцы") == category_id
+
+    async with async_session_factory() as db:
+        category = await db.get(Category, category_id)
+        category.name = "Животные"
+        await db.commit()
+
+    await category_registry.ensure_loaded(async_session_factory)
+    assert category_registry.get_name(category_id) == "Животные"
+
+
+def test_parse_keywords():
+    assert parse_keywords(None) == []
+    assert parse_keywords(" корм,  ветеринар;\nзоомагазин, ") == [
+        "корм",
+        "ветеринар",
+        "зоомагазин",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_categorizer_reloads_db_keywords(
+    async_session_factory, category_registry
+):
+    engine = CategorizationEngine(
+        {"Продукты": ["корм", "магазин"]}, registry=category_registry
+    )
+    await category_registry.ensure_loaded(async_session_factory)
+    assert engine.categorize("корм для кота") == "Продукты"
+    assert engine.categorize("ветеринар") == CATEGORY_DEFAULT
+    matcher = engine.matcher
+
+    async with async_session_factory() as db:
+        db.add(Category(name="Питомцы", keywords="ветеринар, зоомагазин, корм"))
+        await db.commit()
+    # До перечитывания реестра правила прежние, автомат не пересобирается
+    assert engine.matcher is matcher
+
+    await category_registry.ensure_loaded(async_session_factory)
+    assert engine.categorize("Ветеринару") == "Питомцы"
+    assert engine.categorize("в зоомагазине") == "Питомцы"
+    # Встроенная таблица идет первой: её "корм" выигрывает
+    assert engine.categorize("корм") == "Продукты"
+    assert engine.matcher is engine.matcher
+
+
+@pytest.mark.asyncio
+async def test_registry_sees_changes_made_outside_the_bot(async_session_factory):
+    from sqlalchemy import update
+
+    registry = CategoryRegistry(refresh_interval=0)
+    engine = CategorizationEngine({}, registry=registry)
+    await registry.ensure_loaded(async_session_factory)
+    version = registry.loaded_version
+    # Сверка без изменений не меняет версию и не пересобирает автомат
+    matcher = engine.matcher
+    await registry.ensure_loaded(async_session_factory)
+    assert registry.loaded_version == version
+    assert engine.matcher is matcher
+
+    # Правка SQL-запросом, минуя ORM-события (как миграция или другой процесс)
+    async with async_session_factory() as db:
+        await db.execute(
+            update(Category)
+            .where(Category.name == "Транспорт")
+            .values(keywords="самокат")
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    await registry.ensure_loaded(async_session_factory)
+    assert registry.loaded_version > version
+    assert engine.categorize("аренда самоката") == "Транспорт"
@@ -0,0 +1,106 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import select
+
+from src import aggregates
+from src.bot import FinanceBot
+from src.categories import category_registry
+from src.category_model import UserModel, category_models, tokenize
+from src.models import Transaction, TransactionType, UserCategoryToken
+from src.users import get_or_create_user_id, user_id_cache
+
+
+def test_tokenize_skips_numbers_repeats_and_function_words():
+    assert tokenize("Кофе, кофе и 2 круассана!") == ["коф", "круасса"]
+    assert tokenize("такси до работы после обеда") == ["такс", "работ", "обед"]
+    assert tokenize(None) == []
+
+
+def test_user_model_learns_and_predicts():
+    model = UserModel([("коф", 1, 2)])
+    assert model.predict(["коф", "зерн"]) == 1
+
+    model.learn(["коф", "подарок"], 5)
+    # 2 голоса против 1: отрыва не хватает, решают общие правила
+    assert model.predict(["коф"]) is None
+    for _ in range(3):
+        model.learn(["коф"], 5)
+    # 4 исправления в категорию 5 против 2 в категорию 1
+    assert model.predict(["коф"]) == 5
+    assert model.predict(["коф", "подарок"], min_votes=5) is None
+    assert model.predict(["ча"]) is None
+
+
+def test_single_correction_does_not_override_rules():
+    model = UserModel()
+    model.learn(tokenize("подарок на день рождения"), 7)
+    model.learn(tokenize("такси до работы"), 42)
+
+    # Общие предлоги не голосуют, одного исправления мало
+    assert model.predict(tokenize("кофе на вокзале")) is None
+    assert model.predict(tokenize("шоколадки до обеда")) is None
+    assert model.predict(tokenize("такси домой")) is None
+
+    model.learn(tokenize("такси в аэропорт"), 42)
+    assert model.predict(tokenize("такси домой")) == 42
+
+
+@pytest.fixture
+def shared_caches():
+    """Общие кэши заполняются из временной БД, после теста сбрасываются"""
+    yield
+    category_models.clear()
+    category_registry.invalidate()
+    user_id_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_correction_teaches_user_model(
+    async_session_factory, monkeypatch, shared_caches
+):
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", async_session_factory)
+    await category_registry.ensure_loaded(async_session_factory)
+    gifts = category_registry.get_id("Подарки")
+    bot = FinanceBot()
+
+    async with async_session_factory() as db:
+        user_id, _ = await get_or_create_user_id(db, 555)
+        await category_models.ensure_loaded(db, user_id)
+        transactions = [
+            Transaction(
+                user_id=user_id,
+                amount=300,
+                description=description,
+                type=TransactionType.EXPENSE,
+                category_id=category_registry.get_id("Продукты"),
+                created_at=datetime.now(),
+            )
+            for description in ("кофе в зернах", "кофе с собой")
+        ]
+        db.add_all(transactions)
+        await aggregates.record_transactions(db, transactions)
+        await db.commit()
+    assert bot.determine_category("кофе", user_id) == "Продукты"
+
+    query = MagicMock()
+    query.edit_message_text = AsyncMock()
+    await bot.set_category_for_transaction(query, gifts, transactions[0].id)
+    # Одного исправления мало, чтобы перебить общие правила
+    assert bot.determine_category("Кофе для мамы", user_id) == "Продукты"
+    await bot.set_category_for_transaction(query, gifts, transactions[1].id)
+
+    # Модель в кэше обновлена сразу, в БД — счетчики по словам описаний
+    assert bot.determine_category("Кофе для мамы", user_id) == "Подарки"
+    assert bot.determine_category("кофе") == "Продукты"
+    async with async_session_factory() as db:
+        rows = (await db.execute(select(UserCategoryToken))).scalars().all()
+        assert {(r.token, r.category_id, r.count) for r in rows} == {
+            ("коф", gifts, 2),
+            ("зерн", gifts, 1),
+        }
+
+        category_models.clear()
+        await bot.categorizer.ensure_loaded(db, user_id)
+    assert bot.determine_category("кофе", user_id) == "Подарки"
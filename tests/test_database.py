@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.database import (
+    READ,
+    WRITE,
+    configure_read_only,
+    configure_sqlite,
+    count_queries,
+    db_role,
+    read_engine_options,
+    routing_session_class,
+    to_async_url,
+    track_queries,
+)
+from src.models import User
+
+
+def test_pragmas_applied_on_connect(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/wal.db")
+    configure_sqlite(engine, {"journal_mode": "WAL", "busy_timeout": 1234})
+
+    with engine.connect() as conn:
+        assert conn.scalar(text("PRAGMA journal_mode")) == "wal"
+        assert conn.scalar(text("PRAGMA busy_timeout")) == 1234
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_pragmas_applied_to_async_engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/wal.db")
+    configure_sqlite(engine, {"synchronous": "NORMAL", "cache_size": ""})
+
+    async with engine.connect() as conn:
+        # NORMAL = 1; пустое значение оставляет PRAGMA по умолчанию
+        assert await conn.scalar(text("PRAGMA synchronous")) == 1
+        assert await conn.scalar(text("PRAGMA cache_size")) == -2000
+    await engine.dispose()
+
+
+def test_rejects_unsafe_pragma_value(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/wal.db")
+    with pytest.raises(ValueError):
+        configure_sqlite(engine, {"journal_mode": "WAL; DROP TABLE users"})
+
+
+@pytest.mark.asyncio
+async def test_count_queries_in_async_context(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/count.db")
+    track_queries(engine)
+
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        with count_queries() as counter:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        await conn.execute(text("SELECT 3"))
+    await engine.dispose()
+
+    assert counter.count == 2
+
+
+@pytest.mark.asyncio
+async def test_read_role_uses_snapshot_engine(db_url):
+    """Чтение с меткой READ идет в движок чтения и видит один снимок"""
+    write_engine = create_async_engine(to_async_url(db_url))
+    read_engine = create_async_engine(
+        to_async_url(db_url), **read_engine_options(to_async_url(db_url))
+    )
+    configure_sqlite(write_engine)
+    configure_sqlite(read_engine)
+    configure_read_only(read_engine)
+    factory = async_sessionmaker(
+        sync_session_class=routing_session_class(write_engine, read_engine),
+        expire_on_commit=False,
+    )
+    count_users = select(func.count(User.id))
+
+    with db_role(READ):
+        async with factory() as reader:
+            assert reader.get_bind() is read_engine.sync_engine
+            assert await reader.scalar(count_users) == 0
+
+            # Запись из обработчика-читателя уходит в движок записи
+            reader.add(User(telegram_id=1))
+            await reader.commit()
+
+            async with factory() as writer:
+                with db_role(WRITE):
+                    writer.add(User(telegram_id=2))
+                    await writer.commit()
+
+            # Новая транзакция чтения видит обе записи, а открытая — только
+            # свой снимок
+            assert await reader.scalar(count_users) == 2
+            async with factory() as other:
+                assert await other.scalar(count_users) == 2
+                async with factory() as writer:
+                    with db_role(WRITE):
+                        writer.add(User(telegram_id=3))
+                        await writer.commit()
+                assert await other.scalar(count_users) == 2
+
+    await write_engine.dispose()
+    await read_engine.dispose()
@@ -0,0 +1,207 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from openpyxl import load_workbook
+
+from src import aggregates, archive, export
+from src.categories import category_registry
+from src.messages import (
+    CATEGORY_DEFAULT,
+    EXPORT_HEADERS,
+    EXPORT_SHEET_TITLE,
+    EXPORT_TRANSACTION_TYPE_EXPENSE,
+    EXPORT_TRANSACTION_TYPE_INCOME,
+)
+from src.models import Transaction, TransactionType, User
+
+EXPENSE, INCOME = TransactionType.EXPENSE, TransactionType.INCOME
+
+
+def _archived(id, created_at, amount=10, description="архив"):
+    return archive.ArchivedTransaction(
+        id=id,
+        user_id=1,
+        created_at=created_at,
+        amount=amount,
+        description=description,
+        type=EXPENSE,
+        category_id=None,
+    )
+
+
+def test_stream_merge_matches_merge():
+    now = datetime(2026, 3, 1)
+    hot = [_archived(i, now - timedelta(hours=2 * i)) for i in range(10)]
+    archived = [
+        _archived(100 + i, now - timedelta(hours=2 * i + 1)) for i in range(-2, 14)
+    ]
+    # Строка в БД и ее копия в архиве (архивирование не завершилось)
+    archived.append(hot[4]._replace(description="старая версия"))
+    archived.sort(key=lambda row: row.created_at, reverse=True)
+    months = [archived[:5], [], archived[5:12], archived[12:]]
+    read = []
+
+    def read_months():
+        for month in months:
+            read.append(len(month))
+            yield month
+
+    merged = archive.StreamMerge(read_months())
+    rows = list(merged.feed(hot[:2]))
+    # Архив читается по мере надобности
+    assert read == [5]
+    rows.extend(
+        row for start in range(2, 10, 3) for row in merged.feed(hot[start : start + 3])
+    )
+    rows.extend(merged.finish())
+
+    assert rows == archive.merge(hot, archived)
+    assert hot[4] in rows
+
+
+def test_amount_width_matches_written_format():
+    widths = export.column_widths(export.Bounds(2, -123456.25, 1e16, None), [])
+    assert widths[2] == len("10000000000000000.00") + export.WIDTH_PADDING
+    widths = export.column_widths(export.Bounds(2, -123456.25, 5, None), [])
+    assert widths[2] == len("-123456.25") + export.WIDTH_PADDING
+
+
+@pytest.mark.asyncio
+async def test_export_writes_styled_workbook(
+    async_session_factory, tmp_path, monkeypatch
+):
+    await category_registry.ensure_loaded(async_session_factory)
+    categories = dict(category_registry.all())
+    threads = set()
+    append = export.TransactionSheet.append
+
+    def recording_append(sheet, transactions):
+        threads.add(threading.current_thread().name)
+        append(sheet, transactions)
+
+    monkeypatch.setattr(export.TransactionSheet, "append", recording_append)
+    now = datetime(2026, 3, 10, 12, 0)
+    long_description = "очень длинное описание покупки " * 3
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.flush()
+        transactions = [
+            Transaction(
+                user_id=user.id,
+                amount=100 * (i + 1),
+                description=f"операция {i}",
+                type=EXPENSE if i % 2 else INCOME,
+                category_id=None,
+                created_at=now - timedelta(days=i),
+            )
+            for i in range(5)
+        ]
+        transactions[2].description = long_description
+        transactions[3].category_id = category_registry.get_id("Транспорт")
+        db.add_all(transactions)
+        await aggregates.record_transactions(db, transactions)
+        await db.commit()
+        user_id = user.id
+
+    store = archive.TransactionArchive(tmp_path / "archive")
+    old = archive.ArchivedTransaction(
+        id=1000,
+        user_id=user_id,
+        created_at=now - timedelta(days=400),
+        amount=123456.5,
+        description=None,
+        type=EXPENSE,
+        category_id=None,
+    )
+    store.append([old])
+    store.raise_watermark(now - timedelta(days=300))
+    path = tmp_path / "export.xlsx"
+
+    async with async_session_factory() as db:
+        count = await export.export_transactions(
+            db, user_id, path, categories, chunk_size=2, store=store
+        )
+
+    assert count == 6
+    # Книга заполняется вне цикла событий
+    assert {name.split("_")[0] for name in threads} == {"export"}
+    sheet = load_workbook(path)[EXPORT_SHEET_TITLE]
+    rows = [[cell.value for cell in row] for row in sheet.iter_rows()]
+    assert rows[0] == EXPORT_HEADERS
+    assert rows[1] == [
+        "10.03.2026 12:00",
+        EXPORT_TRANSACTION_TYPE_INCOME,
+        100,
+        "операция 0",
+        CATEGORY_DEFAULT,
+    ]
+    assert rows[2][1] == EXPORT_TRANSACTION_TYPE_EXPENSE
+    assert rows[4][4] == "Транспорт"
+    assert rows[-1] == [
+        old.created_at.strftime(export.DATE_FORMAT),
+        EXPORT_TRANSACTION_TYPE_EXPENSE,
+        123456.5,
+        None,
+        CATEGORY_DEFAULT,
+    ]
+
+    assert sheet["A1"].font.bold and sheet["A1"].border.left.style == "thin"
+    assert sheet["C2"].font.color.rgb.endswith("008000")
+    assert sheet["C3"].font.color.rgb.endswith("FF0000")
+    assert sheet["C3"].number_format == export.AMOUNT_FORMAT
+    assert sheet["E7"].border.bottom.style == "thin"
+    assert sheet.column_dimensions["D"].width == len(long_description) + 2
+    assert sheet.column_dimensions["C"].width == len("123456.50") + 2
+
+    async with async_session_factory() as db:
+        assert (
+            await export.export_transactions(
+                db, user_id + 1, path, categories, store=store
+            )
+            == 0
+        )
+    category_registry.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_pool_joins_running_export_and_limits_concurrency():
+    pool = export.ExportPool(max_concurrent=1)
+    started = []
+    release = asyncio.Event()
+
+    def writer(user_id):
+        async def write(path):
+            started.append(user_id)
+            await release.wait()
+            path.write_bytes(b"xlsx")
+            return user_id
+
+        return write
+
+    async def request(user_id):
+        async with pool.export(user_id, writer(user_id)) as (count, path):
+            return count, path.read_bytes(), path
+
+    tasks = [asyncio.create_task(request(user_id)) for user_id in (1, 1, 2)]
+    while pool.queued < 1:
+        await asyncio.sleep(0)
+
+    # Второй запрос пользователя 1 ждет ту же выгрузку, пользователь 2 — очередь
+    assert started == [1]
+    assert pool.status() == {"running": 1, "queued": 1, "joined": 1}
+
+    release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert started == [1, 2]
+    assert [result[:2] for result in results] == [
+        (1, b"xlsx"),
+        (1, b"xlsx"),
+        (2, b"xlsx"),
+    ]
+    assert results[0][2] == results[1][2]
+    assert not any(result[2].exists() for result in results)
+    assert pool.status() == {"running": 0, "queued": 0, "joined": 1}
@@ -0,0 +1,53 @@
+from src.keyword_matcher import KeywordMatcher
+from src.stemmer import stem_tokens
+
+
+def test_matches_overlapping_keywords_in_one_pass():
+    matcher = KeywordMatcher(
+        [("he", "a", 0), ("she", "b", 0), ("his", "c", 0), ("hers", "d", 0)]
+    )
+
+    assert sorted(matcher.matches("USHERS")) == [
+        (1, "she", "b"),
+        (2, "he", "a"),
+        (2, "hers", "d"),
+    ]
+    assert matcher.matches("xyz") == []
+
+
+def test_best_prefers_priority_then_table_order():
+    table = {
+        "Продукты": ["шоколадки", "магазин"],
+        "Одежда": ["магазин", "куртка"],
+        "Подарки": ["шоколадки", "8 марта"],
+    }
+    matcher = KeywordMatcher.from_table(table, {"8 Марта": 10})
+
+    assert matcher.best("Магазин у дома") == "Продукты"
+    assert matcher.best("куртка из магазина") == "Продукты"
+    assert matcher.best("шоколадки на 8 марта") == "Подарки"
+    assert matcher.best("на 8 марта") == "Подарки"
+    assert matcher.best("зарплата") is None
+
+
+def test_keyword_inside_longer_keyword():
+    # "тро" находится через ссылку неудачи из ветки "метрополитен"
+    matcher = KeywordMatcher([("метрополитен", "Транспорт", 0), ("тро", "Другое", 0)])
+
+    assert matcher.best("метро") == "Другое"
+    assert matcher.best("метрополитен") == "Транспорт"
+    assert [m[1] for m in matcher.matches("метрополитен")] == ["тро", "метрополитен"]
+
+
+def test_stem_normalization_matches_word_forms_and_phrases():
+    table = {"Связь": ["симка"], "Продукты": ["вкусно и точка"], "Жилье": ["квартира"]}
+    matcher = KeywordMatcher.from_table(table, normalize=stem_tokens)
+
+    assert matcher.best("за симку") == "Связь"
+    assert matcher.best("аренда квартиры") == "Жилье"
+    assert matcher.matches("обед во Вкусно и точка") == [
+        (2, "вкусно и точка", "Продукты")
+    ]
+    # Совпадают только целые слова
+    assert matcher.best("точка") is None
+    assert matcher.best("квартирант") is None
@@ -0,0 +1,21 @@
+from unittest.mock import MagicMock
+
+from src import middleware
+
+
+def test_pool_status_is_logged_once_per_interval(monkeypatch):
+    logger = MagicMock()
+    monkeypatch.setattr(middleware, "metrics_logger", logger)
+    clock = iter([100.0, 110.0, 161.0])
+    monkeypatch.setattr(middleware.time, "monotonic", lambda: next(clock))
+    metrics = middleware.MetricsMiddleware(pool_status_interval=60)
+
+    metrics._log_pool_status()
+    logged = logger.info.call_count
+    metrics._log_pool_status()  # через 10 с — пропускается
+    assert logger.info.call_count == logged
+    metrics._log_pool_status()
+    assert logger.info.call_count == 2 * logged
+    assert any(
+        call.args[0].startswith("Export pool") for call in logger.info.call_args_list
+    )
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+from enum import Enum
+
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+import pytest
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from src.init_db import upgrade_db
+from src.migrate_users import run_user_migration
+from src.models import Base, Transaction, TransactionType, User
+
+
+def explain(connection, stmt) -> str:
+    """Возвращает план запроса SQLite (EXPLAIN QUERY PLAN) одной строкой"""
+    if connection.dialect.name != "sqlite":
+        pytest.skip("Проверка плана написана для SQLite")
+    compiled = stmt.compile(dialect=connection.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        params.append(value.name if isinstance(value, Enum) else value)
+    rows = connection.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {compiled}", tuple(params)
+    ).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_migrations_match_models(db_engine):
+    """Схема после миграций совпадает с моделями"""
+    with db_engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+    assert diff == []
+
+
+def test_upgrade_stamps_legacy_database(tmp_path):
+    """База, созданная через create_all, обновляется без потери данных"""
+    url = f"sqlite:///{tmp_path}/legacy.db"
+    engine = create_engine(url)
+    legacy = Base.metadata.tables
+    legacy["users"].create(engine)
+    legacy["categories"].create(engine)
+    transactions = legacy["transactions"]
+    indexes = set(transactions.indexes)
+    transactions.indexes.clear()
+    try:
+        transactions.create(engine)
+    finally:
+        transactions.indexes.update(indexes)
+    # Колонки из поздних миграций в старой схеме не было
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE transactions DROP COLUMN fingerprint"))
+
+    upgrade_db(url)
+
+    index_names = {ix["name"] for ix in inspect(engine).get_indexes("transactions")}
+    assert "ix_transactions_user_created" in index_names
+    engine.dispose()
+
+
+def test_fingerprint_backfill_matches_model(tmp_path):
+    """Миграция 0008 считает отпечатки старых операций так же, как модель"""
+    from alembic import command
+
+    from src.init_db import get_alembic_config
+    from src.models import transaction_fingerprint
+
+    url = f"sqlite:///{tmp_path}/fingerprints.db"
+    command.upgrade(get_alembic_config(url), "0007")
+    engine = create_engine(url)
+    created_at = datetime(2026, 3, 8, 12, 30)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO users (telegram_id) VALUES (1)"))
+        connection.execute(
+            text(
+                "INSERT INTO transactions (user_id, amount, description, type, "
+                "created_at) VALUES (1, 199.9, ' Цветы  маме', 'EXPENSE', :at)"
+            ),
+            {"at": created_at},
+        )
+
+    upgrade_db(url)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(Transaction.fingerprint)) == (
+            transaction_fingerprint(
+                created_at, TransactionType.EXPENSE, 199.9, "цветы маме"
+            )
+        )
+    engine.dispose()
+
+
+def test_user_migration_drops_legacy_columns(db_engine):
+    with db_engine.begin() as connection:
+        connection.execute(text("ALTER TABLE users ADD COLUMN username VARCHAR"))
+        connection.execute(
+            text("INSERT INTO users (telegram_id, username) VALUES (7, 'old')")
+        )
+
+    run_user_migration(db_engine)
+
+    columns = {column["name"] for column in inspect(db_engine).get_columns("users")}
+    assert columns == {"id", "telegram_id", "created_at"}
+    with db_engine.connect() as connection:
+        assert connection.scalar(select(User.telegram_id)) == 7
+
+
+def test_history_query_uses_index(db_engine):
+    start_date = datetime.utcnow() - timedelta(days=365)
+    stmt = (
+        select(Transaction)
+        .where(Transaction.user_id == 1, Transaction.created_at >= start_date)
+        .order_by(Transaction.created_at.desc())
+    )
+    with db_engine.connect() as connection:
+        plan = explain(connection, stmt)
+    assert "USING INDEX ix_transactions_user_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_stats_query_uses_index(db_engine):
+    start_date = datetime.utcnow() - timedelta(days=30)
+    stmt = select(func.sum(Transaction.amount)).where(
+        Transaction.user_id == 1,
+        Transaction.type == TransactionType.EXPENSE,
+        Transaction.created_at >= start_date,
+    )
+    with db_engine.connect() as connection:
+        plan = explain(connection, stmt)
+    assert "ix_transactions_user_type_created" in plan
+
+
+def test_category_query_uses_index(db_engine):
+    stmt = (
+        select(Transaction)
+        .where(Transaction.user_id == 1, Transaction.category_id == 2)
+        .order_by(Transaction.created_at.desc())
+    )
+    with db_engine.connect() as connection:
+        plan = explain(connection, stmt)
+    assert "USING INDEX ix_transactions_user_category_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_export_query_uses_index(db_engine):
+    stmt = (
+        select(Transaction)
+        .where(Transaction.user_id == 1)
+        .order_by(Transaction.created_at.desc())
+    )
+    with db_engine.connect() as connection:
+        plan = explain(connection, stmt)
+    assert "USING INDEX ix_transactions_user_created" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import func, inspect, select, text
+
+from src.models import Transaction, TransactionType, User
+from src.online_migration import STATE_DONE, OnlineTableRebuild, online_migrations
+
+USERS = 250
+
+
+class Interrupted(Exception):
+    pass
+
+
+def seed_legacy_users(engine):
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE users ADD COLUMN username VARCHAR"))
+        connection.execute(
+            text("INSERT INTO users (telegram_id, username) VALUES (:t, :u)"),
+            [{"t": 1000 + i, "u": f"user{i}"} for i in range(USERS)],
+        )
+        connection.execute(
+            Transaction.__table__.insert().values(
+                user_id=1, amount=10, type=TransactionType.EXPENSE
+            )
+        )
+
+
+def users(engine):
+    with engine.connect() as connection:
+        return dict(connection.execute(select(User.id, User.telegram_id)).all())
+
+
+def test_rebuild_resumes_after_interruption(db_engine):
+    seed_legacy_users(db_engine)
+    before = users(db_engine)
+    batches = []
+
+    def crash(copied, total):
+        batches.append(copied)
+        raise Interrupted
+
+    rebuild = OnlineTableRebuild(db_engine, "test", User.__table__, 100, pause=0)
+    with pytest.raises(Interrupted):
+        rebuild.run(progress=crash)
+    assert batches == [100]
+
+    rebuild = OnlineTableRebuild(db_engine, "test", User.__table__, 100, pause=0)
+    assert rebuild.run() == USERS
+
+    columns = {column["name"] for column in inspect(db_engine).get_columns("users")}
+    assert columns == {"id", "telegram_id", "created_at"}
+    assert (
+        set(inspect(db_engine).get_table_names()) & {"_new_users", "_old_users"}
+        == set()
+    )
+    assert users(db_engine) == before
+    with db_engine.begin() as connection:
+        state = connection.execute(select(online_migrations)).one()
+        assert (state.state, state.copied) == (STATE_DONE, USERS)
+
+        # Внешний ключ транзакций указывает на новую таблицу, новые id
+        # продолжают старые
+        new_id = connection.execute(
+            User.__table__.insert().values(telegram_id=1).returning(User.id)
+        ).scalar()
+        assert new_id == USERS + 1
+        connection.execute(
+            Transaction.__table__.insert().values(
+                user_id=new_id, amount=5, type=TransactionType.INCOME
+            )
+        )
+        assert connection.scalar(select(func.count()).select_from(Transaction)) == 2
+
+
+def test_rebuild_keeps_concurrent_writes(db_engine):
+    seed_legacy_users(db_engine)
+
+    def write_during_copy(copied, total):
+        if copied != 100:
+            return
+        with db_engine.begin() as connection:
+            # Уже скопированные и еще не скопированные строки, новая строка
+            connection.execute(text("UPDATE users SET telegram_id = 1 WHERE id = 5"))
+            connection.execute(text("UPDATE users SET telegram_id = 2 WHERE id = 200"))
+            connection.execute(text("DELETE FROM users WHERE id IN (6, 201)"))
+            connection.execute(
+                text("INSERT INTO users (telegram_id, username) VALUES (3, 'new')")
+            )
+        expected.update(users(db_engine))
+
+    expected = {}
+    rebuild = OnlineTableRebuild(db_engine, "test", User.__table__, 100, pause=0)
+    rebuild.run(progress=write_during_copy)
+
+    assert users(db_engine) == expected
+    assert expected[5] == 1 and expected[200] == 2 and 6 not in expected
+    assert len(expected) == USERS - 1
@@ -0,0 +1,60 @@
+import pytest
+
+from src.messages import ERROR_INVALID_AMOUNT, ERROR_NO_DESCRIPTION
+from src.models import TransactionType
+from src.parser import ParseError, ParsedTransaction, parse_message
+
+EXPENSE, INCOME = TransactionType.EXPENSE, TransactionType.INCOME
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("-1,5 кофе", (EXPENSE, 1.5, "кофе")),
+        ("- 200 такси", (EXPENSE, 200, "такси")),
+        ("-100 РУБ. кофе", (EXPENSE, 100, "кофе")),
+        ("-500 рубашка", (EXPENSE, 500, "рубашка")),
+        ("-100 8 марта", (EXPENSE, 100, "8 марта")),
+        ("+1 000 000 премия", (INCOME, 1000000, "премия")),
+        ("+1 000 премия", (INCOME, 1000, "премия")),
+    ],
+)
+def test_parse_single_line(message, expected):
+    assert parse_message(message) == [ParsedTransaction(*expected)]
+
+
+def test_parse_multiline_message():
+    message = "-100 кофе\n-350 такси\n\n  +5000 зарплата  \n"
+    assert parse_message(message) == [
+        ParsedTransaction(EXPENSE, 100, "кофе"),
+        ParsedTransaction(EXPENSE, 350, "такси"),
+        ParsedTransaction(INCOME, 5000, "зарплата"),
+    ]
+
+
+def test_continuation_lines_extend_description():
+    message = "-100 кофе\nс друзьями\n\n-350 такси\n  до дома  \nночью"
+    assert parse_message(message) == [
+        ParsedTransaction(EXPENSE, 100, "кофе с друзьями"),
+        ParsedTransaction(EXPENSE, 350, "такси до дома ночью"),
+    ]
+
+
+@pytest.mark.parametrize("message", ["", "  ", "привет", "100 кофе", "кофе\n-100"])
+def test_not_a_transaction(message):
+    assert parse_message(message) == []
+
+
+@pytest.mark.parametrize(
+    "message, line, error",
+    [
+        ("-500", 1, ERROR_NO_DESCRIPTION),
+        ("-100 руб.", 1, ERROR_NO_DESCRIPTION),
+        ("-кофе", 1, ERROR_INVALID_AMOUNT),
+        ("-100 кофе\n+ зарплата", 2, ERROR_INVALID_AMOUNT),
+    ],
+)
+def test_parse_errors(message, line, error):
+    with pytest.raises(ParseError) as info:
+        parse_message(message)
+    assert (info.value.line, info.value.message) == (line, error)
@@ -0,0 +1,79 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+
+from src import aggregates, purge
+from src.models import Transaction, TransactionType, User
+
+
+@pytest.mark.asyncio
+async def test_purge_in_chunks_keeps_aggregates(async_session_factory):
+    now = datetime.now()
+    async with async_session_factory() as db:
+        users = [User(telegram_id=1), User(telegram_id=2)]
+        db.add_all(users)
+        await aggregates.apply_counter_delta(db, aggregates.COUNTER_USERS, 2)
+        await db.commit()
+
+        transactions = [
+            Transaction(
+                user_id=users[i % 2].id,
+                amount=10 * (i + 1),
+                type=TransactionType.EXPENSE if i % 3 else TransactionType.INCOME,
+                category_id=i % 4 or None,
+                created_at=now - timedelta(days=100 + i if i < 7 else i),
+            )
+            for i in range(10)
+        ]
+        db.add_all(transactions)
+        await aggregates.record_transactions(db, transactions)
+        await db.commit()
+
+    progress = []
+
+    async def report(deleted, total):
+        progress.append((deleted, total))
+
+    deleted = await purge.purge_before(
+        now - timedelta(days=90), async_session_factory, chunk_size=3, progress=report
+    )
+
+    assert deleted == 7
+    assert progress == [(3, 7), (6, 7), (7, 7)]
+    async with async_session_factory() as db:
+        assert await db.scalar(select(func.count(Transaction.id))) == 3
+        # Агрегаты совпадают с пересчетом по оставшимся транзакциям
+        assert await aggregates.reconcile(db) == {
+            "user_balances": 0,
+            "daily_rollups": 0,
+            "global_counters": 0,
+        }
+
+
+@pytest.mark.asyncio
+async def test_reclaim_space_after_purge(async_session_factory, db_url):
+    if not db_url.startswith("sqlite"):
+        pytest.skip("incremental_vacuum есть только в SQLite")
+
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+        db.add_all(
+            Transaction(
+                user_id=user.id,
+                amount=1,
+                description="x" * 500,
+                type=TransactionType.EXPENSE,
+                created_at=datetime(2020, 1, 1),
+            )
+            for _ in range(2000)
+        )
+        await db.commit()
+
+    await purge.purge_before(datetime(2021, 1, 1), async_session_factory)
+
+    assert await purge.reclaim_space(async_session_factory, pages_per_step=50) > 0
+    async with async_session_factory() as db:
+        assert await db.scalar(select(func.count()).select_from(Transaction)) == 0
+        assert await purge.reclaim_space(async_session_factory) == 0
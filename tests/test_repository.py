@@ -0,0 +1,47 @@
+import pytest
+from datetime import datetime, timedelta
+
+from src import repository
+from src.models import Transaction, TransactionType, User
+
+
+@pytest.mark.asyncio
+async def test_prebuilt_statements_take_parameters(async_session_factory):
+    now = datetime.now()
+    async with async_session_factory() as db:
+        users = [User(telegram_id=10), User(telegram_id=20)]
+        db.add_all(users)
+        await db.commit()
+        db.add_all(
+            Transaction(
+                user_id=users[i % 2].id,
+                amount=i,
+                type=TransactionType.EXPENSE,
+                category_id=1 + i % 3,
+                created_at=now - timedelta(days=i),
+            )
+            for i in range(12)
+        )
+        await db.commit()
+
+        assert await repository.user_id_by_telegram_id(db, 20) == users[1].id
+        assert await repository.user_id_by_telegram_id(db, 30) is None
+
+        rows = await repository.transactions_between(
+            db, users[0].id, now - timedelta(days=5), now + timedelta(seconds=1)
+        )
+        assert [row.amount for row in rows] == [0, 2, 4]
+
+        # LIMIT передается параметром и не меняет текст запроса
+        for limit in (1, 2):
+            rows = await repository.category_transactions(db, users[0].id, 1, limit)
+            assert [row.amount for row in rows] == [0, 6][:limit]
+
+        chunks = [
+            len(rows)
+            async for rows in repository.stream_user_transactions(db, users[1].id, 4)
+        ]
+        assert chunks == [4, 2]
+        bounds = await repository.user_transaction_bounds(db, users[1].id)
+        assert bounds.count == 6
+        assert await repository.category_id_by_name(db, "Транспорт") is not None
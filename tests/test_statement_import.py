@@ -0,0 +1,199 @@
+from datetime import datetime
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import func, select
+
+from src import aggregates
+from src.categories import category_registry
+from src.messages import CATEGORY_DEFAULT, EXPORT_HEADERS
+from src.models import Transaction, TransactionType, User, transaction_fingerprint
+from src.statement_import import (
+    StatementError,
+    StatementRow,
+    import_statement,
+    parse_amount,
+    parse_statement,
+    read_statement,
+)
+
+EXPENSE, INCOME = TransactionType.EXPENSE, TransactionType.INCOME
+
+BANK_CSV = (
+    "Выписка по счету 40817810000000000001\n"
+    "Период: 01.03.2026 - 31.03.2026\n"
+    "\n"
+    "Дата операции;Сумма операции;Назначение платежа\n"
+    "01.03.2026 09:15:00;-350,00;Такси до работы\n"
+    "02.03.2026;-1 234,50 руб.;Пятерочка\n"
+    "05.03.2026;+50 000;Зарплата\n"
+    ";;\n"
+    "Итого;48 415,50;\n"
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("-350,00", -350),
+        ("−1 234,50 руб.", -1234.5),
+        ("+50 000 RUB", 50000),
+        ("-10 ₽", -10),
+        (12.5, 12.5),
+    ],
+)
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-8-sig", "cp1251"])
+def test_csv_statement_with_preamble(tmp_path, encoding):
+    path = tmp_path / "statement.csv"
+    path.write_bytes(BANK_CSV.encode(encoding))
+
+    rows = list(parse_statement(read_statement(path)))
+
+    assert rows == [
+        StatementRow(
+            datetime(2026, 3, 1, 9, 15), EXPENSE, 350, "Такси до работы", None
+        ),
+        StatementRow(datetime(2026, 3, 2), EXPENSE, 1234.5, "Пятерочка", None),
+        StatementRow(datetime(2026, 3, 5), INCOME, 50000, "Зарплата", None),
+        None,  # строка итогов
+    ]
+
+
+def test_xlsx_in_export_format(tmp_path):
+    """Файл /export читается обратно: тип из колонки, суммы положительные"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(EXPORT_HEADERS)
+    sheet.append(["08.03.2026 12:30", "Расход", 700, "Цветы маме", "Подарки"])
+    sheet.append([datetime(2026, 3, 9), "Доход", 100.5, None, None])
+    path = tmp_path / "transactions.xlsx"
+    workbook.save(path)
+
+    assert list(parse_statement(read_statement(path))) == [
+        StatementRow(
+            datetime(2026, 3, 8, 12, 30), EXPENSE, 700, "Цветы маме", "Подарки"
+        ),
+        StatementRow(datetime(2026, 3, 9), INCOME, 100.5, None, None),
+    ]
+
+
+def test_unknown_files_are_rejected(tmp_path):
+    with pytest.raises(StatementError):
+        read_statement(tmp_path / "statement.pdf")
+    path = tmp_path / "notes.csv"
+    path.write_text("просто текст\nбез заголовка\n")
+    with pytest.raises(StatementError):
+        list(parse_statement(read_statement(path)))
+
+
+@pytest.mark.asyncio
+async def test_import_skips_duplicates_and_commits_in_batches(async_session_factory):
+    await category_registry.ensure_loaded(async_session_factory)
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.flush()
+        # Уже введенная вручную операция (в другое время того же дня)
+        existing = Transaction(
+            user_id=user.id,
+            amount=200,
+            description="Кофе",
+            type=EXPENSE,
+            created_at=datetime(2026, 3, 1, 8, 5),
+        )
+        db.add(existing)
+        await aggregates.record_transactions(db, [existing])
+        await db.commit()
+        user_id = user.id
+
+    coffee = StatementRow(datetime(2026, 3, 1), EXPENSE, 200, "кофе", None)
+    rows = [
+        coffee,
+        coffee,  # вторая такая же покупка в тот же день — не дубль
+        None,
+        StatementRow(datetime(2026, 3, 2), EXPENSE, 900, "такси", None),
+        StatementRow(datetime(2026, 3, 3), INCOME, 5000, "зарплата", "Подарки"),
+    ]
+    calls = []
+
+    async def progress(*counts):
+        calls.append(counts)
+
+    result = await import_statement(
+        user_id,
+        rows,
+        lambda description: CATEGORY_DEFAULT,
+        session_factory=async_session_factory,
+        batch_size=2,
+        progress=progress,
+    )
+
+    assert tuple(result) == (3, 1, 1)
+    assert calls == [(1, 1, 0), (2, 1, 1), (3, 1, 1)]
+    async with async_session_factory() as db:
+        assert await aggregates.get_balance(db, user_id) == (5000, 1300)
+        gift = await db.scalar(
+            select(Transaction.category_id).where(Transaction.type == INCOME)
+        )
+        assert category_registry.get_name(gift) == "Подарки"
+
+    # Повторный импорт той же выписки ничего не добавляет
+    again = await import_statement(
+        user_id,
+        rows,
+        lambda description: CATEGORY_DEFAULT,
+        session_factory=async_session_factory,
+    )
+    assert tuple(again) == (0, 4, 1)
+    async with async_session_factory() as db:
+        assert await db.scalar(select(func.count()).select_from(Transaction)) == 4
+        assert existing.id is not None
+        assert await db.scalar(
+            select(Transaction.fingerprint).where(Transaction.id == existing.id)
+        ) == transaction_fingerprint(coffee.created_at, EXPENSE, 200, "кофе")
+    category_registry.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_bot_imports_uploaded_statement(
+    async_session_factory, monkeypatch, tmp_path
+):
+    from unittest.mock import AsyncMock, MagicMock
+
+    from src.bot import FinanceBot
+    from src.category_model import category_models
+    from src.users import get_user_id, user_id_cache
+
+    monkeypatch.setattr("src.bot.AsyncSessionLocal", async_session_factory)
+    user_id_cache.clear()
+    category_registry.invalidate()
+
+    async def download_to_drive(path):
+        path.write_bytes(BANK_CSV.encode("cp1251"))
+
+    update = MagicMock()
+    update.effective_user.id = 777
+    update.message.document.file_name = "Выписка.CSV"
+    update.message.document.get_file = AsyncMock(
+        return_value=MagicMock(download_to_drive=download_to_drive)
+    )
+    progress = MagicMock(edit_text=AsyncMock())
+    update.message.reply_text = AsyncMock(return_value=progress)
+
+    await FinanceBot().import_statement(update, MagicMock())
+
+    assert progress.edit_text.call_args.args[0].startswith("📥 Импорт завершен")
+    async with async_session_factory() as db:
+        user_id = await get_user_id(db, 777)
+        assert await aggregates.get_balance(db, user_id) == (50000, 1584.5)
+        taxi = await db.scalar(
+            select(Transaction.category_id).where(Transaction.amount == 350)
+        )
+        assert category_registry.get_name(taxi) == "Транспорт"
+    user_id_cache.clear()
+    category_registry.invalidate()
+    category_models.clear()
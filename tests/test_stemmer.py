@@ -0,0 +1,46 @@
+import pytest
+
+from src.stemmer import keyword_forms, stem, stem_tokens
+
+
+@pytest.mark.parametrize(
+    "word, expected",
+    [
+        # Примеры из словаря эталонной реализации Snowball
+        ("важнейшие", "важн"),
+        ("вежливости", "вежлив"),
+        ("ведомостей", "ведом"),
+        ("взглядом", "взгляд"),
+        ("видевшие", "видевш"),
+        ("ответственность", "ответствен"),
+        ("ванной", "ван"),
+        # Формы ключевых слов бота
+        ("симка", "симк"),
+        ("симку", "симк"),
+        ("мытищи", "мытищ"),
+        ("мытищ", "мытищ"),
+        ("Ёлки", "елк"),
+        ("впн", "впн"),
+        ("vpn", "vpn"),
+    ],
+)
+def test_stem(word, expected):
+    assert stem(word) == expected
+
+
+def test_stem_tokens_splits_words():
+    assert stem_tokens("Шоколадки на 8 марта, мастер-класс") == (
+        "шоколадк",
+        "на",
+        "8",
+        "март",
+        "мастер",
+        "класс",
+    )
+
+
+def test_keyword_forms_cover_overstemmed_nouns():
+    forms = keyword_forms("Ресторан")
+    assert {stem(f) for f in forms} == {"рестора", "ресторан"}
+    assert keyword_forms("симка") == ("симка",)
+    assert keyword_forms("до мытищ") == ("до мытищ",)
@@ -0,0 +1,42 @@
+import pytest
+
+from src import aggregates
+from src.cache import LRUCache
+from src.users import get_or_create_user_id, get_user_id, user_id_cache
+
+
+def test_lru_cache_evicts_least_recent():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+@pytest.fixture
+def empty_user_cache():
+    """Кэш общий для процесса; id из временной БД не должны в нем остаться"""
+    user_id_cache.clear()
+    yield user_id_cache
+    user_id_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_known_user_skips_lookup(async_session_factory, empty_user_cache):
+    async with async_session_factory() as db:
+        assert await get_user_id(db, 42) is None
+        user_id, created = await get_or_create_user_id(db, 42)
+        assert created
+        counters = await aggregates.get_counters(db)
+        assert counters[aggregates.COUNTER_USERS] == 1
+
+    # Известный пользователь разрешается без обращения к сессии
+    db = object()
+    assert await get_user_id(db, 42) == user_id
+    assert await get_or_create_user_id(db, 42) == (user_id, False)
+    assert empty_user_cache.hits == 2
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from datetime import datetime
+
+from src import aggregates
+from src.models import TransactionType, User
+from src.write_pipeline import WriteBatcher
+
+
+async def create_user(async_session_factory):
+    async with async_session_factory() as db:
+        user = User(telegram_id=1)
+        db.add(user)
+        await db.commit()
+        return user.id
+
+
+def values(user_id, amount, transaction_type=TransactionType.EXPENSE):
+    return dict(
+        user_id=user_id,
+        amount=amount,
+        description="тест",
+        type=transaction_type,
+        created_at=datetime.now(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_one_commit(async_session_factory):
+    user_id = await create_user(async_session_factory)
+    batcher = WriteBatcher(async_session_factory, max_batch=50, max_delay=0.05)
+
+    transactions = await asyncio.gather(
+        *(batcher.add_transaction(**values(user_id, 10)) for _ in range(20))
+    )
+    await batcher.close()
+
+    assert batcher.batches == 1
+    assert len({transaction.id for transaction in transactions}) == 20
+    async with async_session_factory() as db:
+        assert await aggregates.get_balance(db, user_id) == (0, 200)
+
+
+@pytest.mark.asyncio
+@pytest.mark.filterwarnings("ignore::sqlalchemy.exc.SAWarning")
+async def test_failed_row_does_not_drop_batch(async_session_factory):
+    user_id = await create_user(async_session_factory)
+    batcher = WriteBatcher(async_session_factory, max_batch=50, max_delay=0.05)
+
+    results = await asyncio.gather(
+        batcher.add_transaction(**values(user_id, 100, TransactionType.INCOME)),
+        batcher.add_transaction(**values(user_id, 5, None)),
+        batcher.add_transaction(**values(user_id, 30)),
+        return_exceptions=True,
+    )
+    await batcher.close()
+
+    assert isinstance(results[1], Exception)
+    assert results[0].id and results[2].id
+    async with async_session_factory() as db:
+        assert await aggregates.get_balance(db, user_id) == (100, 30)
+
+
+@pytest.mark.asyncio
+@pytest.mark.filterwarnings("ignore::sqlalchemy.exc.SAWarning")
+async def test_group_is_written_atomically(async_session_factory):
+    user_id = await create_user(async_session_factory)
+    batcher = WriteBatcher(async_session_factory, max_batch=50, max_delay=0.05)
+
+    results = await asyncio.gather(
+        batcher.add_transactions(
+            [values(user_id, 100, TransactionType.INCOME), values(user_id, 5, None)]
+        ),
+        batcher.add_transactions([values(user_id, 30), values(user_id, 20)]),
+        return_exceptions=True,
+    )
+    await batcher.close()
+
+    # Ошибка в одной строке отменяет всю её группу, но не соседнюю
+    assert isinstance(results[0], Exception)
+    assert [transaction.amount for transaction in results[1]] == [30, 20]
+    async with async_session_factory() as db:
+        assert await aggregates.get_balance(db, user_id) == (0, 50)